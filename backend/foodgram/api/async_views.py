@@ -0,0 +1,343 @@
+import asyncio
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from django.core.paginator import InvalidPage, Page, Paginator
+from django.db import close_old_connections
+from django.http import Http404, HttpResponse
+from django.utils.cache import get_conditional_response
+from recipes.models import Ingredient, Tag
+from rest_framework import exceptions
+from rest_framework.request import Request
+from rest_framework.settings import api_settings
+from rest_framework.views import exception_handler
+
+from .cache import (content_key, get_cache, get_validators, get_version,
+                    set_validators)
+from .membership import KINDS, get_member_ids
+from .replica import is_pinned, route_reads, routing_scope
+from .search import get_index
+from .serializers import (IngredientSerializer, SubscribeSerializer,
+                          TagSerializer)
+from .views import CustomUserViewSet, RecipeViewSet
+
+JSON = "application/json"
+
+
+def call(function, *args, **kwargs):
+    close_old_connections()
+    try:
+        return function(*args, **kwargs)
+    finally:
+        close_old_connections()
+
+
+def run(function, *args, **kwargs):
+    """
+    Синхронный вызов (ORM, кэш, хранилище) в пуле потоков.
+
+    В отличие от thread_sensitive-режима, вызовы не ждут друг друга в
+    одном потоке, поэтому независимые запросы в БД идут параллельно,
+    каждый в своем соединении.
+    """
+    return sync_to_async(call, thread_sensitive=False)(
+        function, *args, **kwargs
+    )
+
+
+def get_renderer():
+    return api_settings.DEFAULT_RENDERER_CLASSES[0]()
+
+
+def accepts_json(request):
+    """Ответ в JSON без ?format= и согласования: иначе синхронный путь."""
+    accept = request.headers.get("Accept", "*/*")
+    return "format" not in request.GET and any(
+        media.split(";")[0].strip() in ("*/*", "application/*", JSON)
+        for media in accept.split(",")
+    )
+
+
+def render(data, status=200):
+    response = HttpResponse(
+        get_renderer().render(data), status=status, content_type=JSON
+    )
+    response["Vary"] = "Accept"
+    return response
+
+
+def handle_errors(view):
+    """Ошибки API в том же виде, что и у синхронных вьюсетов DRF."""
+
+    @wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        try:
+            return await view(request, *args, **kwargs)
+        except (exceptions.APIException, Http404) as exc:
+            response = exception_handler(exc, {"request": request})
+            rendered = render(response.data, response.status_code)
+            for header, value in response.items():
+                if header != "Content-Type":
+                    rendered[header] = value
+            if isinstance(exc, (exceptions.NotAuthenticated,
+                                exceptions.AuthenticationFailed)):
+                authenticator = api_settings.DEFAULT_AUTHENTICATION_CLASSES[0]
+                rendered["WWW-Authenticate"] = (
+                    authenticator().authenticate_header(request)
+                )
+            return rendered
+
+    return wrapper
+
+
+def read_view(async_view, sync_view):
+    """
+    Вьюха, отдающая GET асинхронной реализации, остальное — DRF.
+
+    Асинхронная реализация может вернуть None, тогда запрос тоже
+    обрабатывается синхронным вьюсетом (курсорная пагинация, другие
+    форматы ответа).
+    """
+    sync_view = sync_to_async(sync_view)
+    async_view = handle_errors(async_view)
+
+    async def view(request, *args, **kwargs):
+        if request.method == "GET" and accepts_json(request):
+            with routing_scope():
+                response = await async_view(request, *args, **kwargs)
+            if response is not None:
+                return response
+        return await sync_view(request, *args, **kwargs)
+
+    # csrf_exempt в Django 3.2 оборачивает корутину в синхронную функцию.
+    view.csrf_exempt = True
+    return view
+
+
+def authenticate_request(request):
+    """Пользователь по классам аутентификации DRF из настроек."""
+    drf_request = Request(request)
+    for authenticator in api_settings.DEFAULT_AUTHENTICATION_CLASSES:
+        result = authenticator().authenticate(drf_request)
+        if result is not None:
+            return result[0]
+    return AnonymousUser()
+
+
+async def get_request(request):
+    """Request DRF с уже определенным пользователем."""
+    drf_request = Request(request)
+    drf_request.user = await run(authenticate_request, request)
+    if not await run(is_pinned, drf_request):
+        route_reads()
+    return drf_request
+
+
+def get_view(viewset, request, action, **kwargs):
+    """Экземпляр вьюсета для фильтров, queryset и контекста."""
+    return viewset(request=request, args=(), kwargs=kwargs,
+                   format_kwarg=None, action=action)
+
+
+def get_page_number(paginator, request):
+    number = request.query_params.get(paginator.page_query_param, 1)
+    try:
+        number = int(number)
+        if number < 1:
+            raise ValueError
+    except ValueError:
+        raise exceptions.NotFound(paginator.invalid_page_message.format(
+            page_number=number, message="",
+        ))
+    return number
+
+
+async def paginate(view, request, queryset, *calls):
+    """
+    Страница queryset и вызовы calls (функция, аргументы...), все
+    запросы параллельно.
+
+    Строки страницы и COUNT(*) выбираются одновременно. Формат ответа
+    тот же, что у пагинатора вьюсета; без ?limit= (page_size не задан)
+    возвращается весь список. Результат — (строки, пагинатор,
+    результаты calls).
+    """
+    paginator = view.pagination_class()
+    page_size = paginator.get_page_size(request)
+    if page_size is None:
+        rows, *results = await asyncio.gather(
+            run(list, queryset), *(run(*call) for call in calls)
+        )
+        return rows, None, results
+    number = get_page_number(paginator, request)
+    offset = (number - 1) * page_size
+    rows, count, *results = await asyncio.gather(
+        run(list, queryset[offset:offset + page_size]),
+        run(queryset.count),
+        *(run(*call) for call in calls),
+    )
+    pages = Paginator((), page_size)
+    pages.count = count
+    try:
+        pages.validate_number(number)
+    except InvalidPage as exc:
+        raise exceptions.NotFound(paginator.invalid_page_message.format(
+            page_number=number, message=str(exc),
+        ))
+    paginator.request = request
+    paginator.page = Page(rows, number, pages)
+    return rows, paginator, results
+
+
+def member_calls(user):
+    if user.is_anonymous:
+        return []
+    return [(get_member_ids, user, kind) for kind in KINDS]
+
+
+def member_context(context, user, results):
+    """Кэш членства в контексте сериализатора (см. MembershipMixin)."""
+    if not user.is_anonymous:
+        for kind, ids in zip(KINDS, results):
+            context[f"member_ids_{kind}"] = ids
+    return context
+
+
+async def serialize(serializer, paginator=None):
+    """Данные сериализатора (ссылки на превью проверяются в потоке)."""
+    data = await run(lambda: serializer.data)
+    if paginator is not None:
+        data = paginator.get_paginated_response(data).data
+    return render(data)
+
+
+async def catalogue(request, model, get_data):
+    """
+    Ответ справочника из кэша по версии данных, как CatalogueCacheMixin.
+
+    Ключи и заголовки общие с синхронными вьюсетами.
+    """
+    route_reads()
+    version = await run(get_version, model)
+    etag, last_modified = get_validators(version)
+    response = get_conditional_response(
+        request, etag=etag, last_modified=last_modified
+    )
+    if response is None:
+        cache = get_cache()
+        key = content_key(version, request.get_full_path())
+        content = await run(cache.get, key)
+        if content is None:
+            content = get_renderer().render(await run(get_data))
+            await run(cache.set, key, content,
+                      settings.CATALOGUE_CACHE_TIMEOUT)
+        response = HttpResponse(content, content_type=JSON)
+    return set_validators(response, etag, last_modified)
+
+
+def get_object(queryset, pk):
+    try:
+        return queryset.get(pk=pk)
+    except queryset.model.DoesNotExist:
+        raise Http404
+
+
+async def tag_list(request):
+    return await catalogue(
+        request, Tag,
+        lambda: TagSerializer(Tag.objects.all(), many=True).data,
+    )
+
+
+async def tag_detail(request, pk):
+    return await catalogue(
+        request, Tag,
+        lambda: TagSerializer(get_object(Tag.objects.all(), pk)).data,
+    )
+
+
+async def ingredient_list(request):
+    """Ингредиенты; с ?name= — автодополнение по индексу в памяти."""
+    name = request.GET.get("name")
+    if name is None:
+        return await catalogue(
+            request, Ingredient,
+            lambda: IngredientSerializer(
+                Ingredient.objects.all(), many=True
+            ).data,
+        )
+    limit = request.GET.get("limit", "")
+    if limit.isdigit():
+        limit = min(int(limit), settings.INGREDIENT_SEARCH_MAX_LIMIT)
+    else:
+        limit = settings.INGREDIENT_SEARCH_LIMIT
+    index = await run(get_index)
+    return render(index.search(name, limit))
+
+
+async def ingredient_detail(request, pk):
+    return await catalogue(
+        request, Ingredient,
+        lambda: IngredientSerializer(
+            get_object(Ingredient.objects.all(), pk)
+        ).data,
+    )
+
+
+async def recipe_list(request):
+    """
+    Список рецептов: страница, общее количество и членство
+    пользователя (избранное, корзина, подписки) — параллельно.
+    """
+    if request.GET.get("paginate") == "cursor":
+        return None
+    request = await get_request(request)
+    view = get_view(RecipeViewSet, request, "list")
+    queryset = await run(view.get_read_queryset)
+    rows, paginator, results = await paginate(
+        view, request, queryset, *member_calls(request.user)
+    )
+    rows = await run(view.load_page, rows)
+    context = member_context(
+        view.get_serializer_context(), request.user, results
+    )
+    return await serialize(
+        view.get_read_serializer(rows, many=True, context=context), paginator
+    )
+
+
+async def recipe_detail(request, pk):
+    """Рецепт и членство пользователя — параллельно."""
+    request = await get_request(request)
+    view = get_view(RecipeViewSet, request, "retrieve", pk=pk)
+    recipe, *results = await asyncio.gather(
+        run(view.get_read_object),
+        *(run(*call) for call in member_calls(request.user)),
+    )
+    context = member_context(
+        view.get_serializer_context(), request.user, results
+    )
+    return await serialize(view.get_read_serializer(recipe, context=context))
+
+
+async def subscription_list(request):
+    """
+    Подписки: страница авторов и их количество — параллельно, затем
+    последние рецепты авторов страницы одним запросом.
+    """
+    if request.GET.get("paginate") == "cursor":
+        return None
+    request = await get_request(request)
+    view = get_view(CustomUserViewSet, request, "get_subscriptions")
+    queryset = view.get_subscriptions_queryset(request.user)
+    authors, paginator, _ = await paginate(view, request, queryset)
+    recipes_limit = view.get_recipes_limit(request)
+    await run(view.prefetch_latest_recipes, authors, recipes_limit)
+    serializer = SubscribeSerializer(
+        authors,
+        many=True,
+        context={"request": request, "recipes_limit": recipes_limit},
+    )
+    return await serialize(serializer, paginator)
@@ -0,0 +1,64 @@
+import copy
+import hashlib
+
+from django.conf import settings
+from django.db import transaction
+from django.utils.module_loading import import_string
+from rest_framework.authentication import TokenAuthentication
+
+_backend = None
+
+
+def get_backend():
+    global _backend
+    if _backend is None:
+        config = settings.TOKEN_AUTH_CACHE
+        _backend = import_string(config["BACKEND"])(
+            **config.get("OPTIONS", {})
+        )
+    return _backend
+
+
+def cache_key(key):
+    """Ключ кэша по хэшу токена: сам токен в общий кэш не попадает."""
+    return f"auth:token:{hashlib.sha256(key.encode()).hexdigest()}"
+
+
+def evict(keys):
+    """
+    Удаление токенов из кэша сейчас и после фиксации транзакции.
+
+    Повторное удаление убирает запись, которую параллельный запрос
+    мог прочитать из БД до фиксации.
+    """
+    keys = [cache_key(key) for key in keys]
+
+    def delete():
+        backend = get_backend()
+        for key in keys:
+            backend.delete(key)
+
+    delete()
+    transaction.on_commit(delete)
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """
+    Аутентификация по токену с кэшем токена и пользователя.
+
+    Запись удаляется при удалении токена (в том числе token/logout),
+    сохранении пользователя и изменении is_active или password через
+    QuerySet.update(). Прочие поля, измененные update() или SQL мимо
+    ORM, видны не позже срока жизни записи.
+    """
+
+    def authenticate_credentials(self, key):
+        backend = get_backend()
+        token = backend.get(cache_key(key))
+        if token is None:
+            _, token = super().authenticate_credentials(key)
+            backend.set(cache_key(key), token)
+        # Копии: запрос может менять пользователя, не затрагивая кэш.
+        token = copy.copy(token)
+        token.user = copy.copy(token.user)
+        return token.user, token
@@ -0,0 +1,133 @@
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+
+# Бэкенды Django, данные которых видны только своему процессу.
+LOCAL_BACKENDS = ("django.core.cache.backends.locmem.LocMemCache",)
+SHARED_MEMBERSHIP_BACKEND = "api.membership.CacheMembershipBackend"
+
+
+def get_cache():
+    """Кэш справочников, бэкенд задается в settings.CACHES."""
+    return caches[settings.CATALOGUE_CACHE]
+
+
+def is_local(alias):
+    return settings.CACHES[alias]["BACKEND"] in LOCAL_BACKENDS
+
+
+def local_caches():
+    """
+    Настройки кэшей, которые не видны другим процессам.
+
+    Версии справочников, членство и токены должны быть общими для всех
+    воркеров: с локальным кэшем другой процесс отдает устаревшие данные
+    и 304 на старые ETag.
+    """
+    names = []
+    if is_local(settings.CATALOGUE_CACHE):
+        names.append("CATALOGUE_CACHE")
+    for name in ("MEMBERSHIP_CACHE", "TOKEN_AUTH_CACHE"):
+        config = getattr(settings, name)
+        alias = config.get("OPTIONS", {}).get("alias", "default")
+        if config["BACKEND"] != SHARED_MEMBERSHIP_BACKEND or is_local(alias):
+            names.append(name)
+    return names
+
+
+def version_key(model):
+    return f"catalogue:{model._meta.label_lower}:version"
+
+
+def get_version(model):
+    """
+    Версия данных модели-справочника.
+
+    Версия — метка времени последнего изменения в наносекундах. Если её
+    нет в кэше (первый запуск, вытеснение), создается новая, и все ранее
+    закэшированные ответы перестают использоваться. Кэш версий должен
+    быть общим для всех процессов, иначе после изменения соседний
+    процесс отдает старые данные и 304 (см. local_caches).
+    """
+    cache = get_cache()
+    key = version_key(model)
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, time.time_ns(), timeout=None)
+        version = cache.get(key)
+    return version
+
+
+def bump_version(model):
+    """Новая версия справочника после изменения его данных."""
+    version = time.time_ns()
+    get_cache().set(version_key(model), version, timeout=None)
+    return version
+
+
+def get_validators(version):
+    """ETag и Last-Modified ответа справочника для версии данных."""
+    return f'"{version}"', version // 10 ** 9
+
+
+def set_validators(response, etag, last_modified):
+    response["ETag"] = etag
+    response["Last-Modified"] = http_date(last_modified)
+    return response
+
+
+def content_key(version, full_path):
+    """Ключ готового ответа справочника: версия и адрес запроса."""
+    path = hashlib.md5(full_path.encode()).hexdigest()
+    return f"catalogue:{version}:{path}"
+
+
+class CatalogueCacheMixin:
+    """
+    Кэширование ответов справочников под номером версии данных.
+
+    Ответ не зависит от пользователя, поэтому аутентификация не нужна.
+    Готовые байты JSON хранятся в кэше по ключу из версии и адреса
+    запроса. На If-None-Match/If-Modified-Since с актуальной версией
+    отдается 304 без обращения к БД.
+    """
+
+    authentication_classes = ()
+
+    def list(self, request, *args, **kwargs):
+        return self.cached_response(super().list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.cached_response(
+            super().retrieve, request, *args, **kwargs
+        )
+
+    def cached_response(self, handler, request, *args, **kwargs):
+        renderer = request.accepted_renderer
+        if renderer.format != "json":
+            return handler(request, *args, **kwargs)
+        version = get_version(self.queryset.model)
+        etag, last_modified = get_validators(version)
+        response = get_conditional_response(
+            request, etag=etag, last_modified=last_modified
+        )
+        if response is None:
+            cache = get_cache()
+            key = content_key(version, request.get_full_path())
+            content = cache.get(key)
+            if content is None:
+                content = renderer.render(
+                    handler(request, *args, **kwargs).data,
+                    request.accepted_media_type,
+                    self.get_renderer_context(),
+                )
+                cache.set(key, content, settings.CATALOGUE_CACHE_TIMEOUT)
+            response = HttpResponse(
+                content, content_type=request.accepted_media_type
+            )
+        return set_validators(response, etag, last_modified)
@@ -1,5 +1,14 @@
+import re
+
+from django.db import connections
+from django.db.models import BooleanField, FloatField, Q, Value
+from django.db.models.expressions import RawSQL
 from django_filters.rest_framework import FilterSet, filters
 from recipes.models import Ingredient, Recipe, Tag
+from rest_framework.filters import BaseFilterBackend
+
+from .membership import get_member_ids
+from .search import normalize
 
 
 class IngredientFilter(FilterSet):
@@ -37,12 +46,94 @@ class RecipeFilter(FilterSet):
         """Метод для получения избранных рецептов."""
         user = self.request.user
         if value and not user.is_anonymous:
-            return queryset.filter(favorites__user=user)
+            return queryset.filter(id__in=get_member_ids(user, "favorites"))
         return queryset
 
     def get_is_in_shopping_cart(self, queryset, name, value):
         """Метод для получения рецептов в корзине."""
         user = self.request.user
         if value and not user.is_anonymous:
-            return queryset.filter(carts__user=user)
+            return queryset.filter(id__in=get_member_ids(user, "carts"))
         return queryset
+
+
+class RecipeSearchFilter(BaseFilterBackend):
+    """
+    Полнотекстовый поиск рецептов по ?search=.
+
+    Ищет по названию, описанию и названиям ингредиентов. Каждое слово
+    запроса ищется по началу, результаты упорядочены по релевантности
+    (аннотация search_rank). На PostgreSQL используется хранимый
+    tsvector с GIN-индексом, на SQLite — таблица FTS5.
+    """
+
+    search_param = "search"
+
+    def filter_queryset(self, request, queryset, view):
+        query = request.query_params.get(self.search_param, "")
+        return self.search(queryset, query)
+
+    @classmethod
+    def get_words(cls, query):
+        return re.findall(r"\w+", normalize(query))
+
+    @classmethod
+    def search(cls, queryset, query):
+        words = cls.get_words(query)
+        if not words:
+            return queryset
+        vendor = connections[queryset.db].vendor
+        if vendor == "postgresql":
+            queryset = cls.search_postgresql(queryset, words)
+        elif vendor == "sqlite":
+            queryset = cls.search_sqlite(queryset, words)
+        else:
+            queryset = cls.search_fallback(queryset, words)
+        return queryset.order_by("-search_rank", "id")
+
+    @staticmethod
+    def search_postgresql(queryset, words):
+        tsquery = " & ".join(f"{word}:*" for word in words)
+        table = queryset.model._meta.db_table
+        return queryset.annotate(
+            search_match=RawSQL(
+                f"{table}.search_vector @@ to_tsquery('russian', %s)",
+                (tsquery,),
+                output_field=BooleanField(),
+            ),
+            search_rank=RawSQL(
+                f"ts_rank({table}.search_vector, "
+                "to_tsquery('russian', %s))",
+                (tsquery,),
+                output_field=FloatField(),
+            ),
+        ).filter(search_match=True)
+
+    @staticmethod
+    def search_sqlite(queryset, words):
+        match = " ".join(f'"{word}"*' for word in words)
+        table = queryset.model._meta.db_table
+        return queryset.extra(
+            tables=[f"{table}_fts"],
+            where=[f"{table}_fts.rowid = {table}.id", f"{table}_fts MATCH %s"],
+            params=[match],
+        ).annotate(
+            search_rank=RawSQL(
+                f"-bm25({table}_fts, 10.0, 5.0, 1.0)",
+                (),
+                output_field=FloatField(),
+            )
+        )
+
+    @staticmethod
+    def search_fallback(queryset, words):
+        condition = Q()
+        for word in words:
+            condition &= (
+                Q(name__icontains=word)
+                | Q(text__icontains=word)
+                | Q(RecipeIngredient__ingredient__name__icontains=word)
+            )
+        return queryset.filter(
+            id__in=Recipe.objects.filter(condition).values("id")
+        ).annotate(search_rank=Value(0.0, output_field=FloatField()))
@@ -0,0 +1,193 @@
+import asyncio
+import os
+import subprocess
+import time
+import urllib.request
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from recipes.models import Recipe
+from rest_framework.authtoken.models import Token
+from users.models import User
+
+from api.management.commands.bench_ingredient_search import percentile
+
+STACKS = {
+    'sync': ('foodgram.wsgi:application', 'sync', ''),
+    'asgi': (
+        'foodgram.asgi:application', 'uvicorn.workers.UvicornWorker', 'True'
+    ),
+}
+
+
+async def read_response(reader):
+    """
+    Статус ответа HTTP/1.1 и признак keep-alive.
+
+    Тело дочитывается, чтобы соединение можно было использовать снова.
+    Синхронные воркеры gunicorn закрывают соединение после ответа.
+    """
+    status = int((await reader.readline()).split()[1])
+    length, chunked, keep_alive = 0, False, True
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b''):
+            break
+        name, _, value = line.decode('latin-1').partition(':')
+        name = name.strip().lower()
+        if name == 'content-length':
+            length = int(value)
+        elif name == 'transfer-encoding' and 'chunked' in value:
+            chunked = True
+        elif name == 'connection' and 'close' in value.lower():
+            keep_alive = False
+    if not chunked:
+        await reader.readexactly(length)
+        return status, keep_alive
+    while True:
+        size = int((await reader.readline()).split(b';')[0], 16)
+        await reader.readexactly(size + 2)
+        if not size:
+            return status, keep_alive
+
+
+class Command(BaseCommand):
+    help = ('Сравнение синхронного (gunicorn sync, WSGI) и асинхронного '
+            '(gunicorn + uvicorn, ASGI) стека при равном числе воркеров')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=2)
+        parser.add_argument('--concurrency', type=int, default=32)
+        parser.add_argument('--duration', type=float, default=10)
+        parser.add_argument('--warmup', type=float, default=2)
+        parser.add_argument('--port', type=int, default=8100)
+        parser.add_argument(
+            '--stacks', nargs='+', choices=list(STACKS),
+            default=list(STACKS),
+        )
+        parser.add_argument(
+            '--user', help='email пользователя для запросов с токеном'
+        )
+        parser.add_argument(
+            '--paths', nargs='+',
+            help='Адреса запросов, по умолчанию — эндпоинты чтения',
+        )
+
+    def get_paths(self):
+        recipe = Recipe.objects.order_by('-id').first()
+        if recipe is None:
+            raise CommandError('Рецептов нет: запустите seed или load_data')
+        return [
+            '/api/recipes/?limit=6',
+            '/api/recipes/?limit=6&page=2',
+            f'/api/recipes/{recipe.id}/',
+            '/api/tags/',
+            '/api/users/subscriptions/?limit=6&recipes_limit=3',
+        ]
+
+    def start(self, stack, port, workers):
+        app, worker_class, async_views = STACKS[stack]
+        # Замер пропускной способности: устаревшие данные в локальных
+        # кэшах соседних воркеров ему не мешают.
+        env = {
+            **os.environ,
+            'ASYNC_READ_VIEWS': async_views,
+            'GUNICORN_ALLOW_LOCAL_CACHES': '1',
+        }
+        process = subprocess.Popen(
+            [
+                'gunicorn', app,
+                '--config', str(settings.BASE_DIR / 'gunicorn.conf.py'),
+                '--bind', f'127.0.0.1:{port}',
+                '--workers', str(workers),
+                '--worker-class', worker_class,
+                '--log-level', 'warning',
+            ],
+            cwd=settings.BASE_DIR, env=env,
+        )
+        deadline = time.monotonic() + 30
+        while time.monotonic() < deadline:
+            try:
+                urllib.request.urlopen(
+                    f'http://127.0.0.1:{port}/api/tags/', timeout=1
+                )
+                return process
+            except OSError:
+                if process.poll() is not None:
+                    break
+                time.sleep(0.2)
+        process.terminate()
+        raise CommandError(f'Сервер {stack} не запустился')
+
+    async def client(self, port, requests, position, deadline, timings,
+                     statuses):
+        writer = None
+        try:
+            while time.monotonic() < deadline:
+                started = time.perf_counter()
+                if writer is None:
+                    reader, writer = await asyncio.open_connection(
+                        '127.0.0.1', port
+                    )
+                writer.write(requests[position % len(requests)])
+                status, keep_alive = await read_response(reader)
+                timings.append((time.perf_counter() - started) * 1000)
+                statuses[status] = statuses.get(status, 0) + 1
+                position += 1
+                if not keep_alive:
+                    writer.close()
+                    writer = None
+        finally:
+            if writer is not None:
+                writer.close()
+
+    async def load(self, port, requests, duration, concurrency):
+        timings, statuses = [], {}
+        deadline = time.monotonic() + duration
+        started = time.perf_counter()
+        await asyncio.gather(*(
+            self.client(port, requests, position, deadline, timings,
+                        statuses)
+            for position in range(concurrency)
+        ))
+        return timings, statuses, time.perf_counter() - started
+
+    def handle(self, *args, **options):
+        paths = options['paths'] or self.get_paths()
+        headers = 'Host: localhost\r\nConnection: keep-alive\r\n'
+        if options['user']:
+            user = User.objects.get(email=options['user'])
+            token, _ = Token.objects.get_or_create(user=user)
+            headers += f'Authorization: Token {token.key}\r\n'
+        requests = [
+            f'GET {path} HTTP/1.1\r\n{headers}\r\n'.encode() for path in paths
+        ]
+        self.stdout.write(
+            f'Воркеров: {options["workers"]}, '
+            f'клиентов: {options["concurrency"]}, '
+            f'длительность: {options["duration"]} с\n' + '\n'.join(paths)
+        )
+        for number, stack in enumerate(options['stacks']):
+            port = options['port'] + number
+            process = self.start(stack, port, options['workers'])
+            try:
+                asyncio.run(self.load(
+                    port, requests, options['warmup'],
+                    options['concurrency'],
+                ))
+                timings, statuses, elapsed = asyncio.run(self.load(
+                    port, requests, options['duration'],
+                    options['concurrency'],
+                ))
+            finally:
+                process.terminate()
+                process.wait()
+            timings.sort()
+            self.stdout.write(
+                f'{stack}: {len(timings) / elapsed:.0f} запросов/с, '
+                f'p50: {percentile(timings, 50):.1f} мс, '
+                f'p95: {percentile(timings, 95):.1f} мс, '
+                f'p99: {percentile(timings, 99):.1f} мс, '
+                f'max: {timings[-1]:.1f} мс, '
+                f'статусы: {dict(sorted(statuses.items()))}'
+            )
@@ -0,0 +1,369 @@
+import json
+import platform
+import subprocess
+import time
+import tracemalloc
+from datetime import datetime, timezone
+
+import django
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.urls import reverse
+from recipes.models import Carts, Favourites, Recipe, Tag
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+from users.models import Subscribe, User
+
+from api.membership import KINDS, cache_key, get_backend
+from api.queries import collect
+from api.relations import add_relations, remove_relations
+from api.routes import get_routes
+
+from .bench_ingredient_search import percentile
+
+PASSWORD = 'bench-endpoints-password'
+PNG = (
+    'data:image/png;base64,iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAYAAAAfFcSJAAAA'
+    'DUlEQVR42mNkYPhfDwAChwGA60e6kgAAAABJRU5ErkJggg=='
+)
+
+# Маршруты без замеров. Изменение чужого профиля: права
+# IsAuthorOrReadOnly рассчитаны на рецепты и для User дают ошибку 500;
+# set_username ждет new_email (LOGIN_FIELD), а читает new_username.
+# Остальные отправляют письма и требуют uid/token из них.
+EXCLUDED = {
+    ('users-set-username', 'post'),
+    ('users-detail', 'put'),
+    ('users-detail', 'patch'),
+    ('users-activation', 'post'),
+    ('users-resend-activation', 'post'),
+    ('users-reset-password', 'post'),
+    ('users-reset-password-confirm', 'post'),
+    ('users-reset-username', 'post'),
+    ('users-reset-username-confirm', 'post'),
+}
+
+# Объемы таблиц, от которых зависит время ответа.
+VOLUMES = {
+    'users': User,
+    'recipes': Recipe,
+    'favorites': Favourites,
+    'carts': Carts,
+    'subscriptions': Subscribe,
+}
+
+
+def get_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=settings.BASE_DIR,
+            capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class Command(BaseCommand):
+    help = ('Замер задержки (p50/p95/p99), числа запросов к БД и пика '
+            'памяти каждого эндпоинта api, отчет в JSON '
+            '(изменения откатываются)')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--user', help='email пользователя, от имени которого запросы'
+        )
+        parser.add_argument('--iterations', type=int, default=20)
+        parser.add_argument('--warmup', type=int, default=2)
+        parser.add_argument(
+            '--only', nargs='+', metavar='ROUTE',
+            help='Имена маршрутов, по умолчанию — все',
+        )
+        parser.add_argument('--output', help='Файл отчета JSON')
+        parser.add_argument(
+            '--compare', help='Отчет JSON другого коммита для сравнения'
+        )
+
+    def get_samples(self, email):
+        """Пользователь, его рецепт и рецепт другого автора."""
+        users = User.objects.filter(recipes__isnull=False).distinct()
+        if email:
+            users = users.filter(email=email)
+        user = users.order_by('id').first()
+        if user is None:
+            raise CommandError('Нужен пользователь с рецептами')
+        other = Recipe.objects.exclude(author=user).order_by('-id').first()
+        if other is None:
+            raise CommandError('Нужен рецепт другого автора')
+        own = Recipe.objects.filter(author=user).order_by('-id').first()
+        return user, own, other
+
+    def get_cases(self, user, own, other):
+        """Объект detail-маршрута, параметры и тело каждого запроса."""
+        ingredients = [
+            {'id': item.ingredient_id, 'amount': item.amount}
+            for item in own.RecipeIngredient.all()
+        ]
+        recipe = {
+            'ingredients': ingredients,
+            'tags': list(own.tags.values_list('id', flat=True)),
+            'image': PNG,
+            'name': 'Проверка бюджета',
+            'text': 'Проверка бюджета',
+            'cooking_time': 10,
+        }
+        profile = {
+            'email': 'budget@example.com',
+            'username': 'budget',
+            'first_name': 'Бюджет',
+            'last_name': 'Проверка',
+        }
+        ingredient_ids = [item['id'] for item in ingredients]
+        # Тег берется из справочника: у рецепта тегов может не быть.
+        tag_id = Tag.objects.order_by('id').values_list(
+            'id', flat=True
+        ).first()
+        if tag_id is None:
+            raise CommandError('Нужен хотя бы один тег')
+        return {
+            ('ingredients-list', 'get'): (None, {'name': 'а'}, None),
+            ('ingredients-detail', 'get'): (ingredient_ids[0], None, None),
+            ('tags-detail', 'get'): (tag_id, None, None),
+            ('recipes-list', 'get'): (None, {'limit': 6}, None),
+            ('recipes-list', 'post'): (None, None, recipe),
+            ('recipes-detail', 'get'): (other.id, None, None),
+            ('recipes-detail', 'put'): (own.id, None, recipe),
+            ('recipes-detail', 'patch'): (own.id, None, {'name': 'Новое'}),
+            ('recipes-detail', 'delete'): (own.id, None, None),
+            ('recipes-favorite-batch', 'post'): (
+                None, None, {'ids': [other.id]}
+            ),
+            ('recipes-favorite-batch', 'delete'): (
+                None, None, {'ids': [other.id]}
+            ),
+            ('recipes-shopping-cart-batch', 'post'): (
+                None, None, {'ids': [other.id]}
+            ),
+            ('recipes-shopping-cart-batch', 'delete'): (
+                None, None, {'ids': [other.id]}
+            ),
+            ('recipes-pantry', 'get'): (
+                None, {'ingredients': ingredient_ids}, None
+            ),
+            ('users-list', 'get'): (None, {'limit': 6}, None),
+            ('users-list', 'post'): (
+                None, None, {**profile, 'password': PASSWORD}
+            ),
+            ('users-detail', 'get'): (other.author_id, None, None),
+            ('users-detail', 'put'): (user.id, None, profile),
+            ('users-detail', 'patch'): (user.id, None, {'first_name': 'Б'}),
+            ('users-detail', 'delete'): (
+                user.id, None, {'current_password': PASSWORD}
+            ),
+            ('users-me', 'put'): (None, None, profile),
+            ('users-me', 'patch'): (None, None, {'first_name': 'Б'}),
+            ('users-me', 'delete'): (
+                None, None, {'current_password': PASSWORD}
+            ),
+            ('users-set-password', 'post'): (None, None, {
+                'current_password': PASSWORD,
+                'new_password': PASSWORD + '-new',
+            }),
+            ('users-get-subscriptions', 'get'): (
+                None, {'limit': 6, 'recipes_limit': 3}, None
+            ),
+            ('users-subscribe', 'post'): (other.author_id, None, None),
+            ('users-subscribe', 'delete'): (other.author_id, None, None),
+            ('users-subscribe-batch', 'post'): (
+                None, None, {'ids': [other.author_id]}
+            ),
+            ('users-subscribe-batch', 'delete'): (
+                None, None, {'ids': [other.author_id]}
+            ),
+            ('login', 'post'): (None, None, {
+                'email': user.email, 'password': PASSWORD
+            }),
+        }
+
+    @staticmethod
+    def prepare(key, user, other):
+        """
+        Данные, при которых запрос успешен (откатываются).
+
+        Для добавления связь удаляется, для остальных запросов — есть.
+        Связи меняются как в api, вместе со списком покупок и лентой.
+        """
+        name, method = key
+        if name in ('recipes-favorite', 'recipes-favorite-batch',
+                    'recipes-recommended'):
+            model, pk = Favourites, other.id
+        elif name in ('recipes-shopping-cart', 'recipes-shopping-cart-batch',
+                      'recipes-download-carts',
+                      'recipes-shopping-cart-summary'):
+            model, pk = Carts, other.id
+        elif name in ('users-subscribe', 'users-subscribe-batch',
+                      'users-get-subscriptions', 'recipes-feed'):
+            model, pk = Subscribe, other.author_id
+        else:
+            return
+        if method == 'post':
+            remove_relations(model, user, [pk])
+        else:
+            add_relations(model, user, [pk])
+
+    @staticmethod
+    def request(client, method, url, query, data):
+        """
+        Ответ эндпоинта с прочитанным телом.
+
+        Потоковый ответ выполняет запросы при чтении, поэтому тело
+        читается здесь, внутри замера.
+        """
+        if method == 'get':
+            response = client.get(url, query)
+        else:
+            response = getattr(client, method)(url, data, format='json')
+        if response.streaming:
+            b''.join(response.streaming_content)
+        return response
+
+    def call(self, client, key, url, query, data, user, other):
+        """Один вызов в точке сохранения: статус, время в мс, запросы."""
+        savepoint = transaction.savepoint()
+        try:
+            self.prepare(key, user, other)
+            with collect() as stats:
+                started = time.perf_counter()
+                response = self.request(client, key[1], url, query, data)
+                elapsed = (time.perf_counter() - started) * 1000
+        finally:
+            transaction.savepoint_rollback(savepoint)
+        return response.status_code, elapsed, stats.count
+
+    def bench(self, client, key, url, query, data, user, other, options):
+        """Результаты замера эндпоинта для отчета."""
+        for kind in KINDS:
+            get_backend().delete(cache_key(user.id, kind))
+        for _ in range(options['warmup']):
+            self.call(client, key, url, query, data, user, other)
+        timings, queries, statuses = [], [], set()
+        for _ in range(options['iterations']):
+            status, elapsed, count = self.call(
+                client, key, url, query, data, user, other
+            )
+            statuses.add(status)
+            timings.append(elapsed)
+            queries.append(count)
+        # Отдельный вызов: tracemalloc замедляет код в разы.
+        tracemalloc.start()
+        try:
+            self.call(client, key, url, query, data, user, other)
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        timings.sort()
+        return {
+            'path': url,
+            'statuses': sorted(statuses),
+            'p50_ms': round(percentile(timings, 50), 3),
+            'p95_ms': round(percentile(timings, 95), 3),
+            'p99_ms': round(percentile(timings, 99), 3),
+            'max_ms': round(timings[-1], 3),
+            'queries': max(queries),
+            'peak_memory_kb': round(peak / 1024, 1),
+        }
+
+    def compare(self, results, path):
+        """Изменение p50, p95 и числа запросов относительно отчета path."""
+        with open(path, encoding='UTF-8') as file:
+            baseline = json.load(file)
+        self.stdout.write(f'Сравнение с {baseline["commit"] or path}:')
+        for name, result in results.items():
+            before = baseline['endpoints'].get(name)
+            if before is None:
+                self.stdout.write(f'{name}: нет в отчете')
+                continue
+            changes = ', '.join(
+                f'{field} {before[field]:.2f} -> {result[field]:.2f} '
+                f'({result[field] / max(before[field], 1e-9) - 1:+.0%})'
+                for field in ('p50_ms', 'p95_ms')
+            )
+            line = (f'{name}: {changes}, запросов '
+                    f'{before["queries"]} -> {result["queries"]}')
+            slower = result['p95_ms'] > before['p95_ms'] * 1.2
+            if slower or result['queries'] > before['queries']:
+                line = self.style.WARNING(line)
+            self.stdout.write(line)
+
+    def handle(self, *args, **options):
+        if options['iterations'] < 1:
+            raise CommandError('Нужна хотя бы одна итерация')
+        routes = get_routes()
+        keys = sorted(
+            (name, method)
+            for name, (_, methods) in routes.items() for method in methods
+            if (name, method) not in EXCLUDED
+            and (not options['only'] or name in options['only'])
+        )
+        results = {}
+        with transaction.atomic():
+            user, own, other = self.get_samples(options['user'])
+            user.set_password(PASSWORD)
+            user.save(update_fields=['password'])
+            token, _ = Token.objects.get_or_create(user=user)
+            client = APIClient(raise_request_exception=False)
+            cases = self.get_cases(user, own, other)
+            volumes = {
+                name: model.objects.count()
+                for name, model in VOLUMES.items()
+            }
+            for key in keys:
+                name, method = key
+                lookup, _ = routes[name]
+                target, query, data = cases.get(key, (None, None, None))
+                if lookup and target is None:
+                    target = other.id
+                url = reverse(
+                    f'api:{name}',
+                    kwargs={lookup: target} if lookup else None,
+                )
+                if name == 'login':
+                    client.credentials()
+                else:
+                    client.credentials(
+                        HTTP_AUTHORIZATION=f'Token {token.key}'
+                    )
+                result = self.bench(
+                    client, key, url, query, data, user, other, options
+                )
+                results[f'{name} {method.upper()}'] = result
+                self.stdout.write(
+                    f'{name} {method.upper()}: '
+                    f'p50 {result["p50_ms"]:.2f} мс, '
+                    f'p95 {result["p95_ms"]:.2f} мс, '
+                    f'p99 {result["p99_ms"]:.2f} мс, '
+                    f'запросов {result["queries"]}, '
+                    f'память {result["peak_memory_kb"]:.0f} КБ, '
+                    f'статусы {result["statuses"]}'
+                )
+            transaction.set_rollback(True)
+        report = {
+            'commit': get_commit(),
+            'created': datetime.now(timezone.utc).isoformat(),
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'database': connection.vendor,
+            'async_read_views': settings.ASYNC_READ_VIEWS,
+            'iterations': options['iterations'],
+            'user': user.email,
+            'volumes': volumes,
+            'endpoints': results,
+        }
+        if options['output']:
+            with open(options['output'], 'w', encoding='UTF-8') as file:
+                json.dump(report, file, ensure_ascii=False, indent=2)
+            self.stdout.write(self.style.SUCCESS(
+                f'Отчет сохранен: {options["output"]}'
+            ))
+        if options['compare']:
+            self.compare(results, options['compare'])
@@ -0,0 +1,55 @@
+import random
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from api.search import IngredientIndex
+
+
+def percentile(values, percent):
+    """Перцентиль по отсортированному списку."""
+    position = min(len(values) - 1, int(len(values) * percent / 100))
+    return values[position]
+
+
+class Command(BaseCommand):
+    help = 'Замер времени поиска ингредиентов по индексу автодополнения'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lookups', type=int, default=10000)
+        parser.add_argument(
+            '--limit', type=int, default=settings.INGREDIENT_SEARCH_LIMIT
+        )
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        index = IngredientIndex.build()
+        build_time = time.perf_counter() - started
+        if not len(index):
+            self.stdout.write(self.style.ERROR('Таблица ингредиентов пуста'))
+            return
+        rnd = random.Random(options['seed'])
+        queries = []
+        for _ in range(options['lookups']):
+            name = rnd.choice(index.names)
+            length = rnd.randint(1, min(6, len(name)))
+            start = 0
+            if rnd.random() < 0.3:
+                start = rnd.randint(0, len(name) - length)
+            queries.append(name[start:start + length])
+        timings = []
+        for query in queries:
+            started = time.perf_counter_ns()
+            index.search(query, options['limit'])
+            timings.append((time.perf_counter_ns() - started) / 1000)
+        timings.sort()
+        self.stdout.write(
+            f'Ингредиентов: {len(index)}, построение: {build_time:.3f} с\n'
+            f'Запросов: {len(timings)}, '
+            f'p50: {percentile(timings, 50):.1f} мкс, '
+            f'p95: {percentile(timings, 95):.1f} мкс, '
+            f'p99: {percentile(timings, 99):.1f} мкс, '
+            f'max: {timings[-1]:.1f} мкс'
+        )
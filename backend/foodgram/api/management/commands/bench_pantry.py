@@ -0,0 +1,49 @@
+import random
+import time
+
+from django.core.management.base import BaseCommand
+
+from api.pantry import PantryIndex
+
+from .bench_ingredient_search import percentile
+
+
+class Command(BaseCommand):
+    help = 'Замер времени поиска рецептов по имеющимся продуктам'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lookups', type=int, default=1000)
+        parser.add_argument('--products', type=int, default=10)
+        parser.add_argument('--missing', type=int, default=None)
+        parser.add_argument('--limit', type=int, default=20)
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        index = PantryIndex.build()
+        build_time = time.perf_counter() - started
+        ingredient_ids = list(index.postings)
+        if not ingredient_ids:
+            self.stdout.write(self.style.ERROR('Таблица состава пуста'))
+            return
+        weights = [len(index.postings[pk]) for pk in ingredient_ids]
+        rnd = random.Random(options['seed'])
+        timings = []
+        for _ in range(options['lookups']):
+            products = rnd.choices(
+                ingredient_ids, weights, k=options['products']
+            )
+            started = time.perf_counter_ns()
+            found = index.search(products, options['missing'])
+            found[:options['limit']]
+            timings.append((time.perf_counter_ns() - started) / 1e6)
+        timings.sort()
+        self.stdout.write(
+            f'Рецептов: {int((index.sizes > 0).sum())}, '
+            f'построение: {build_time:.3f} с\n'
+            f'Запросов: {len(timings)}, '
+            f'p50: {percentile(timings, 50):.2f} мс, '
+            f'p95: {percentile(timings, 95):.2f} мс, '
+            f'p99: {percentile(timings, 99):.2f} мс, '
+            f'max: {timings[-1]:.2f} мс'
+        )
@@ -0,0 +1,106 @@
+import random
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from recipes.counters import recount
+from recipes.models import Ingredient, Recipe, RecipeIngredient
+from recipes.synthetic import WORDS
+from users.models import User
+
+from api.filters import RecipeSearchFilter
+
+from .bench_ingredient_search import percentile
+
+
+class Command(BaseCommand):
+    help = 'Замер времени полнотекстового поиска рецептов'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--generate', type=int, default=0,
+            help='Сколько синтетических рецептов добавить перед замером',
+        )
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--queries', type=int, default=1000)
+        parser.add_argument('--limit', type=int, default=6)
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        rnd = random.Random(options['seed'])
+        if options['generate']:
+            self.generate(rnd, options['generate'], options['batch_size'])
+        total = Recipe.objects.count()
+        if not total:
+            self.stdout.write(self.style.ERROR('Таблица рецептов пуста'))
+            return
+        names = list(
+            Ingredient.objects.values_list('name', flat=True)[:1000]
+        )
+        vocabulary = list(WORDS) + [name.split()[0] for name in names]
+        queries = []
+        for _ in range(options['queries']):
+            words = rnd.sample(vocabulary, rnd.randint(1, 2))
+            queries.append(' '.join(
+                word[:rnd.randint(3, len(word))] if len(word) > 3 else word
+                for word in words
+            ))
+        timings = []
+        found = 0
+        for query in queries:
+            started = time.perf_counter_ns()
+            page = list(RecipeSearchFilter.search(
+                Recipe.objects.all(), query
+            ).values_list('id', flat=True)[:options['limit']])
+            timings.append((time.perf_counter_ns() - started) / 1e6)
+            found += bool(page)
+        timings.sort()
+        self.stdout.write(
+            f'Рецептов: {total}, запросов: {len(timings)}, '
+            f'с результатами: {found}\n'
+            f'p50: {percentile(timings, 50):.2f} мс, '
+            f'p95: {percentile(timings, 95):.2f} мс, '
+            f'p99: {percentile(timings, 99):.2f} мс, '
+            f'max: {timings[-1]:.2f} мс'
+        )
+
+    def generate(self, rnd, count, batch_size):
+        """Синтетические рецепты от служебного пользователя."""
+        author, _ = User.objects.get_or_create(
+            username='bench', defaults={'email': 'bench@example.com'}
+        )
+        ingredient_ids = list(Ingredient.objects.values_list('id', flat=True))
+        created = 0
+        while created < count:
+            size = min(batch_size, count - created)
+            with transaction.atomic():
+                last_id = Recipe.objects.order_by('-id').values_list(
+                    'id', flat=True
+                ).first() or 0
+                Recipe.objects.bulk_create(
+                    Recipe(
+                        author=author,
+                        name=' '.join(rnd.sample(WORDS, 3)).capitalize(),
+                        text=' '.join(rnd.choices(WORDS, k=20)),
+                        image='recipes/img/bench.png',
+                        cooking_time=rnd.randint(1, 180),
+                    )
+                    for _ in range(size)
+                )
+                recipe_ids = Recipe.objects.filter(
+                    id__gt=last_id, author=author
+                ).values_list('id', flat=True)
+                if ingredient_ids:
+                    RecipeIngredient.objects.bulk_create(
+                        RecipeIngredient(
+                            recipe_id=recipe_id, ingredient_id=ingredient_id,
+                            amount=rnd.randint(1, 500),
+                        )
+                        for recipe_id in recipe_ids
+                        for ingredient_id in rnd.sample(
+                            ingredient_ids, min(5, len(ingredient_ids))
+                        )
+                    )
+            created += size
+            self.stdout.write(f'Создано рецептов: {created}/{count}')
+        recount(Recipe, [author.pk])
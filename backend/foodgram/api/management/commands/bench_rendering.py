@@ -0,0 +1,125 @@
+import time
+
+from django.contrib.auth.models import AnonymousUser
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+from users.models import User
+
+from api import renderers
+from api.renderers import FastJSONRenderer
+from api.serializers import RecipeLeanSerializer, RecipeReadSerializer
+from api.views import RecipeViewSet
+
+from .bench_ingredient_search import percentile
+
+
+def fetch_models(view, offset, limit):
+    return list(view.get_queryset()[offset:offset + limit])
+
+
+def fetch_rows(view, offset, limit):
+    return RecipeLeanSerializer.load(
+        RecipeLeanSerializer.get_rows(view.queryset.all())
+        [offset:offset + limit]
+    )
+
+
+# Вариант: выборка страницы, сериализатор, рендерер.
+VARIANTS = {
+    'ModelSerializer + JSONRenderer': (
+        fetch_models, RecipeReadSerializer, JSONRenderer
+    ),
+    'ModelSerializer + FastJSONRenderer': (
+        fetch_models, RecipeReadSerializer, FastJSONRenderer
+    ),
+    'values() + FastJSONRenderer': (
+        fetch_rows, RecipeLeanSerializer, FastJSONRenderer
+    ),
+}
+
+
+class Command(BaseCommand):
+    help = ('Процессорное время на страницу списка рецептов: выборка, '
+            'сериализация и JSON для ModelSerializer и values()')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--limit', type=int, default=50)
+        parser.add_argument('--pages', type=int, default=200)
+        parser.add_argument(
+            '--user', help='email пользователя (флаги избранного и т.п.)'
+        )
+
+    def get_view(self, limit, email):
+        request = Request(
+            APIRequestFactory().get('/api/recipes/', {'limit': limit})
+        )
+        request.user = (
+            User.objects.get(email=email) if email else AnonymousUser()
+        )
+        return RecipeViewSet(request=request, args=(), kwargs={},
+                             format_kwarg=None, action='list')
+
+    def measure(self, view, variant, offsets, limit):
+        """Время процессора (мс) каждого этапа по страницам и ответы."""
+        fetch, serializer_class, renderer_class = VARIANTS[variant]
+        renderer = renderer_class()
+        timings = {'fetch': [], 'serialize': [], 'render': [], 'total': []}
+        contents = []
+        for offset in offsets:
+            started = time.process_time()
+            page = fetch(view, offset, limit)
+            fetched = time.process_time()
+            data = serializer_class(
+                page, many=True, context=view.get_serializer_context()
+            ).data
+            serialized = time.process_time()
+            contents.append(renderer.render(data))
+            rendered = time.process_time()
+            for stage, value in (
+                ('fetch', fetched - started),
+                ('serialize', serialized - fetched),
+                ('render', rendered - serialized),
+                ('total', rendered - started),
+            ):
+                timings[stage].append(value * 1000)
+        return timings, contents
+
+    def handle(self, *args, **options):
+        limit = options['limit']
+        view = self.get_view(limit, options['user'])
+        total = view.queryset.count()
+        if not total:
+            raise CommandError('Рецептов нет: запустите seed_synthetic')
+        offsets = [
+            (page * limit) % max(total - limit, 1)
+            for page in range(options['pages'])
+        ]
+        self.stdout.write(
+            f'Рецептов: {total}, страниц: {len(offsets)} по {limit}, '
+            f'orjson: {"да" if renderers.orjson else "нет"}'
+        )
+        # Прогрев: кэши членства и версий, соединение с БД.
+        self.measure(view, next(iter(VARIANTS)), offsets[:2], limit)
+        baseline = expected = None
+        for variant in VARIANTS:
+            timings, contents = self.measure(view, variant, offsets, limit)
+            if expected is None:
+                expected = contents
+            elif contents != expected:
+                raise CommandError(f'{variant}: ответ отличается')
+            means = {
+                stage: sum(values) / len(values)
+                for stage, values in timings.items()
+            }
+            baseline = baseline or means['total']
+            self.stdout.write(
+                f'{variant}: {means["total"]:.2f} мс на страницу '
+                f'(p95 {percentile(sorted(timings["total"]), 95):.2f}; '
+                f'выборка {means["fetch"]:.2f}, '
+                f'сериализация {means["serialize"]:.2f}, '
+                f'JSON {means["render"]:.2f}), '
+                f'ускорение x{baseline / means["total"]:.2f}'
+            )
+        self.stdout.write(self.style.SUCCESS('Ответы побайтно совпадают'))
@@ -0,0 +1,273 @@
+import asyncio
+import json
+import time
+from collections import defaultdict
+from urllib.parse import quote
+
+from django.core.management.base import BaseCommand, CommandError
+from django.urls import Resolver404, resolve
+from rest_framework.authtoken.models import Token
+from users.models import User
+
+from api.traffic import read
+
+from .bench_asgi import read_response
+from .bench_endpoints import get_commit
+from .bench_ingredient_search import percentile
+
+# Повторяются только запросы чтения: тела запросов в журнале нет, а
+# запись изменила бы локальную БД.
+REPLAYED_METHODS = ('GET',)
+
+
+def get_route(entry):
+    """Метод и имя маршрута (шаблон, если у маршрута нет имени)."""
+    try:
+        match = resolve(entry['path'])
+    except Resolver404:
+        return f'{entry["method"]} {entry["path"]}'
+    return f'{entry["method"]} {match.url_name or match.route}'
+
+
+def is_error(status):
+    return not status or status >= 400
+
+
+def summarize(timings, statuses):
+    timings = sorted(timings)
+    return {
+        'p50_ms': round(percentile(timings, 50), 2),
+        'p95_ms': round(percentile(timings, 95), 2),
+        'p99_ms': round(percentile(timings, 99), 2),
+        'errors': sum(map(is_error, statuses)),
+    }
+
+
+class Command(BaseCommand):
+    help = ('Воспроизведение журнала запросов к api на локальном '
+            'сервере: задержки и ошибки по маршрутам')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'paths', nargs='+', help='Файлы журнала, включая ротированные'
+        )
+        parser.add_argument('--host', default='127.0.0.1')
+        parser.add_argument('--port', type=int, default=8000)
+        parser.add_argument(
+            '--speed', type=float, default=1,
+            help='Ускорение относительно журнала, 0 — без пауз',
+        )
+        parser.add_argument('--concurrency', type=int, default=8)
+        parser.add_argument(
+            '--limit', type=int, help='Сколько первых запросов повторить'
+        )
+        parser.add_argument(
+            '--users', type=int, default=100,
+            help='Сколько локальных пользователей подставлять вместо '
+                 'псевдонимов из журнала',
+        )
+        parser.add_argument('--output', help='Файл отчета JSON')
+        parser.add_argument(
+            '--compare', help='Отчет JSON прошлого воспроизведения'
+        )
+
+    def get_tokens(self, count):
+        users = User.objects.filter(is_active=True).order_by('id')[:count]
+        tokens = [Token.objects.get_or_create(user=user)[0].key
+                  for user in users]
+        if not tokens:
+            raise CommandError('Нет пользователей: запустите seed_synthetic')
+        return tokens
+
+    def build(self, entries, tokens):
+        """
+        Запросы HTTP/1.1 для записей журнала.
+
+        Псевдонимам по порядку появления сопоставляются локальные
+        пользователи, так что запросы одного пользователя из журнала
+        идут от одного локального.
+        """
+        aliases = {}
+        requests = []
+        for entry in entries:
+            headers = f'Host: {self.host}\r\nConnection: keep-alive\r\n'
+            if entry['user']:
+                number = aliases.setdefault(entry['user'], len(aliases))
+                token = tokens[number % len(tokens)]
+                headers += f'Authorization: Token {token}\r\n'
+            target = quote(entry['path'])
+            if entry['query']:
+                target += f'?{entry["query"]}'
+            requests.append(
+                f'{entry["method"]} {target} HTTP/1.1\r\n{headers}\r\n'
+                .encode()
+            )
+        return requests
+
+    async def send(self, connection, request):
+        """
+        Статус ответа; соединение переоткрывается, если сервер закрыл
+        его между запросами (keep-alive timeout).
+        """
+        reused = connection.get('writer') is not None
+        if not reused:
+            connection['reader'], connection['writer'] = (
+                await asyncio.open_connection(self.host, self.port)
+            )
+        try:
+            connection['writer'].write(request)
+            status, keep_alive = await read_response(connection['reader'])
+        except (ConnectionError, IndexError, asyncio.IncompleteReadError):
+            connection['writer'].close()
+            connection['writer'] = None
+            if not reused:
+                return 0
+            return await self.send(connection, request)
+        if not keep_alive:
+            connection['writer'].close()
+            connection['writer'] = None
+        return status
+
+    async def worker(self, queue, results):
+        connection = {}
+        try:
+            while True:
+                item = await queue.get()
+                if item is None:
+                    return
+                entry, request = item
+                started = time.perf_counter()
+                try:
+                    status = await self.send(connection, request)
+                except OSError:
+                    status = 0
+                results.append((
+                    entry, status, (time.perf_counter() - started) * 1000
+                ))
+        finally:
+            if connection.get('writer') is not None:
+                connection['writer'].close()
+
+    async def replay(self, entries, requests, speed, concurrency):
+        """
+        Запросы в темпе журнала, ускоренном в speed раз.
+
+        Если сервер не успевает, очередь заполняется и запросы
+        отстают от расписания; наибольшее отставание — в отчете.
+        """
+        queue = asyncio.Queue(maxsize=concurrency * 2)
+        results = []
+        workers = [
+            asyncio.create_task(self.worker(queue, results))
+            for _ in range(concurrency)
+        ]
+        started = time.monotonic()
+        first = entries[0]['time']
+        lag = 0
+        for entry, request in zip(entries, requests):
+            if speed:
+                delay = ((entry['time'] - first) / speed
+                         - (time.monotonic() - started))
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                else:
+                    lag = max(lag, -delay)
+            await queue.put((entry, request))
+        for _ in workers:
+            await queue.put(None)
+        await asyncio.gather(*workers)
+        return results, time.monotonic() - started, lag
+
+    def report(self, results):
+        """Показатели маршрутов: воспроизведение и исходный журнал."""
+        routes = defaultdict(list)
+        for entry, status, elapsed in results:
+            routes[get_route(entry)].append((entry, status, elapsed))
+        report = {}
+        for route, rows in sorted(routes.items()):
+            captured = summarize(
+                [entry['duration_ms'] for entry, _, _ in rows],
+                [entry['status'] for entry, _, _ in rows],
+            )
+            report[route] = {
+                'count': len(rows),
+                **summarize(
+                    [elapsed for _, _, elapsed in rows],
+                    [status for _, status, _ in rows],
+                ),
+                'status_mismatches': sum(
+                    entry['status'] != status for entry, status, _ in rows
+                ),
+                'captured': captured,
+            }
+        return report
+
+    def write(self, routes, baseline):
+        for route, result in routes.items():
+            if baseline is None:
+                before = result['captured']
+            else:
+                before = baseline.get(route)
+            if before is None:
+                self.stdout.write(f'{route}: нет в отчете')
+                continue
+            line = (
+                f'{route}: {result["count"]} запросов, '
+                f'p50 {before["p50_ms"]:.1f} -> {result["p50_ms"]:.1f} мс, '
+                f'p95 {before["p95_ms"]:.1f} -> {result["p95_ms"]:.1f} мс, '
+                f'ошибок {before["errors"]} -> {result["errors"]}, '
+                f'другой статус: {result["status_mismatches"]}'
+            )
+            if result['errors'] > before['errors']:
+                line = self.style.ERROR(line)
+            elif result['p95_ms'] > before['p95_ms'] * 1.2:
+                line = self.style.WARNING(line)
+            self.stdout.write(line)
+
+    def handle(self, *args, **options):
+        self.host, self.port = options['host'], options['port']
+        entries = read(options['paths'])
+        skipped = sum(
+            entry['method'] not in REPLAYED_METHODS for entry in entries
+        )
+        entries = [
+            entry for entry in entries
+            if entry['method'] in REPLAYED_METHODS
+        ][:options['limit']]
+        if not entries:
+            raise CommandError('В журнале нет запросов для воспроизведения')
+        requests = self.build(entries, self.get_tokens(options['users']))
+        results, elapsed, lag = asyncio.run(self.replay(
+            entries, requests, options['speed'], options['concurrency']
+        ))
+        routes = self.report(results)
+        self.stdout.write(
+            f'Повторено запросов: {len(results)} за {elapsed:.1f} с, '
+            f'пропущено (не {", ".join(REPLAYED_METHODS)}): {skipped}, '
+            f'наибольшее отставание от журнала: {lag * 1000:.0f} мс'
+        )
+        baseline = None
+        if options['compare']:
+            with open(options['compare'], encoding='UTF-8') as file:
+                report = json.load(file)
+            baseline = report['routes']
+            self.stdout.write(
+                f'Сравнение с {report["commit"] or options["compare"]}:'
+            )
+        else:
+            self.stdout.write('Сравнение с журналом:')
+        self.write(routes, baseline)
+        if options['output']:
+            with open(options['output'], 'w', encoding='UTF-8') as file:
+                json.dump({
+                    'commit': get_commit(),
+                    'sources': options['paths'],
+                    'speed': options['speed'],
+                    'concurrency': options['concurrency'],
+                    'elapsed_s': round(elapsed, 3),
+                    'lag_ms': round(lag * 1000, 1),
+                    'routes': routes,
+                }, file, ensure_ascii=False, indent=2)
+            self.stdout.write(self.style.SUCCESS(
+                f'Отчет сохранен: {options["output"]}'
+            ))
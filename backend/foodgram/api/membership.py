@@ -0,0 +1,114 @@
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import router
+from django.utils.module_loading import import_string
+from recipes.models import Carts, Favourites
+from users.models import Subscribe
+
+# Вид членства: модель связи и ее внешний ключ на рецепт или автора.
+KINDS = {
+    "favorites": (Favourites, "recipe"),
+    "carts": (Carts, "recipe"),
+    "subscriptions": (Subscribe, "author"),
+}
+
+MODEL_KINDS = {model: kind for kind, (model, _) in KINDS.items()}
+
+_backend = None
+
+
+class LocalMembershipBackend:
+    """Кэш в памяти процесса с вытеснением по LRU и сроку жизни."""
+
+    def __init__(self, max_entries=10000, timeout=300):
+        self.max_entries = max_entries
+        self.timeout = timeout
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            value, expires = entry
+            if expires < time.monotonic():
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self.lock:
+            self.entries[key] = value, time.monotonic() + self.timeout
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def delete(self, key):
+        with self.lock:
+            self.entries.pop(key, None)
+
+
+class CacheMembershipBackend:
+    """Кэш на бэкенде Django из settings.CACHES, общий для процессов."""
+
+    def __init__(self, alias="default", timeout=300):
+        self.cache = caches[alias]
+        self.timeout = timeout
+
+    def get(self, key):
+        return self.cache.get(key)
+
+    def set(self, key, value):
+        self.cache.set(key, value, self.timeout)
+
+    def delete(self, key):
+        self.cache.delete(key)
+
+
+def get_backend():
+    global _backend
+    if _backend is None:
+        config = settings.MEMBERSHIP_CACHE
+        _backend = import_string(config["BACKEND"])(
+            **config.get("OPTIONS", {})
+        )
+    return _backend
+
+
+def cache_key(user_id, kind):
+    return f"membership:{kind}:{user_id}"
+
+
+def get_member_ids(user, kind):
+    """
+    Множество id рецептов в избранном/корзине или id авторов в подписках.
+
+    При промахе загружается одним запросом из основной БД: запись,
+    заполненная с отстающей реплики, пережила бы сквозную запись.
+    """
+    backend = get_backend()
+    key = cache_key(user.id, kind)
+    ids = backend.get(key)
+    if ids is None:
+        model, field = KINDS[kind]
+        ids = frozenset(
+            model.objects.using(router.db_for_write(model))
+            .filter(user=user).values_list(field, flat=True)
+        )
+        backend.set(key, ids)
+    return ids
+
+
+def update_member_ids(user_id, kind, pks, added):
+    """Сквозная запись: изменение уже загруженного множества."""
+    backend = get_backend()
+    key = cache_key(user_id, kind)
+    ids = backend.get(key)
+    if ids is not None:
+        backend.set(key, ids.union(pks) if added else ids.difference(pks))
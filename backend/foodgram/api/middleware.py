@@ -0,0 +1,140 @@
+import asyncio
+import logging
+import random
+import time
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+
+from . import traffic
+from .queries import collect
+
+logger = logging.getLogger(__name__)
+
+MAX_DUPLICATES = 5
+
+
+def quote(value):
+    value = value.replace("\\", "\\\\").replace('"', '\\"')
+    return f'"{value}"'
+
+
+class QueryInstrumentationMiddleware:
+    """
+    Количество и время запросов к БД в заголовке Server-Timing.
+
+    Включается для всех запросов настройкой QUERY_INSTRUMENTATION или
+    для отдельного запроса заголовком X-Debug-Queries; во втором случае
+    заголовки отдаются, только если пользователь — администратор.
+    Кроме общего числа и времени, показываются повторяющиеся шаблоны
+    запросов (признак N+1).
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if asyncio.iscoroutinefunction(get_response):
+            # Так же, как MiddlewareMixin: экземпляр — корутинная функция.
+            self._is_coroutine = asyncio.coroutines._is_coroutine
+
+    @staticmethod
+    def is_requested(request):
+        return (
+            settings.QUERY_INSTRUMENTATION
+            or "X-Debug-Queries" in request.headers
+        )
+
+    def __call__(self, request):
+        if asyncio.iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not self.is_requested(request):
+            return self.get_response(request)
+        started = time.perf_counter()
+        with collect() as stats:
+            response = self.get_response(request)
+        return self.process_response(request, response, stats, started)
+
+    async def __acall__(self, request):
+        if not self.is_requested(request):
+            return await self.get_response(request)
+        started = time.perf_counter()
+        with collect() as stats:
+            response = await self.get_response(request)
+        return self.process_response(request, response, stats, started)
+
+    @staticmethod
+    def process_response(request, response, stats, started):
+        # Пользователь токена известен только после вьюхи: DRF
+        # записывает его в request.user исходного запроса.
+        user = getattr(request, "user", None)
+        if not settings.QUERY_INSTRUMENTATION and not (
+            user is not None and user.is_staff
+        ):
+            return response
+        duplicates = stats.duplicates()
+        metrics = [
+            f'db;dur={stats.duration * 1000:.1f};'
+            f'desc="{stats.count} queries"',
+            f'dup;desc="{sum(count for _, count in duplicates)} '
+            f'duplicated"',
+            f"app;dur={(time.perf_counter() - started) * 1000:.1f}",
+        ]
+        for number, (sql, count) in enumerate(
+            duplicates[:MAX_DUPLICATES], 1
+        ):
+            metrics.append(f"dup-{number};desc={quote(f'{count}x {sql}')}")
+        if duplicates:
+            logger.debug(
+                "%s %s: повторяющиеся запросы %s",
+                request.method, request.path, duplicates,
+            )
+        response["Server-Timing"] = ", ".join(metrics)
+        return response
+
+
+class TrafficCaptureMiddleware:
+    """
+    Выборка запросов к api в журнал для воспроизведения (replay_traffic).
+
+    Включается настройкой TRAFFIC_CAPTURE_PATH; в журнал попадает доля
+    TRAFFIC_CAPTURE_SAMPLE_RATE запросов: метод, путь, строка запроса,
+    псевдоним пользователя, статус и время ответа. Тела запросов и
+    заголовки не сохраняются.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not settings.TRAFFIC_CAPTURE_PATH:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        if asyncio.iscoroutinefunction(get_response):
+            self._is_coroutine = asyncio.coroutines._is_coroutine
+
+    @staticmethod
+    def is_sampled(request):
+        return (
+            request.path.startswith("/api/")
+            and random.random() < settings.TRAFFIC_CAPTURE_SAMPLE_RATE
+        )
+
+    def __call__(self, request):
+        if asyncio.iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not self.is_sampled(request):
+            return self.get_response(request)
+        started = time.perf_counter()
+        response = self.get_response(request)
+        traffic.record(request, response, time.perf_counter() - started)
+        return response
+
+    async def __acall__(self, request):
+        if not self.is_sampled(request):
+            return await self.get_response(request)
+        started = time.perf_counter()
+        response = await self.get_response(request)
+        traffic.record(request, response, time.perf_counter() - started)
+        return response
@@ -1,5 +1,136 @@
-from rest_framework.pagination import PageNumberPagination
+from collections import OrderedDict
+
+from django.conf import settings
+from rest_framework.pagination import (BasePagination, CursorPagination,
+                                       PageNumberPagination)
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
 
 
 class PageLimitPagination(PageNumberPagination):
     page_size_query_param = "limit"
+
+
+class PantryPagination(PageLimitPagination):
+    """Постраничный вывод рецептов по продуктам, по умолчанию 20."""
+
+    page_size = settings.PANTRY_PAGE_SIZE
+    max_page_size = settings.PANTRY_MAX_PAGE_SIZE
+
+
+class FeedPagination(BasePagination):
+    """
+    Keyset-пагинация ленты по id рецепта: ?before=<id>&limit=<n>.
+
+    Следующая страница начинается после последнего показанного рецепта,
+    поэтому новые рецепты не сдвигают уже прочитанные страницы.
+    """
+
+    before_query_param = "before"
+    limit_query_param = "limit"
+    page_size = settings.FEED_PAGE_SIZE
+    max_page_size = settings.FEED_MAX_PAGE_SIZE
+
+    def get_limit(self, request):
+        limit = request.query_params.get(self.limit_query_param, "")
+        if limit.isdigit() and int(limit) > 0:
+            return min(int(limit), self.max_page_size)
+        return self.page_size
+
+    def get_before(self, request):
+        before = request.query_params.get(self.before_query_param, "")
+        return int(before) if before.isdigit() else None
+
+    def paginate_queryset(self, get_ids, request, view=None):
+        """
+        Страница id рецептов; get_ids(before, limit) — источник ленты.
+
+        Запрашивается на один id больше, чтобы узнать, есть ли
+        следующая страница.
+        """
+        self.request = request
+        limit = self.get_limit(request)
+        ids = get_ids(self.get_before(request), limit + 1)
+        self.last = ids[limit - 1] if len(ids) > limit else None
+        return ids[:limit]
+
+    def get_next_link(self):
+        if self.last is None:
+            return None
+        return replace_query_param(
+            self.request.build_absolute_uri(),
+            self.before_query_param, self.last,
+        )
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ("next", self.get_next_link()),
+            ("results", data),
+        ]))
+
+
+class CursorLimitPagination(CursorPagination):
+    """
+    Keyset-пагинация по id: без OFFSET, с непрозрачным курсором.
+
+    Включается параметром ?paginate=cursor. Общее количество объектов
+    считается, только если не передан ?skip_count=true.
+    """
+
+    page_size_query_param = "limit"
+    skip_count_query_param = "skip_count"
+    ordering = "id"
+
+    def get_ordering(self, request, queryset, view):
+        """Порядок из view.get_cursor_ordering(), если он задан."""
+        get_cursor_ordering = getattr(view, "get_cursor_ordering", None)
+        ordering = get_cursor_ordering() if get_cursor_ordering else None
+        if ordering:
+            return ordering
+        return super().get_ordering(request, queryset, view)
+
+    def paginate_queryset(self, queryset, request, view=None):
+        page = super().paginate_queryset(queryset, request, view)
+        self.count = None
+        skip_count = request.query_params.get(self.skip_count_query_param)
+        if page is not None and skip_count not in ("1", "true", "True"):
+            self.count = queryset.count()
+        return page
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ("count", self.count),
+            ("next", self.get_next_link()),
+            ("previous", self.get_previous_link()),
+            ("results", data),
+        ]))
+
+
+class SubscriptionCursorPagination(CursorLimitPagination):
+    """Keyset-пагинация подписок: сначала новые."""
+
+    ordering = "-subscription_id"
+
+
+class CursorPaginationMixin:
+    """
+    Выбор пагинации во вьюсете.
+
+    По умолчанию используется pagination_class (постраничная), с
+    параметром ?paginate=cursor — cursor_pagination_class.
+    """
+
+    cursor_pagination_class = CursorLimitPagination
+    pagination_mode_query_param = "paginate"
+
+    @property
+    def paginator(self):
+        if not hasattr(self, "_paginator"):
+            mode = self.request.query_params.get(
+                self.pagination_mode_query_param
+            )
+            if mode == "cursor":
+                self._paginator = self.cursor_pagination_class()
+            else:
+                return super().paginator
+        return self._paginator
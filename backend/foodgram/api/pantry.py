@@ -0,0 +1,290 @@
+import logging
+import threading
+import time
+from itertools import chain
+
+import numpy as np
+from django.conf import settings
+from django.db import connection
+from recipes.models import Recipe, RecipeIngredient
+
+from .cache import bump_version, get_version
+
+logger = logging.getLogger(__name__)
+
+_index = None
+_rebuilding = False
+_lock = threading.Lock()
+
+
+def fetch_pairs(queryset, *fields):
+    """Пары id из БД в массив numpy формы (N, 2)."""
+    rows = queryset.values_list(*fields).order_by()
+    pairs = np.fromiter(
+        chain.from_iterable(rows.iterator(chunk_size=10000)), dtype=np.int64
+    )
+    return pairs.reshape(-1, 2)
+
+
+class PantryResult:
+    """
+    Рецепты, найденные по продуктам, в порядке убывания покрытия.
+
+    При равном покрытии выше рецепты, где меньше не хватает, затем
+    где больше совпало, затем новые. Поддерживает len() и срезы,
+    поэтому подходит для пагинатора: при срезе частично сортируются
+    только первые stop рецептов.
+    """
+
+    def __init__(self, recipe_ids, matched, missing):
+        self.recipe_ids = recipe_ids
+        self.matched = matched
+        self.missing = missing
+        self.key = None
+
+    def __len__(self):
+        return len(self.recipe_ids)
+
+    def get_key(self):
+        """Ключ сортировки: место группы (совпало, не хватает) и id."""
+        if self.key is None:
+            shape = (self.matched.max() + 1, self.missing.max() + 1)
+            matched, missing = np.indices(shape)
+            total = np.maximum(matched + missing, 1)
+            order = np.lexsort((-matched.ravel(), missing.ravel(),
+                                -(matched / total).ravel()))
+            ranks = np.empty(order.size, dtype=np.int64)
+            ranks[order] = np.arange(order.size)
+            group = ranks.reshape(shape)[self.matched, self.missing]
+            last_id = int(self.recipe_ids.max()) + 1
+            self.key = group * last_id + (last_id - self.recipe_ids)
+        return self.key
+
+    def __getitem__(self, key):
+        if not isinstance(key, slice):
+            return self[key:key + 1][0]
+        start, stop, _ = key.indices(len(self))
+        if start >= stop:
+            return []
+        sort_key = self.get_key()
+        if stop < len(self):
+            top = np.argpartition(sort_key, stop - 1)[:stop]
+        else:
+            top = np.arange(len(self))
+        page = top[np.argsort(sort_key[top], kind="stable")][start:stop]
+        return list(zip(
+            self.recipe_ids[page].tolist(),
+            self.matched[page].tolist(),
+            self.missing[page].tolist(),
+        ))
+
+
+class PantryIndex:
+    """
+    Обратный индекс «ингредиент -> отсортированный массив id рецептов».
+
+    Для набора продуктов число совпадений у каждого рецепта считается
+    векторно (np.bincount по объединению массивов) без GROUP BY по всей
+    таблице состава, недостающее — по числу ингредиентов в рецепте.
+    Теги хранятся булевыми массивами по id рецепта.
+
+    Массивы ингредиентов, размеры рецептов и теги публикуются одним
+    кортежем state: поиск берет его целиком, а обновление собирает
+    новый и заменяет одним присваиванием.
+    """
+
+    def __init__(self, postings, sizes, tags, version=None):
+        self.state = postings, sizes, tags
+        self.version = version
+        self.built = time.monotonic()
+        self.lock = threading.Lock()
+
+    @property
+    def postings(self):
+        return self.state[0]
+
+    @property
+    def sizes(self):
+        return self.state[1]
+
+    @property
+    def tags(self):
+        return self.state[2]
+
+    @classmethod
+    def build(cls):
+        """Построение индекса по таблице состава рецептов."""
+        version = get_version(Recipe)
+        last_id = Recipe.objects.order_by("-id").values_list(
+            "id", flat=True
+        ).first() or 0
+        pairs = fetch_pairs(
+            RecipeIngredient.objects.all(), "ingredient_id", "recipe_id"
+        )
+        sizes = np.bincount(pairs[:, 1], minlength=last_id + 1)
+        postings, tags = {}, {}
+        add_pairs(postings, pairs)
+        tag_pairs = fetch_pairs(
+            Recipe.tags.through.objects.all(), "tag_id", "recipe_id"
+        )
+        for tag_id, recipe_ids in split_pairs(tag_pairs):
+            tag_flags(tags, tag_id, len(sizes))[recipe_ids] = True
+        return cls(postings, sizes.astype(np.uint16), tags, version)
+
+    def update(self, recipe_ids, deleted=False):
+        """
+        Замена данных рецептов актуальными из БД.
+
+        Опубликованные массивы не меняются: изменения вносятся в копии,
+        которые затем заменяют state, поэтому параллельный поиск не
+        видит данные наполовину измененными.
+        """
+        recipe_ids = sorted(set(recipe_ids))
+        pairs = tag_pairs = np.empty((0, 2), dtype=np.int64)
+        if not deleted:
+            pairs = fetch_pairs(
+                RecipeIngredient.objects.filter(recipe_id__in=recipe_ids),
+                "ingredient_id", "recipe_id",
+            )
+            tag_pairs = fetch_pairs(
+                Recipe.tags.through.objects.filter(recipe_id__in=recipe_ids),
+                "tag_id", "recipe_id",
+            )
+        recipe_ids = np.array(recipe_ids, dtype=np.int64)
+        with self.lock:
+            postings, sizes, tags = self.state
+            size = len(sizes)
+            missing = int(recipe_ids.max()) + 1 - size
+            if missing > 0:
+                size += max(missing, size // 8)
+            postings = dict(postings)
+            if sizes[recipe_ids[recipe_ids < len(sizes)]].any():
+                for ingredient_id, posting in postings.items():
+                    found = np.isin(posting, recipe_ids)
+                    if found.any():
+                        postings[ingredient_id] = posting[~found]
+            sizes = resized(sizes, size)
+            tags = {
+                tag_id: resized(flags, size)
+                for tag_id, flags in tags.items()
+            }
+            sizes[recipe_ids] = 0
+            for flags in tags.values():
+                flags[recipe_ids] = False
+            np.add.at(sizes, pairs[:, 1], 1)
+            add_pairs(postings, pairs)
+            for tag_id, tagged in split_pairs(tag_pairs):
+                tag_flags(tags, tag_id, size)[tagged] = True
+            self.state = postings, sizes, tags
+
+    def search(self, ingredient_ids, max_missing=None, tag_ids=None):
+        """Рецепты, которые можно приготовить из данных продуктов."""
+        postings, sizes, tags = self.state
+        postings = [
+            postings[ingredient_id]
+            for ingredient_id in set(ingredient_ids)
+            if ingredient_id in postings
+        ]
+        if not postings:
+            empty = np.empty(0, dtype=np.int64)
+            return PantryResult(empty, empty, empty)
+        counts = np.bincount(np.concatenate(postings), minlength=len(sizes))
+        recipe_ids = np.flatnonzero(counts)
+        matched = counts[recipe_ids]
+        missing = sizes[recipe_ids].astype(np.int64) - matched
+        keep = np.ones(len(recipe_ids), dtype=bool)
+        if max_missing is not None:
+            keep &= missing <= max_missing
+        if tag_ids is not None:
+            tagged = np.zeros(len(recipe_ids), dtype=bool)
+            for tag_id in tag_ids:
+                if tag_id in tags:
+                    tagged |= tags[tag_id][recipe_ids]
+            keep &= tagged
+        return PantryResult(recipe_ids[keep], matched[keep], missing[keep])
+
+
+def add_pairs(postings, pairs):
+    """Добавление пар (ингредиент, рецепт) в массивы ингредиентов."""
+    for ingredient_id, recipe_ids in split_pairs(pairs):
+        current = postings.get(ingredient_id)
+        if current is not None:
+            recipe_ids = np.union1d(current, recipe_ids)
+        postings[ingredient_id] = recipe_ids.astype(np.int32)
+
+
+def resized(array, size):
+    """Копия массива, дополненная нулями до размера size."""
+    return np.concatenate(
+        (array, np.zeros(size - len(array), dtype=array.dtype))
+    )
+
+
+def tag_flags(tags, tag_id, size):
+    flags = tags.get(tag_id)
+    if flags is None:
+        flags = tags[tag_id] = np.zeros(size, dtype=bool)
+    return flags
+
+
+def split_pairs(pairs):
+    """Группировка пар (ключ, id) по ключу: ключ -> отсортированные id."""
+    if not len(pairs):
+        return
+    order = np.lexsort((pairs[:, 1], pairs[:, 0]))
+    keys, values = pairs[order, 0], pairs[order, 1]
+    starts = np.flatnonzero(np.r_[True, keys[1:] != keys[:-1]])
+    for start, end in zip(starts, np.r_[starts[1:], len(keys)]):
+        yield int(keys[start]), values[start:end]
+
+
+def rebuild():
+    """Перестроение индекса в фоне: до замены работает старый."""
+    global _index, _rebuilding
+    try:
+        index = PantryIndex.build()
+        with _lock:
+            _index = index
+    except Exception:
+        logger.exception("Не удалось перестроить индекс продуктов")
+    finally:
+        connection.close()
+        _rebuilding = False
+
+
+def get_index():
+    """
+    Индекс текущего процесса.
+
+    Первый раз строится при обращении. Изменения рецептов в этом
+    процессе применяются сразу (recipes_changed), а если версия
+    изменилась в другом процессе, индекс перестраивается в фоне не
+    чаще раза в PANTRY_INDEX_REBUILD_INTERVAL секунд.
+    """
+    global _index, _rebuilding
+    version = get_version(Recipe)
+    with _lock:
+        if _index is None:
+            _index = PantryIndex.build()
+        elif (
+            _index.version != version
+            and not _rebuilding
+            and time.monotonic() - _index.built
+            >= settings.PANTRY_INDEX_REBUILD_INTERVAL
+        ):
+            _rebuilding = True
+            threading.Thread(
+                target=rebuild, name="pantry-index", daemon=True
+            ).start()
+        return _index
+
+
+def recipes_changed(recipe_ids, deleted=False):
+    """Обновление индекса после создания, изменения или удаления."""
+    previous = get_version(Recipe)
+    version = bump_version(Recipe)
+    index = _index
+    if index is not None:
+        index.update(recipe_ids, deleted)
+        if index.version == previous:
+            index.version = version
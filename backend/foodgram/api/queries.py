@@ -0,0 +1,83 @@
+import re
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+# Текущий сборщик статистики запросов. Контекстная переменная доходит
+# до потоков sync_to_async, поэтому учитываются и запросы асинхронных
+# вьюх.
+_stats = ContextVar("query_stats", default=None)
+
+PLACEHOLDERS = re.compile(r"\((?:\s*%s\s*,)+\s*%s\s*\)")
+STRINGS = re.compile(r"'(?:[^']|'')*'")
+NUMBERS = re.compile(r"\b\d+\b")
+
+
+def fingerprint(sql):
+    """
+    Шаблон запроса без значений.
+
+    Параметры уже вынесены в %s; литералы и списки IN любой длины
+    заменяются на ?, поэтому N+1 дает N одинаковых отпечатков.
+    """
+    sql = PLACEHOLDERS.sub("(?)", sql)
+    sql = STRINGS.sub("?", sql)
+    sql = NUMBERS.sub("?", sql)
+    return " ".join(sql.split())
+
+
+class QueryStats:
+    """Количество, суммарное время и отпечатки запросов."""
+
+    def __init__(self, parent=None):
+        self.parent = parent
+        self.count = 0
+        self.duration = 0.0
+        self.fingerprints = Counter()
+        self.lock = threading.Lock()
+
+    def add(self, sql, duration):
+        with self.lock:
+            self.count += 1
+            self.duration += duration
+            self.fingerprints[fingerprint(sql)] += 1
+        if self.parent is not None:
+            self.parent.add(sql, duration)
+
+    def duplicates(self):
+        """Повторяющиеся отпечатки: (отпечаток, число) по убыванию."""
+        return [
+            (sql, count)
+            for sql, count in self.fingerprints.most_common()
+            if count > 1
+        ]
+
+
+@contextmanager
+def collect():
+    """Сбор статистики запросов во всех соединениях внутри блока."""
+    stats = QueryStats(parent=_stats.get())
+    token = _stats.set(stats)
+    try:
+        yield stats
+    finally:
+        _stats.reset(token)
+
+
+def record(execute, sql, params, many, context):
+    stats = _stats.get()
+    if stats is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        stats.add(sql, time.perf_counter() - started)
+
+
+def instrument(connection):
+    """Обертка execute соединения; без сборщика почти ничего не стоит."""
+    if record not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record)
@@ -0,0 +1,94 @@
+from django.db import connections, router, transaction
+from recipes import feed, shopping
+from recipes.counters import increment
+
+from .membership import KINDS, MODEL_KINDS, update_member_ids
+
+CREATED = "created"
+EXISTS = "exists"
+DELETED = "deleted"
+NOT_FOUND = "not_found"
+
+
+def insert_new(model, user, field, pks):
+    """
+    Вставка связей user с pks, которых еще нет; id вставленных.
+
+    INSERT ... ON CONFLICT DO NOTHING RETURNING (PostgreSQL, SQLite
+    3.35+): при одновременном добавлении строку получает только одна
+    транзакция, и только она видит ее в результате.
+    """
+    if not pks:
+        return set()
+    connection = connections[router.db_for_write(model)]
+    quote = connection.ops.quote_name
+    meta = model._meta
+    column = quote(meta.get_field(field).column)
+    values = ", ".join(["(%s, %s)"] * len(pks))
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"INSERT INTO {quote(meta.db_table)} "
+            f"({quote(meta.get_field('user').column)}, {column}) "
+            f"VALUES {values} ON CONFLICT DO NOTHING RETURNING {column}",
+            [value for pk in pks for value in (user.id, pk)],
+        )
+        return {row[0] for row in cursor.fetchall()}
+
+
+def add_relations(model, user, pks):
+    """
+    Добавление рецептов (авторов) в избранное, корзину или подписки.
+
+    Повторное или одновременное добавление не приводит к ошибке, а
+    счетчики, лента и список покупок меняются только для реально
+    вставленных строк. Возвращает статус для каждого id: created,
+    exists или not_found.
+    """
+    kind = MODEL_KINDS[model]
+    field = KINDS[kind][1]
+    target = model._meta.get_field(field).related_model
+    pks = list(dict.fromkeys(pks))
+    with transaction.atomic():
+        found = set(
+            target.objects.filter(pk__in=pks).values_list("pk", flat=True)
+        )
+        created = insert_new(model, user, field, sorted(found))
+        if created:
+            increment(model, created)
+            if kind == "subscriptions":
+                feed.backfill(user, created)
+            elif kind == "carts":
+                shopping.add_recipes(user, created)
+            transaction.on_commit(
+                lambda: update_member_ids(user.id, kind, created, True)
+            )
+    return {
+        pk: CREATED if pk in created else EXISTS if pk in found else NOT_FOUND
+        for pk in pks
+    }
+
+
+def remove_relations(model, user, pks):
+    """
+    Удаление из избранного, корзины или подписок одним delete().
+
+    Удаляемые строки сначала блокируются (SELECT ... FOR UPDATE):
+    одновременное удаление ждет фиксации первого и уже не видит их,
+    поэтому лента и список покупок меняются один раз. Возвращает
+    статус для каждого id: deleted или not_found.
+    """
+    kind = MODEL_KINDS[model]
+    field = KINDS[kind][1]
+    pks = list(dict.fromkeys(pks))
+    with transaction.atomic():
+        queryset = model.objects.filter(user=user, **{f"{field}__in": pks})
+        deleted = set(
+            queryset.select_for_update().order_by("pk")
+            .values_list(field, flat=True)
+        )
+        queryset.filter(**{f"{field}__in": deleted}).delete()
+        if deleted and kind == "subscriptions":
+            feed.prune(user, deleted)
+        elif deleted and kind == "carts":
+            shopping.remove_recipes(user, deleted)
+    return {pk: DELETED if pk in deleted else NOT_FOUND for pk in pks}
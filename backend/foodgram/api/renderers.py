@@ -0,0 +1,171 @@
+import csv
+import tempfile
+from abc import ABCMeta, abstractmethod
+
+from django.conf import settings
+from reportlab.lib.pagesizes import A4
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfbase.ttfonts import TTFont
+from reportlab.pdfgen import canvas
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+CHUNK_SIZE = 64 * 1024
+
+# Экранирование разделителей строк, как в JSONRenderer DRF.
+LINE_SEPARATORS = (
+    ("\u2028".encode(), b"\\u2028"),
+    ("\u2029".encode(), b"\\u2029"),
+)
+
+
+class Echo:
+    """Псевдо-файл для csv.writer: возвращает записанную строку."""
+
+    @staticmethod
+    def write(value):
+        return value
+
+
+class FastJSONRenderer(JSONRenderer):
+    """
+    JSON-рендерер на orjson; ответ побайтно тот же, что у JSONRenderer.
+
+    Типы, которых orjson не знает, а также дата и время (у DRF свой
+    формат) передаются JSONEncoder DRF. Без orjson используется один
+    заранее созданный кодировщик стандартной библиотеки. С отступами
+    (?indent=, Browsable API) и без UNICODE_JSON/COMPACT_JSON работает
+    рендерер DRF.
+    """
+
+    encoder = None
+
+    def get_encoder(self):
+        if self.encoder is None:
+            type(self).encoder = self.encoder_class(
+                ensure_ascii=False, allow_nan=not self.strict,
+                separators=(",", ":"),
+            )
+        return self.encoder
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if (
+            data is None or self.ensure_ascii or not self.compact
+            or self.get_indent(accepted_media_type, renderer_context or {})
+            is not None
+        ):
+            return super().render(
+                data, accepted_media_type, renderer_context
+            )
+        if orjson is None:
+            content = self.get_encoder().encode(data).encode()
+        else:
+            try:
+                content = orjson.dumps(
+                    data,
+                    default=self.get_encoder().default,
+                    option=(orjson.OPT_PASSTHROUGH_DATETIME
+                            | orjson.OPT_NON_STR_KEYS),
+                )
+            except orjson.JSONEncodeError:
+                # Целые больше 64 бит, циклические ссылки и т.п.
+                return super().render(
+                    data, accepted_media_type, renderer_context
+                )
+        for separator, escaped in LINE_SEPARATORS:
+            if separator in content:
+                content = content.replace(separator, escaped)
+        return content
+
+
+class ShoppingListRenderer(BaseRenderer, metaclass=ABCMeta):
+    """
+    Базовый рендерер списка покупок.
+
+    Сам список отдается потоком через stream(), а render() нужен
+    только для ответов с ошибками (401, 404 и т.п.).
+    """
+
+    charset = "utf-8"
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if isinstance(data, dict):
+            data = "\n".join(str(value) for value in data.values())
+        return str(data or "").encode(self.charset or "utf-8")
+
+    @abstractmethod
+    def stream(self, rows):
+        """Генератор частей файла по строкам (название, единица, сумма)."""
+
+
+class ShoppingListTXTRenderer(ShoppingListRenderer):
+    """Список покупок в виде текстового файла."""
+
+    media_type = "text/plain"
+    format = "txt"
+
+    def stream(self, rows):
+        for name, unit, amount in rows:
+            yield f"{name}-{amount} {unit}\n".encode(self.charset)
+
+
+class ShoppingListCSVRenderer(ShoppingListRenderer):
+    """Список покупок в формате CSV."""
+
+    media_type = "text/csv"
+    format = "csv"
+
+    def stream(self, rows):
+        writer = csv.writer(Echo())
+        yield writer.writerow(
+            ("Ингредиент", "Количество", "Единица измерения")
+        ).encode(self.charset)
+        for name, unit, amount in rows:
+            yield writer.writerow((name, amount, unit)).encode(self.charset)
+
+
+class ShoppingListPDFRenderer(ShoppingListRenderer):
+    """
+    Список покупок в формате PDF.
+
+    PDF нельзя писать построчно (в конце файла таблица смещений),
+    поэтому документ сначала собирается во временный файл
+    и уже из него отдается частями.
+    """
+
+    media_type = "application/pdf"
+    format = "pdf"
+    charset = None
+    font_name = "ShoppingListFont"
+    font_size = 12
+    margin = 50
+
+    def stream(self, rows):
+        if self.font_name not in pdfmetrics.getRegisteredFontNames():
+            pdfmetrics.registerFont(
+                TTFont(self.font_name, settings.SHOPPING_LIST_PDF_FONT)
+            )
+        width, height = A4
+        with tempfile.SpooledTemporaryFile(max_size=CHUNK_SIZE) as output:
+            pdf = canvas.Canvas(output, pagesize=A4, pageCompression=1)
+            pdf.setFont(self.font_name, self.font_size)
+            position = height - self.margin
+            for name, unit, amount in rows:
+                if position < self.margin:
+                    pdf.showPage()
+                    pdf.setFont(self.font_name, self.font_size)
+                    position = height - self.margin
+                pdf.drawString(self.margin, position,
+                               f"{name} - {amount} {unit}")
+                position -= self.font_size * 1.5
+            pdf.save()
+            output.seek(0)
+            while True:
+                chunk = output.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                yield chunk
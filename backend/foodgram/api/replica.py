@@ -0,0 +1,129 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS
+from rest_framework.permissions import SAFE_METHODS
+
+REPLICA = "replica"
+PIN_COOKIE = "replica_pin"
+
+# Контекстная переменная, а не thread-local: значение доходит и до
+# потоков sync_to_async в асинхронных вьюхах.
+_use_replica = ContextVar("use_replica", default=False)
+
+
+def has_replica():
+    return REPLICA in settings.DATABASES
+
+
+def pin_key(user_id):
+    return f"replica_pin:{user_id}"
+
+
+def pin(request):
+    """
+    Чтение из основной БД после записи пользователя.
+
+    Закрепление действует REPLICA_PIN_SECONDS секунд — дольше обычного
+    отставания реплики, — и пользователь сразу видит свои изменения.
+    Кроме кэша оно передается подписанной cookie (set_pin_cookie):
+    cookie доходит до любого воркера, даже если кэш у них не общий.
+    """
+    user = request.user
+    if has_replica() and user.is_authenticated:
+        cache.set(pin_key(user.id), True, settings.REPLICA_PIN_SECONDS)
+        request.replica_pin = True
+
+
+def set_pin_cookie(request, response):
+    if getattr(request, "replica_pin", False):
+        response.set_signed_cookie(
+            PIN_COOKIE, request.user.id, salt=PIN_COOKIE,
+            max_age=settings.REPLICA_PIN_SECONDS, httponly=True,
+            samesite="Lax",
+        )
+    return response
+
+
+def is_pinned(request):
+    """Закреплен ли пользователь запроса: кэш или cookie с его id."""
+    user = request.user
+    if not user.is_authenticated:
+        return False
+    if cache.get(pin_key(user.id)) is not None:
+        return True
+    # Подпись с меткой времени: срок проверяется на сервере.
+    user_id = request.get_signed_cookie(
+        PIN_COOKIE, default=None, salt=PIN_COOKIE,
+        max_age=settings.REPLICA_PIN_SECONDS,
+    )
+    return user_id == str(user.id)
+
+
+def route_reads(request=None):
+    """Чтение с реплики до конца запроса, если он не закреплен."""
+    if has_replica() and not (request is not None and is_pinned(request)):
+        _use_replica.set(True)
+
+
+@contextmanager
+def routing_scope():
+    """Границы запроса: по умолчанию чтение из основной БД."""
+    token = _use_replica.set(False)
+    try:
+        yield
+    finally:
+        _use_replica.reset(token)
+
+
+class ReplicaRouter:
+    """
+    Чтение с реплики внутри запросов, отмеченных route_reads().
+
+    Запись всегда идет в основную БД, в том числе для объектов,
+    прочитанных с реплики. Миграции применяются только к основной БД.
+    """
+
+    def db_for_read(self, model, **hints):
+        return REPLICA if _use_replica.get() else None
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = {DEFAULT_DB_ALIAS, REPLICA}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, **hints):
+        return db != REPLICA
+
+
+class ReplicaReadMixin:
+    """
+    Запросы SAFE_METHODS вьюсета читают с реплики, если она задана.
+
+    Решение принимается после аутентификации: токен всегда проверяется
+    по основной БД (только что выданный токен мог не дойти до реплики),
+    а запись пользователя закрепляет его чтения за основной БД.
+    """
+
+    def dispatch(self, request, *args, **kwargs):
+        with routing_scope():
+            return super().dispatch(request, *args, **kwargs)
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        if request.method in SAFE_METHODS:
+            route_reads(request)
+        else:
+            pin(request)
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(
+            request, response, *args, **kwargs
+        )
+        return set_pin_cookie(request, response)
@@ -0,0 +1,23 @@
+from .urls import router
+
+# Маршруты api/urls.py не из роутера (djoser.urls.authtoken).
+EXTRA_ROUTES = {
+    "login": ("post",),
+    "logout": ("post",),
+}
+
+
+def get_routes():
+    """Все маршруты api: имя -> (параметр id для detail, методы)."""
+    routes = {
+        name: (None, methods) for name, methods in EXTRA_ROUTES.items()
+    }
+    for _, viewset, basename in router.registry:
+        lookup = viewset.lookup_url_kwarg or viewset.lookup_field
+        for route in router.get_routes(viewset):
+            methods = router.get_method_map(viewset, route.mapping)
+            if methods:
+                routes[route.name.format(basename=basename)] = (
+                    lookup if route.detail else None, tuple(methods)
+                )
+    return routes
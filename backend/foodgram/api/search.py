@@ -0,0 +1,124 @@
+import heapq
+import threading
+import time
+from bisect import bisect_left
+from itertools import chain
+
+from django.conf import settings
+from django.db.models import Count
+from recipes.models import Ingredient, Recipe, RecipeIngredient
+
+from .cache import get_version
+
+_index = None
+_lock = threading.Lock()
+
+
+def normalize(value):
+    """Приведение строки к виду для поиска: регистр и ё -> е."""
+    return value.casefold().replace("ё", "е").strip()
+
+
+class IngredientIndex:
+    """
+    Индекс ингредиентов для автодополнения.
+
+    Нормализованные названия хранятся отсортированным массивом, поэтому
+    совпадения по началу названия находятся бинарным поиском. Если их
+    меньше лимита, добавляются совпадения по подстроке. Внутри каждой
+    группы выше те ингредиенты, которые чаще используются в рецептах.
+    """
+
+    def __init__(self, ingredients, usage, version=None,
+                 usage_version=None):
+        self.version = version
+        self.usage_version = usage_version
+        self.built = time.monotonic()
+        self.items = {}
+        keys = []
+        for pk, name, measurement_unit in ingredients:
+            self.items[pk] = {
+                "id": pk,
+                "name": name,
+                "measurement_unit": measurement_unit,
+            }
+            keys.append((normalize(name), pk))
+        keys.sort()
+        self.names = [name for name, _ in keys]
+        self.ids = [pk for _, pk in keys]
+        self.usage = usage
+
+    @classmethod
+    def build(cls):
+        """Построение индекса по таблице ингредиентов."""
+        version = get_version(Ingredient)
+        usage_version = get_version(Recipe)
+        usage = dict(
+            RecipeIngredient.objects.values("ingredient")
+            .annotate(total=Count("id"))
+            .values_list("ingredient", "total")
+        )
+        ingredients = Ingredient.objects.values_list(
+            "id", "name", "measurement_unit"
+        )
+        return cls(ingredients.iterator(), usage, version, usage_version)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def rank(self, position):
+        return -self.usage.get(self.ids[position], 0), position
+
+    def search(self, query, limit):
+        """Топ-N ингредиентов по запросу."""
+        query = normalize(query)
+        if not query or limit <= 0:
+            return []
+        start = bisect_left(self.names, query)
+        end = bisect_left(self.names, query + "\U0010ffff", start)
+        found = heapq.nsmallest(limit, range(start, end), key=self.rank)
+        if len(found) < limit:
+            substring = (
+                position
+                for position in chain(range(start),
+                                      range(end, len(self.names)))
+                if query in self.names[position]
+            )
+            found += heapq.nsmallest(
+                limit - len(found), substring, key=self.rank
+            )
+        return [self.items[self.ids[position]] for position in found]
+
+
+def is_stale(index):
+    """
+    Индекс устарел: изменился справочник ингредиентов или (не чаще раза
+    в INGREDIENT_USAGE_REFRESH_INTERVAL секунд) рецепты, по которым
+    считается частота использования.
+    """
+    if index is None or index.version != get_version(Ingredient):
+        return True
+    return (
+        time.monotonic() - index.built
+        >= settings.INGREDIENT_USAGE_REFRESH_INTERVAL
+        and index.usage_version != get_version(Recipe)
+    )
+
+
+def get_index():
+    """
+    Индекс текущего процесса.
+
+    Строится при первом обращении и перестраивается, когда меняется
+    версия справочника ингредиентов или устаревает частота
+    использования (в том числе после изменений в другом процессе,
+    если кэш общий).
+    """
+    global _index
+    index = _index
+    if is_stale(index):
+        with _lock:
+            if is_stale(_index):
+                _index = IngredientIndex.build()
+            index = _index
+    return index
@@ -1,16 +1,23 @@
+from collections import defaultdict
+
 import djoser.serializers
+from django.conf import settings
 from django.db import transaction
+from django.db.models import Prefetch, prefetch_related_objects
+from django.db.models.fields.files import FieldFile
 from django.shortcuts import get_object_or_404
 from djoser.serializers import UserCreateSerializer, UserSerializer
 from drf_base64.fields import Base64ImageField
-from recipes.models import (Carts, Favourites, Ingredient, Recipe,
-                            RecipeIngredient, Tag)
+from recipes import minhash, shopping
+from recipes.images import variant_name
+from recipes.models import Ingredient, Recipe, RecipeIngredient, Tag
 from rest_framework import serializers, status
-from rest_framework.exceptions import ValidationError
+from rest_framework.exceptions import NotFound, ValidationError
 from rest_framework.fields import IntegerField, SerializerMethodField
-from rest_framework.relations import PrimaryKeyRelatedField
 from rest_framework.serializers import ModelSerializer
-from users.models import Subscribe, User
+from users.models import User
+
+from .membership import get_member_ids
 
 
 class CustomUserCreateSerializer(UserCreateSerializer):
@@ -40,7 +47,53 @@ class CustomUserCreateSerializer(UserCreateSerializer):
         return data
 
 
-class CustomUserSerializer(UserSerializer):
+class RecipeImageField(Base64ImageField):
+    """
+    Изображение рецепта: ссылка на превью в WebP нужного размера.
+
+    Без variant размер выбирается по действию: "list" для списка,
+    "detail" для остального. Пока превью не создано, отдается оригинал.
+    """
+
+    def __init__(self, variant=None, **kwargs):
+        self.variant = variant
+        super().__init__(**kwargs)
+
+    def get_variant(self):
+        if self.variant is not None:
+            return self.variant
+        view = self.context.get("view")
+        if getattr(view, "action", None) == "list":
+            return "list"
+        return "detail"
+
+    def to_representation(self, value):
+        if not value:
+            return None
+        name = variant_name(value.name, self.get_variant())
+        if not value.storage.exists(name):
+            return super().to_representation(value)
+        url = value.storage.url(name)
+        request = self.context.get("request")
+        if request is not None:
+            return request.build_absolute_uri(url)
+        return url
+
+
+class MembershipMixin:
+    """Проверка избранного, корзины и подписок по кэшу членства."""
+
+    def is_member(self, kind, pk):
+        user = self.context.get("request").user
+        if user.is_anonymous:
+            return False
+        key = f"member_ids_{kind}"
+        if key not in self.context:
+            self.context[key] = get_member_ids(user, kind)
+        return pk in self.context[key]
+
+
+class CustomUserSerializer(MembershipMixin, UserSerializer):
     """Сериализатор модели пользователей."""
 
     is_subscribed = serializers.SerializerMethodField()
@@ -59,10 +112,11 @@ class CustomUserSerializer(UserSerializer):
         user = self.context.get("request").user
         if user.is_anonymous or (user == obj):
             return False
-        return Subscribe.objects.filter(user=user, author=obj).exists()
+        return self.is_member("subscriptions", obj.id)
 
 
-class SubscribeSerializer(djoser.serializers.UserSerializer):
+class SubscribeSerializer(MembershipMixin,
+                          djoser.serializers.UserSerializer):
     """Сериализатор получение списка подписок."""
 
     recipes_count = serializers.SerializerMethodField()
@@ -94,29 +148,42 @@ class SubscribeSerializer(djoser.serializers.UserSerializer):
             )
         return data
 
-    @staticmethod
-    def get_recipes(obj):
-        """Получение рецептов у подписки."""
-        author = obj.recipes.all()
-        return RecipeSubscribedSerializer(author, many=True).data
+    def get_recipes(self, obj):
+        """
+        Получение рецептов у подписки.
+
+        Если рецепты уже выбраны для всей страницы (latest_recipes),
+        повторный запрос не делается. Количество ограничивается
+        параметром recipes_limit из контекста.
+        """
+        if hasattr(obj, "latest_recipes"):
+            recipes = obj.latest_recipes
+        else:
+            recipes = obj.recipes.order_by("-id")
+            recipes_limit = self.context.get("recipes_limit")
+            if recipes_limit is not None:
+                recipes = recipes[:recipes_limit]
+        return RecipeSubscribedSerializer(recipes, many=True).data
 
     @staticmethod
     def get_recipes_count(obj):
         """Получения кол-ва рецептов у подписки."""
-        return obj.recipes.count()
+        return obj.recipes_count
 
     def get_is_subscribed(self, obj):
         """Флаг на подписку пользователя."""
         user = self.context.get("request").user
         if user.is_anonymous or (user == obj):
             return False
-        return Subscribe.objects.filter(user=user, author=obj).exists()
+        if hasattr(obj, "is_subscribed"):
+            return obj.is_subscribed
+        return self.is_member("subscriptions", obj.id)
 
 
 class RecipeSubscribedSerializer(ModelSerializer):
     """Сериализатор для получения рецепта в страницу подписок."""
 
-    image = Base64ImageField(use_url=True)
+    image = RecipeImageField(variant="list", use_url=True)
 
     class Meta:
         model = Recipe
@@ -176,7 +243,7 @@ class TagSerializer(ModelSerializer):
         fields = "__all__"
 
 
-class RecipeReadSerializer(ModelSerializer):
+class RecipeReadSerializer(MembershipMixin, ModelSerializer):
     """Сериализатор чтения рецептов."""
 
     tags = TagSerializer(many=True, read_only=True)
@@ -184,7 +251,7 @@ class RecipeReadSerializer(ModelSerializer):
     ingredients = serializers.SerializerMethodField()
     is_favorited = serializers.SerializerMethodField()
     is_in_shopping_cart = serializers.SerializerMethodField()
-    image = Base64ImageField(use_url=True)
+    image = RecipeImageField(use_url=True)
 
     class Meta:
         model = Recipe
@@ -204,22 +271,105 @@ class RecipeReadSerializer(ModelSerializer):
     @staticmethod
     def get_ingredients(obj):
         """Получение ингредиентов к рецепту."""
-        ingredients = RecipeIngredient.objects.filter(recipe=obj)
+        ingredients = obj.RecipeIngredient.all()
         return IngredientRecipeSerializer(ingredients, many=True).data
 
     def get_is_favorited(self, obj):
         """Возвращает флаг о нахождении рецепта в избранном."""
-        user = self.context.get("request").user
-        if user.is_anonymous:
-            return False
-        return Favourites.objects.filter(user=user, recipe=obj).exists()
+        return self.is_member("favorites", obj.id)
 
     def get_is_in_shopping_cart(self, obj):
         """Возвращает флаг о нахождении рецепта в корзине."""
+        return self.is_member("carts", obj.id)
+
+
+class RecipeLeanSerializer(MembershipMixin, serializers.BaseSerializer):
+    """
+    Чтение рецептов из строк values() без экземпляров моделей.
+
+    JSON тот же, что у RecipeReadSerializer. Строки выбирает
+    get_rows(), теги и ингредиенты страницы добавляет load().
+    """
+
+    row_fields = (
+        "id",
+        "name",
+        "image",
+        "text",
+        "cooking_time",
+        "author_id",
+        "author__email",
+        "author__username",
+        "author__first_name",
+        "author__last_name",
+    )
+    tag_fields = ("id", "name", "color", "slug")
+    ingredient_fields = ("id", "name", "amount", "measurement_unit")
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.image_field = RecipeImageField(use_url=True)
+        self.image_field.bind("image", self)
+
+    @classmethod
+    def get_rows(cls, queryset):
+        """Строки рецептов с аннотациями queryset (search_rank курсора)."""
+        return queryset.values(*cls.row_fields, *queryset.query.annotations)
+
+    @classmethod
+    def load(cls, rows):
+        """Теги и ингредиенты рецептов страницы, по запросу на каждые."""
+        rows = list(rows)
+        ids = [row["id"] for row in rows]
+        tags = defaultdict(list)
+        for recipe_id, *tag in (
+            Recipe.tags.through.objects.filter(recipe_id__in=ids)
+            .order_by("tag_id")
+            .values_list("recipe_id", "tag_id", "tag__name", "tag__color",
+                         "tag__slug")
+        ):
+            tags[recipe_id].append(dict(zip(cls.tag_fields, tag)))
+        ingredients = defaultdict(list)
+        for recipe_id, *ingredient in (
+            RecipeIngredient.objects.filter(recipe_id__in=ids)
+            .order_by("id")
+            .values_list("recipe_id", "ingredient_id", "ingredient__name",
+                         "amount", "ingredient__measurement_unit")
+        ):
+            ingredients[recipe_id].append(
+                dict(zip(cls.ingredient_fields, ingredient))
+            )
+        for row in rows:
+            row["tags"] = tags[row["id"]]
+            row["ingredients"] = ingredients[row["id"]]
+        return rows
+
+    def to_representation(self, row):
         user = self.context.get("request").user
-        if user.is_anonymous:
-            return False
-        return Carts.objects.filter(user=user, recipe=obj).exists()
+        author_id = row["author_id"]
+        image = FieldFile(None, Recipe._meta.get_field("image"), row["image"])
+        return {
+            "id": row["id"],
+            "tags": row["tags"],
+            "author": {
+                "email": row["author__email"],
+                "id": author_id,
+                "username": row["author__username"],
+                "first_name": row["author__first_name"],
+                "last_name": row["author__last_name"],
+                "is_subscribed": (
+                    not user.is_anonymous and user.id != author_id
+                    and self.is_member("subscriptions", author_id)
+                ),
+            },
+            "ingredients": row["ingredients"],
+            "is_favorited": self.is_member("favorites", row["id"]),
+            "is_in_shopping_cart": self.is_member("carts", row["id"]),
+            "name": row["name"],
+            "image": self.image_field.to_representation(image),
+            "text": row["text"],
+            "cooking_time": row["cooking_time"],
+        }
 
 
 class IngredientInRecipeWriteSerializer(ModelSerializer):
@@ -235,9 +385,7 @@ class IngredientInRecipeWriteSerializer(ModelSerializer):
 class RecipeWriteSerializer(ModelSerializer):
     """Сериализатор добавление и редактирования рецепта."""
 
-    tags = PrimaryKeyRelatedField(
-        queryset=Tag.objects.all().values_list("id", "name"), many=True
-    )
+    tags = serializers.ListField(child=IntegerField())
     author = CustomUserSerializer(read_only=True)
     ingredients = IngredientInRecipeWriteSerializer(many=True)
     image = Base64ImageField(use_url=True)
@@ -254,17 +402,32 @@ class RecipeWriteSerializer(ModelSerializer):
             "author",
         )
 
+    @staticmethod
+    def validate_tags(value):
+        """Проверка существования тегов одним запросом."""
+        tags = list(dict.fromkeys(value))
+        existing = set(
+            Tag.objects.filter(id__in=tags).values_list("id", flat=True)
+        )
+        for tag in tags:
+            if tag not in existing:
+                raise ValidationError(
+                    f'Недопустимый первичный ключ "{tag}" - '
+                    f"объект не существует."
+                )
+        return tags
+
     @staticmethod
     def validate_ingredients(value):
+        """Проверка ингредиентов: один запрос на все id, дубли по set."""
         ingredients = value
         if not ingredients:
             raise ValidationError(
                 {"ingredients": "Нужен хотя бы один ингредиент!"}
             )
-        ingredients_list = []
+        ids = set()
         for item in ingredients:
-            ingredient = get_object_or_404(Ingredient, id=item["id"])
-            if ingredient in ingredients_list:
+            if item["id"] in ids:
                 raise ValidationError(
                     {"ingredients": "Ингридиенты не могут повторяться!"}
                 )
@@ -272,7 +435,9 @@ class RecipeWriteSerializer(ModelSerializer):
                 raise ValidationError(
                     {"amount": "Количество ингредиента должно быть больше 0!"}
                 )
-            ingredients_list.append(ingredient)
+            ids.add(item["id"])
+        if Ingredient.objects.filter(id__in=ids).count() != len(ids):
+            raise NotFound("Ингредиент не найден.")
         return value
 
     @transaction.atomic
@@ -290,10 +455,45 @@ class RecipeWriteSerializer(ModelSerializer):
         )
 
     @transaction.atomic
-    def create_tags(self, recipe, tags):
-        """Добавление тэгов к созданному рецепту."""
-        for tag in tags:
-            recipe.tags.add(int(tag[0]))
+    def update_ingredients_amounts(self, ingredients, recipe):
+        """
+        Изменение ингредиентов рецепта по разнице с сохраненными.
+
+        Новые строки добавляются, удаленные удаляются, а у оставшихся
+        обновляется только изменившееся количество. Разница переносится
+        в списки покупок тех, у кого рецепт в корзине.
+        """
+        current = {
+            item.ingredient_id: item for item in recipe.RecipeIngredient.all()
+        }
+        amounts = {item["id"]: item["amount"] for item in ingredients}
+        deltas = {
+            ingredient_id: -item.amount
+            for ingredient_id, item in current.items()
+        }
+        for ingredient_id, amount in amounts.items():
+            deltas[ingredient_id] = deltas.get(ingredient_id, 0) + amount
+        removed = [
+            item.id for ingredient_id, item in current.items()
+            if ingredient_id not in amounts
+        ]
+        changed = []
+        for ingredient_id, amount in amounts.items():
+            item = current.get(ingredient_id)
+            if item is not None and item.amount != amount:
+                item.amount = amount
+                changed.append(item)
+        if removed:
+            RecipeIngredient.objects.filter(id__in=removed).delete()
+        if changed:
+            RecipeIngredient.objects.bulk_update(changed, ["amount"])
+        self.create_ingredients_amounts(
+            ingredients=[
+                item for item in ingredients if item["id"] not in current
+            ],
+            recipe=recipe,
+        )
+        shopping.change_recipe(recipe, deltas)
 
     @transaction.atomic
     def create(self, validated_data):
@@ -301,26 +501,35 @@ class RecipeWriteSerializer(ModelSerializer):
         tags = validated_data.pop("tags")
         ingredients = validated_data.pop("ingredients")
         recipe = Recipe.objects.create(**validated_data)
-        self.create_tags(recipe=recipe, tags=tags)
+        recipe.tags.set(tags)
         self.create_ingredients_amounts(recipe=recipe, ingredients=ingredients)
+        minhash.store({recipe: [item["id"] for item in ingredients]})
         return recipe
 
     @transaction.atomic
     def update(self, instance, validated_data):
         """Редактирование рецепта."""
-        tags = validated_data.pop("tags")
-        ingredients = validated_data.pop("ingredients")
+        tags = validated_data.pop("tags", None)
+        ingredients = validated_data.pop("ingredients", None)
         instance = super().update(instance, validated_data)
-        instance.tags.clear()
-        RecipeIngredient.objects.filter(recipe=instance).delete()
-        self.create_tags(recipe=instance, tags=tags)
-        self.create_ingredients_amounts(recipe=instance,
-                                        ingredients=ingredients)
-        instance.save()
+        if tags is not None:
+            instance.tags.set(tags)
+        if ingredients is not None:
+            self.update_ingredients_amounts(recipe=instance,
+                                            ingredients=ingredients)
+            minhash.store({instance: [item["id"] for item in ingredients]})
         return instance
 
     def to_representation(self, instance):
         """Возвращаемый объект после изменения."""
+        prefetch_related_objects(
+            [instance],
+            "tags",
+            Prefetch(
+                "RecipeIngredient",
+                queryset=RecipeIngredient.objects.select_related("ingredient"),
+            ),
+        )
         request = self.context.get("request")
         context = {"request": request}
         return RecipeReadSerializer(instance, context=context).data
@@ -329,8 +538,56 @@ class RecipeWriteSerializer(ModelSerializer):
 class RecipeShortSerializer(ModelSerializer):
     """Сериализатор рецепта. """
 
-    image = Base64ImageField(use_url=True)
+    image = RecipeImageField(variant="list", use_url=True)
 
     class Meta:
         model = Recipe
         fields = ("id", "name", "image", "cooking_time")
+
+
+class RecipeSimilarSerializer(RecipeShortSerializer):
+    """Краткий рецепт с оценкой сходства."""
+
+    score = serializers.FloatField(read_only=True)
+
+    class Meta(RecipeShortSerializer.Meta):
+        fields = RecipeShortSerializer.Meta.fields + ("score",)
+
+
+class IdListSerializer(serializers.Serializer):
+    """Список id рецептов или авторов для пакетных операций."""
+
+    ids = serializers.ListField(
+        child=IntegerField(min_value=1),
+        allow_empty=False,
+        max_length=settings.BATCH_MAX_SIZE,
+    )
+
+
+class PantryQuerySerializer(serializers.Serializer):
+    """Параметры поиска рецептов по продуктам."""
+
+    ingredients = serializers.ListField(
+        child=IntegerField(min_value=1),
+        allow_empty=False,
+        max_length=settings.PANTRY_MAX_INGREDIENTS,
+    )
+    missing = IntegerField(min_value=0, required=False)
+    tags = serializers.ListField(
+        child=serializers.SlugField(), required=False
+    )
+
+
+class PantryRecipeSerializer(RecipeReadSerializer):
+    """Рецепт с числом совпавших и недостающих ингредиентов."""
+
+    matched = IntegerField(read_only=True)
+    missing = IntegerField(read_only=True)
+    coverage = serializers.FloatField(read_only=True)
+
+    class Meta(RecipeReadSerializer.Meta):
+        fields = RecipeReadSerializer.Meta.fields + (
+            "matched",
+            "missing",
+            "coverage",
+        )
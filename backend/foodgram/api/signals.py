@@ -0,0 +1,99 @@
+from django.db import transaction
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from recipes.models import Carts, Favourites, Ingredient, Recipe, Tag
+from rest_framework.authtoken.models import Token
+from users.models import Subscribe, User, credentials_updated
+
+from .authentication import evict
+from .cache import bump_version
+from .membership import KINDS, MODEL_KINDS, update_member_ids
+from .pantry import recipes_changed
+from .queries import instrument
+
+
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+@receiver(post_save, sender=Ingredient)
+@receiver(post_delete, sender=Ingredient)
+def catalogue_changed(sender, **kwargs):
+    """
+    Новая версия справочника после изменения тегов или ингредиентов.
+
+    По ней сбрасываются закэшированные ответы и индекс поиска.
+    """
+    bump_version(sender)
+
+
+def update_membership(sender, instance, added):
+    """Обновление кэша членства после фиксации транзакции."""
+    kind = MODEL_KINDS[sender]
+    pk = getattr(instance, f"{KINDS[kind][1]}_id")
+    transaction.on_commit(
+        lambda: update_member_ids(instance.user_id, kind, {pk}, added)
+    )
+
+
+@receiver(post_save, sender=Favourites)
+@receiver(post_save, sender=Carts)
+@receiver(post_save, sender=Subscribe)
+def membership_created(sender, instance, created, **kwargs):
+    if created:
+        update_membership(sender, instance, added=True)
+
+
+@receiver(post_delete, sender=Favourites)
+@receiver(post_delete, sender=Carts)
+@receiver(post_delete, sender=Subscribe)
+def membership_deleted(sender, instance, **kwargs):
+    update_membership(sender, instance, added=False)
+
+
+@receiver(post_save, sender=Recipe)
+def recipe_saved(sender, instance, **kwargs):
+    """
+    Обновление индекса продуктов после фиксации транзакции.
+
+    К этому моменту ингредиенты и теги рецепта уже записаны.
+    """
+    pk = instance.pk
+    transaction.on_commit(lambda: recipes_changed({pk}))
+
+
+@receiver(post_delete, sender=Recipe)
+def recipe_deleted(sender, instance, **kwargs):
+    pk = instance.pk
+    transaction.on_commit(lambda: recipes_changed({pk}, deleted=True))
+
+
+@receiver(post_delete, sender=Token)
+def token_deleted(sender, instance, **kwargs):
+    """Отзыв токена (token/logout, удаление пользователя) — из кэша."""
+    evict([instance.key])
+
+
+@receiver(post_save, sender=User)
+def user_saved(sender, instance, created, update_fields, **kwargs):
+    """
+    Сброс кэша токенов после изменения пользователя (деактивация,
+    профиль, пароль); отметка о входе кэш не сбрасывает.
+    """
+    if created or update_fields == {"last_login"}:
+        return
+    evict(Token.objects.filter(user=instance).values_list("key", flat=True))
+
+
+@receiver(credentials_updated, sender=User)
+def users_updated(sender, user_ids, **kwargs):
+    """Деактивация или смена пароля через QuerySet.update() — из кэша."""
+    evict(
+        Token.objects.filter(user_id__in=user_ids)
+        .values_list("key", flat=True)
+    )
+
+
+@receiver(connection_created)
+def connection_opened(connection, **kwargs):
+    """Учет запросов для QueryInstrumentationMiddleware и бюджетов."""
+    instrument(connection)
@@ -0,0 +1,1645 @@
+import asyncio
+import importlib
+import io
+import json
+import shutil
+import tempfile
+import threading
+import time
+import types
+from importlib import import_module
+from unittest import mock, skipIf, skipUnless
+from urllib.parse import urlencode
+
+from django.apps import apps as django_apps
+from django.core.cache import caches
+from django.core.management import CommandError, call_command
+from django.db import DEFAULT_DB_ALIAS, connection, connections, transaction
+from django.test import (SimpleTestCase, TestCase, TransactionTestCase,
+                         override_settings)
+from django.test.utils import CaptureQueriesContext
+from django.urls import include, re_path, resolve, reverse
+from recipes import feed, shopping
+from recipes.images import make_variants
+from recipes.management.commands import load_data
+from recipes.models import (Carts, Favourites, FeedItem, Ingredient, Recipe,
+                            RecipeIngredient, ShoppingListItem, Tag)
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+from users.models import Subscribe, User
+
+from api import authentication, membership, pantry, search
+from api.cache import get_version, local_caches
+from api.queries import collect, fingerprint
+from api.relations import (CREATED, DELETED, EXISTS, NOT_FOUND,
+                           add_relations, remove_relations)
+from api.replica import PIN_COOKIE, REPLICA, pin_key
+from api.routes import get_routes
+from api.views import CustomUserViewSet
+
+feed_backfill = import_module("recipes.migrations.0012_feed_backfill")
+
+
+def create_user(username, **fields):
+    return User.objects.create_user(
+        username=username,
+        email=f"{username}@example.com",
+        password="test-password-123",
+        first_name=username,
+        last_name=username,
+        **fields,
+    )
+
+
+def create_recipe(author, name, ingredients, tags=(), text="Описание"):
+    """Рецепт с ингредиентами [(ингредиент, количество)] и тегами."""
+    recipe = Recipe.objects.create(
+        author=author, name=name, text=text, cooking_time=10,
+        image="recipes/img/test.png",
+    )
+    RecipeIngredient.objects.bulk_create(
+        RecipeIngredient(recipe=recipe, ingredient=ingredient, amount=amount)
+        for ingredient, amount in ingredients
+    )
+    recipe.tags.set(tags)
+    return recipe
+
+
+def get_results(response):
+    """Рецепты ответа списка: с пагинацией и без нее."""
+    data = response.json()
+    return data["results"] if isinstance(data, dict) else data
+
+
+def client_for(user):
+    client = APIClient()
+    token, _ = Token.objects.get_or_create(user=user)
+    client.credentials(HTTP_AUTHORIZATION=f"Token {token.key}")
+    return client
+
+
+def reset_caches():
+    caches["default"].clear()
+    authentication._backend = None
+    membership._backend = None
+    search._index = None
+    pantry._index = None
+
+
+class APITestCase(TestCase):
+    """
+    Тесты api на своих данных.
+
+    Кэши процесса (справочники, членство, индексы) сбрасываются перед
+    каждым тестом: откат транзакции теста их не затрагивает.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.media_root = tempfile.mkdtemp()
+        cls.media_settings = override_settings(MEDIA_ROOT=cls.media_root)
+        cls.media_settings.enable()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.media_settings.disable()
+        shutil.rmtree(cls.media_root, ignore_errors=True)
+        super().tearDownClass()
+
+    def setUp(self):
+        reset_caches()
+        self.flour = Ingredient.objects.create(
+            name="мука", measurement_unit="г"
+        )
+        self.beet = Ingredient.objects.create(
+            name="свекла", measurement_unit="г"
+        )
+        self.milk = Ingredient.objects.create(
+            name="молоко", measurement_unit="мл"
+        )
+        self.tag = Tag.objects.create(
+            name="Обед", color="#E26C2D", slug="lunch"
+        )
+        self.author = create_user("author")
+        self.user = create_user("user")
+
+
+class RecipeSearchTests(APITestCase):
+    """Полнотекстовый поиск ?search= по БД тестов."""
+
+    def search(self, query):
+        response = APIClient().get("/api/recipes/", {"search": query})
+        self.assertEqual(response.status_code, 200)
+        return [recipe["name"] for recipe in get_results(response)]
+
+    def test_new_recipe_is_found(self):
+        create_recipe(self.author, "Борщ украинский", [(self.beet, 300)])
+        create_recipe(self.author, "Блины", [(self.flour, 200)])
+        self.assertEqual(self.search("борщ"), ["Борщ украинский"])
+        self.assertEqual(self.search("свекла"), ["Борщ украинский"])
+
+    def test_changes_are_indexed(self):
+        recipe = create_recipe(self.author, "Борщ", [(self.beet, 300)])
+        recipe.name = "Щи"
+        recipe.save()
+        RecipeIngredient.objects.create(
+            recipe=recipe, ingredient=self.milk, amount=100
+        )
+        self.assertEqual(self.search("щи"), ["Щи"])
+        self.assertEqual(self.search("борщ"), [])
+        self.assertEqual(self.search("молоко"), ["Щи"])
+        recipe.delete()
+        self.assertEqual(self.search("щи"), [])
+
+
+class RelationTests(APITestCase):
+    """Добавление в избранное и корзину: повторы не меняют счетчики."""
+
+    def test_repeated_add(self):
+        recipe = create_recipe(self.author, "Блины", [(self.flour, 200)])
+        client = client_for(self.user)
+        for expected in (CREATED, EXISTS):
+            response = client.post(
+                "/api/recipes/favorite/", {"ids": [recipe.id]},
+                format="json",
+            )
+            self.assertEqual(
+                response.json()["results"],
+                [{"id": recipe.id, "status": expected}],
+            )
+        recipe.refresh_from_db()
+        self.assertEqual(recipe.favorites_count, 1)
+        self.assertEqual(Favourites.objects.filter(recipe=recipe).count(), 1)
+
+
+class MembershipTests(APITestCase):
+    """Кэш членства: сквозная запись и фильтры списка рецептов."""
+
+    def setUp(self):
+        super().setUp()
+        self.pancakes = create_recipe(
+            self.author, "Блины", [(self.flour, 200)]
+        )
+        self.pie = create_recipe(self.author, "Пирог", [(self.flour, 300)])
+        self.client = client_for(self.user)
+
+    def change(self, method, url):
+        with self.captureOnCommitCallbacks(execute=True):
+            return getattr(self.client, method)(url).status_code
+
+    def get_flags(self):
+        data = self.client.get(f"/api/recipes/{self.pancakes.id}/").json()
+        return (
+            data["is_favorited"],
+            data["is_in_shopping_cart"],
+            data["author"]["is_subscribed"],
+        )
+
+    def get_names(self, query):
+        response = self.client.get(f"/api/recipes/?{query}")
+        return [recipe["name"] for recipe in get_results(response)]
+
+    def get_cached(self, kind):
+        return membership.get_backend().get(
+            membership.cache_key(self.user.id, kind)
+        )
+
+    def test_write_through(self):
+        urls = (
+            f"/api/recipes/{self.pancakes.id}/favorite/",
+            f"/api/recipes/{self.pancakes.id}/shopping_cart/",
+            f"/api/users/{self.author.id}/subscribe/",
+        )
+        self.assertEqual(self.get_flags(), (False, False, False))
+        for url in urls:
+            self.assertEqual(self.change("post", url), 201)
+        self.assertEqual(self.get_cached("favorites"), {self.pancakes.id})
+        self.assertEqual(self.get_cached("carts"), {self.pancakes.id})
+        self.assertEqual(self.get_cached("subscriptions"), {self.author.id})
+        self.assertEqual(self.get_flags(), (True, True, True))
+        for url in urls:
+            self.assertEqual(self.change("delete", url), 204)
+        self.assertEqual(self.get_cached("favorites"), set())
+        self.assertEqual(self.get_flags(), (False, False, False))
+
+    def test_filters(self):
+        self.assertEqual(self.get_names("is_favorited=1"), [])
+        self.assertEqual(self.get_names("is_in_shopping_cart=1"), [])
+        self.change("post", f"/api/recipes/{self.pie.id}/favorite/")
+        self.change("post", f"/api/recipes/{self.pancakes.id}/shopping_cart/")
+        self.assertEqual(self.get_names("is_favorited=1"), ["Пирог"])
+        self.assertEqual(self.get_names("is_in_shopping_cart=1"), ["Блины"])
+        self.assertEqual(
+            self.get_names("is_favorited=1&is_in_shopping_cart=1"), []
+        )
+        self.assertEqual(len(self.get_names("is_favorited=0")), 2)
+        self.change("delete", f"/api/recipes/{self.pie.id}/favorite/")
+        self.assertEqual(self.get_names("is_favorited=1"), [])
+        self.assertEqual(self.get_names("is_in_shopping_cart=1"), ["Блины"])
+
+
+class FeedTests(APITestCase):
+    """Лента подписок: backfill, раскладка, курсор before и отписка."""
+
+    def setUp(self):
+        super().setUp()
+        self.recipes = [
+            create_recipe(self.author, f"Рецепт {number}", [(self.flour, 1)])
+            for number in range(5)
+        ]
+        self.ids = [recipe.id for recipe in reversed(self.recipes)]
+        self.client = client_for(self.user)
+
+    def subscribe(self, author, method="post"):
+        url = f"/api/users/{author.id}/subscribe/"
+        return getattr(self.client, method)(url).status_code
+
+    def get_ids(self, url="/api/recipes/feed/"):
+        data = self.client.get(url).json()
+        return [recipe["id"] for recipe in data["results"]], data["next"]
+
+    def test_backfill_on_subscribe(self):
+        self.assertEqual(self.get_ids(), ([], None))
+        self.assertEqual(self.subscribe(self.author), 201)
+        self.assertEqual(self.get_ids(), (self.ids, None))
+
+    def test_before_cursor(self):
+        self.subscribe(self.author)
+        pages = []
+        url = "/api/recipes/feed/?limit=2"
+        while url:
+            ids, url = self.get_ids(url)
+            pages.append(ids)
+        self.assertEqual(
+            pages, [self.ids[:2], self.ids[2:4], self.ids[4:]]
+        )
+        ids, _ = self.get_ids(f"/api/recipes/feed/?before={self.ids[1]}")
+        self.assertEqual(ids, self.ids[2:])
+
+    def test_fan_out_on_create(self):
+        self.subscribe(self.author)
+        with mock.patch("recipes.signals.schedule_fan_out") as schedule:
+            with self.captureOnCommitCallbacks(execute=True):
+                recipe = create_recipe(self.author, "Новый", [(self.flour, 1)])
+        schedule.assert_called_once_with(recipe.id, self.author.id, 1)
+        feed.fan_out(recipe.id, self.author.id)
+        self.assertEqual(self.get_ids()[0], [recipe.id, *self.ids])
+
+    def test_unsubscribe(self):
+        other = create_user("other")
+        recipe = create_recipe(other, "Чужой", [(self.flour, 1)])
+        self.subscribe(self.author)
+        self.subscribe(other)
+        self.assertEqual(self.get_ids()[0], [recipe.id, *self.ids])
+        self.assertEqual(self.subscribe(self.author, "delete"), 204)
+        self.assertEqual(self.get_ids()[0], [recipe.id])
+        self.assertFalse(
+            FeedItem.objects.filter(user=self.user, author=self.author)
+            .exists()
+        )
+
+    def test_big_author_read_on_demand(self):
+        with override_settings(FEED_FANOUT_MAX_FOLLOWERS=0):
+            self.subscribe(self.author)
+            self.assertFalse(FeedItem.objects.exists())
+            self.assertEqual(self.get_ids()[0], self.ids)
+
+    def test_backfill_migration(self):
+        other = create_user("other")
+        Subscribe.objects.create(user=self.user, author=self.author)
+        Subscribe.objects.create(user=other, author=self.author)
+        self.assertFalse(FeedItem.objects.exists())
+        feed_backfill.backfill_feed(django_apps, None)
+        feed_backfill.backfill_feed(django_apps, None)
+        for user in (self.user, other):
+            self.assertEqual(
+                list(
+                    FeedItem.objects.filter(user=user)
+                    .order_by("-recipe").values_list("recipe", flat=True)
+                ),
+                self.ids,
+            )
+
+
+class PantryTests(APITestCase):
+    """Рецепты из имеющихся продуктов: порядок по покрытию и ?missing."""
+
+    def setUp(self):
+        super().setUp()
+        egg = Ingredient.objects.create(name="яйцо", measurement_unit="шт")
+        salt = Ingredient.objects.create(name="соль", measurement_unit="г")
+        flour, milk = (self.flour, 1), (self.milk, 1)
+        for name, ingredients, tags in (
+            ("Блины", [flour, milk], [self.tag]),
+            ("Омлет", [flour, milk, (egg, 1)], []),
+            ("Лепешка", [flour], []),
+            ("Пирог", [flour, (egg, 1), (salt, 1)], [self.tag]),
+            ("Борщ", [(self.beet, 1)], []),
+            ("Сырники", [milk, (egg, 1)], []),
+            ("Лаваш", [flour], []),
+        ):
+            create_recipe(self.author, name, ingredients, tags)
+        self.client = APIClient()
+
+    def search(self, **params):
+        params.setdefault("ingredients", [self.flour.id, self.milk.id])
+        response = self.client.get("/api/recipes/pantry/", params)
+        self.assertEqual(response.status_code, 200)
+        return [
+            (recipe["name"], recipe["matched"], recipe["missing"],
+             recipe["coverage"])
+            for recipe in get_results(response)
+        ]
+
+    def test_ranking(self):
+        self.assertEqual(self.search(), [
+            ("Блины", 2, 0, 1.0),
+            ("Лаваш", 1, 0, 1.0),
+            ("Лепешка", 1, 0, 1.0),
+            ("Омлет", 2, 1, 0.6667),
+            ("Сырники", 1, 1, 0.5),
+            ("Пирог", 1, 2, 0.3333),
+        ])
+
+    def test_missing(self):
+        names = [name for name, *_ in self.search(missing=1)]
+        self.assertEqual(
+            names, ["Блины", "Лаваш", "Лепешка", "Омлет", "Сырники"]
+        )
+        names = [name for name, *_ in self.search(missing=0)]
+        self.assertEqual(names, ["Блины", "Лаваш", "Лепешка"])
+
+    def test_tags_and_pages(self):
+        names = [name for name, *_ in self.search(tags=["lunch"])]
+        self.assertEqual(names, ["Блины", "Пирог"])
+        names = [name for name, *_ in self.search(limit=2, page=2)]
+        self.assertEqual(names, ["Лепешка", "Омлет"])
+        self.assertEqual(self.search(ingredients=[self.beet.id]), [
+            ("Борщ", 1, 0, 1.0),
+        ])
+
+    def test_new_recipe(self):
+        self.search()
+        with self.captureOnCommitCallbacks(execute=True):
+            create_recipe(
+                self.author, "Каша", [(self.milk, 1), (self.beet, 1)]
+            )
+        self.assertIn(("Каша", 1, 1, 0.5), self.search())
+
+
+class SimilarRecipesTests(APITestCase):
+    """Похожие рецепты: по совместным добавлениям и по составу."""
+
+    def setUp(self):
+        super().setUp()
+        egg = Ingredient.objects.create(name="яйцо", measurement_unit="шт")
+        salt = Ingredient.objects.create(name="соль", measurement_unit="г")
+        sugar = Ingredient.objects.create(
+            name="сахар", measurement_unit="г"
+        )
+        base = [self.flour, self.milk, self.beet, egg]
+        self.recipes = {
+            name: create_recipe(
+                self.author, name, [(item, 1) for item in ingredients]
+            )
+            for name, ingredients in (
+                ("Блины", base),
+                ("Оладьи", base),
+                ("Пирог", [self.flour, self.milk, self.beet, salt]),
+                ("Компот", [salt, sugar]),
+                ("Вода", []),
+            )
+        }
+        call_command("build_minhash", stdout=io.StringIO())
+        self.client = APIClient()
+
+    def get_similar(self, name, action, query=""):
+        recipe = self.recipes[name]
+        response = self.client.get(
+            f"/api/recipes/{recipe.id}/{action}/{query}"
+        )
+        self.assertEqual(response.status_code, 200)
+        return [(item["name"], item["score"]) for item in response.json()]
+
+    def test_by_ingredients(self):
+        found = self.get_similar("Блины", "similar-by-ingredients")
+        names = [name for name, _ in found]
+        self.assertEqual(found[0], ("Оладьи", 1.0))
+        self.assertIn("Пирог", names)
+        self.assertNotIn("Компот", names)
+        self.assertNotIn("Блины", names)
+        scores = [score for _, score in found]
+        self.assertEqual(scores, sorted(scores, reverse=True))
+        self.assertLess(scores[-1], 1.0)
+        self.assertEqual(
+            self.get_similar("Блины", "similar-by-ingredients", "?limit=1"),
+            [("Оладьи", 1.0)],
+        )
+        self.assertEqual(
+            self.get_similar("Вода", "similar-by-ingredients"), []
+        )
+
+    def test_by_ingredients_after_update(self):
+        recipe = self.recipes["Компот"]
+        response = client_for(self.author).patch(
+            f"/api/recipes/{recipe.id}/", {
+                "ingredients": [
+                    {"id": item.id, "amount": 1}
+                    for item in (self.flour, self.milk, self.beet)
+                ],
+                "tags": [self.tag.id],
+                "name": "Компот",
+                "text": "Компот",
+                "cooking_time": 10,
+            }, format="json",
+        )
+        self.assertEqual(response.status_code, 200)
+        # Жаккар 3/4 с тремя рецептами: подпись пересчитана при записи.
+        found = dict(self.get_similar("Компот", "similar-by-ingredients"))
+        self.assertEqual(set(found), {"Блины", "Оладьи", "Пирог"})
+        self.assertGreater(min(found.values()), 0.5)
+
+    def test_by_interactions(self):
+        for number in range(3):
+            user = create_user(f"user{number}")
+            add_relations(
+                Favourites, user, [self.recipes["Блины"].id,
+                                   self.recipes["Компот"].id]
+            )
+        add_relations(Carts, self.user, [self.recipes["Блины"].id,
+                                         self.recipes["Пирог"].id])
+        call_command("build_similarities", stdout=io.StringIO())
+        found = self.get_similar("Блины", "similar")
+        self.assertEqual(
+            [name for name, _ in found], ["Компот", "Пирог"]
+        )
+        self.assertGreater(found[0][1], found[1][1])
+        self.assertEqual(self.get_similar("Вода", "similar"), [])
+        response = self.client.get("/api/recipes/0/similar/")
+        self.assertEqual(response.status_code, 404)
+
+
+class ShoppingListTests(APITestCase):
+    """Список покупок поддерживается при изменении корзины и рецептов."""
+
+    def setUp(self):
+        super().setUp()
+        self.pancakes = create_recipe(
+            self.author, "Блины", [(self.flour, 200), (self.milk, 500)]
+        )
+        self.pie = create_recipe(self.author, "Пирог", [(self.flour, 300)])
+        self.client = client_for(self.user)
+
+    def get_items(self):
+        return dict(
+            ShoppingListItem.objects.filter(user=self.user)
+            .values_list("ingredient__name", "amount")
+        )
+
+    def test_add_and_remove_twice(self):
+        url = f"/api/recipes/{self.pancakes.id}/shopping_cart/"
+        self.assertEqual(self.client.post(url).status_code, 201)
+        self.assertEqual(self.client.post(url).status_code, 400)
+        self.client.post(f"/api/recipes/{self.pie.id}/shopping_cart/")
+        self.assertEqual(self.get_items(), {"мука": 500, "молоко": 500})
+        self.assertEqual(self.client.delete(url).status_code, 204)
+        self.assertEqual(self.client.delete(url).status_code, 204)
+        self.assertEqual(self.get_items(), {"мука": 300})
+
+    def test_batch_add_and_remove_twice(self):
+        ids = {"ids": [self.pancakes.id, self.pie.id]}
+        for expected in (CREATED, EXISTS):
+            response = self.client.post(
+                "/api/recipes/shopping_cart/", ids, format="json"
+            )
+            self.assertEqual(
+                {item["status"] for item in response.json()["results"]},
+                {expected},
+            )
+        self.assertEqual(self.get_items(), {"мука": 500, "молоко": 500})
+        for expected in (DELETED, NOT_FOUND):
+            response = self.client.delete(
+                "/api/recipes/shopping_cart/", ids, format="json"
+            )
+            self.assertEqual(
+                {item["status"] for item in response.json()["results"]},
+                {expected},
+            )
+        self.assertEqual(self.get_items(), {})
+
+    def test_recipe_changes(self):
+        add_relations(Carts, self.user, [self.pancakes.id, self.pie.id])
+        response = client_for(self.author).patch(
+            f"/api/recipes/{self.pancakes.id}/",
+            {
+                "ingredients": [
+                    {"id": self.flour.id, "amount": 250},
+                    {"id": self.beet.id, "amount": 100},
+                ],
+                "tags": [self.tag.id],
+            },
+            format="json",
+        )
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual(self.get_items(), {"мука": 550, "свекла": 100})
+        self.pie.delete()
+        self.assertEqual(self.get_items(), {"мука": 250, "свекла": 100})
+
+    def test_summary_and_download(self):
+        add_relations(Carts, self.user, [self.pancakes.id, self.pie.id])
+        response = self.client.get("/api/recipes/shopping_cart/summary/")
+        self.assertEqual(response.json(), [
+            {"name": "молоко", "measurement_unit": "мл", "amount": 500},
+            {"name": "мука", "measurement_unit": "г", "amount": 500},
+        ])
+        response = self.client.get(
+            "/api/recipes/download_shopping_cart/", {"format": "txt"}
+        )
+        self.assertEqual(
+            b"".join(response.streaming_content).decode(),
+            "молоко-500 мл\nмука-500 г\n",
+        )
+
+    def test_reconcile(self):
+        add_relations(Carts, self.user, [self.pancakes.id])
+        ShoppingListItem.objects.filter(ingredient=self.flour).update(
+            amount=1
+        )
+        ShoppingListItem.objects.filter(ingredient=self.milk).delete()
+        ShoppingListItem.objects.create(
+            user=self.user, ingredient=self.beet, amount=5
+        )
+        self.assertEqual(shopping.reconcile(), (1, 1, 1))
+        self.assertEqual(self.get_items(), {"мука": 200, "молоко": 500})
+        self.assertEqual(shopping.reconcile(), (0, 0, 0))
+
+
+PNG = (
+    "data:image/png;base64,iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAYAAAAfFcSJAAAA"
+    "DUlEQVR42mNkYPhfDwAChwGA60e6kgAAAABJRU5ErkJggg=="
+)
+
+# Бюджет запросов к БД: (имя маршрута, метод) -> максимум запросов
+# повторного вызова (кэши токенов, членства и справочников прогреты).
+BUDGETS = {
+    ("ingredients-list", "get"): 0,
+    ("ingredients-detail", "get"): 0,
+    ("tags-list", "get"): 0,
+    ("tags-detail", "get"): 0,
+    ("recipes-list", "get"): 4,
+    ("recipes-list", "post"): 16,
+    ("recipes-detail", "get"): 3,
+    ("recipes-detail", "put"): 18,
+    ("recipes-detail", "patch"): 8,
+    ("recipes-detail", "delete"): 13,
+    ("recipes-download-carts", "get"): 1,
+    ("recipes-favorite", "post"): 6,
+    ("recipes-favorite", "delete"): 6,
+    ("recipes-favorite-batch", "post"): 5,
+    ("recipes-favorite-batch", "delete"): 6,
+    ("recipes-shopping-cart", "post"): 9,
+    ("recipes-shopping-cart", "delete"): 9,
+    ("recipes-shopping-cart-batch", "post"): 8,
+    ("recipes-shopping-cart-batch", "delete"): 9,
+    ("recipes-shopping-cart-summary", "get"): 1,
+    ("recipes-feed", "get"): 5,
+    ("recipes-pantry", "get"): 3,
+    ("recipes-recommended", "get"): 1,
+    ("recipes-similar", "get"): 2,
+    ("recipes-similar-by-ingredients", "get"): 1,
+    ("users-list", "get"): 2,
+    ("users-list", "post"): 5,
+    ("users-detail", "get"): 1,
+    ("users-me", "get"): 0,
+    ("users-me", "put"): 5,
+    ("users-me", "patch"): 3,
+    ("users-set-password", "post"): 3,
+    ("users-get-subscriptions", "get"): 3,
+    ("users-subscribe", "post"): 10,
+    ("users-subscribe", "delete"): 8,
+    ("users-subscribe-batch", "post"): 8,
+    ("users-subscribe-batch", "delete"): 7,
+    ("login", "post"): 3,
+    ("logout", "post"): 3,
+}
+
+# Маршруты без бюджета. Удаление пользователя: число запросов растет с
+# числом его рецептов (каскад). Изменение чужого профиля: права
+# IsAuthorOrReadOnly рассчитаны на рецепты и для User дают ошибку 500;
+# set_username ждет new_email (LOGIN_FIELD), а читает new_username.
+# Остальные отправляют письма и требуют uid/token из них.
+EXCLUDED = {
+    ("users-set-username", "post"),
+    ("users-detail", "delete"),
+    ("users-me", "delete"),
+    ("users-detail", "put"),
+    ("users-detail", "patch"),
+    ("users-activation", "post"),
+    ("users-resend-activation", "post"),
+    ("users-reset-password", "post"),
+    ("users-reset-password-confirm", "post"),
+    ("users-reset-username", "post"),
+    ("users-reset-username-confirm", "post"),
+}
+
+
+class QueryBudgetTests(APITestCase):
+    """
+    Число запросов к БД эндпоинтов api на данных теста.
+
+    Считается повторный вызов: первый прогревает кэши, оба
+    откатываются. Потоковый ответ читается внутри замера — его запросы
+    выполняются при чтении тела.
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.own = create_recipe(
+            self.user, "Свекольник", [(self.beet, 300), (self.milk, 200)],
+            tags=[self.tag],
+        )
+        self.other = create_recipe(
+            self.author, "Блины", [(self.flour, 200), (self.milk, 500)],
+            tags=[self.tag],
+        )
+        self.client = client_for(self.user)
+
+    def get_cases(self):
+        """Объект detail-маршрута, параметры и тело каждого запроса."""
+        recipe = {
+            "ingredients": [
+                {"id": self.beet.id, "amount": 300},
+                {"id": self.milk.id, "amount": 200},
+            ],
+            "tags": [self.tag.id],
+            "image": PNG,
+            "name": "Проверка бюджета",
+            "text": "Проверка бюджета",
+            "cooking_time": 10,
+        }
+        profile = {
+            "email": "budget@example.com",
+            "username": "budget",
+            "first_name": "Бюджет",
+            "last_name": "Проверка",
+        }
+        other = {"ids": [self.other.id]}
+        author = {"ids": [self.author.id]}
+        return {
+            ("ingredients-list", "get"): (None, {"name": "м"}, None),
+            ("ingredients-detail", "get"): (self.flour.id, None, None),
+            ("tags-detail", "get"): (self.tag.id, None, None),
+            ("recipes-list", "get"): (None, {"limit": 6}, None),
+            ("recipes-list", "post"): (None, None, recipe),
+            ("recipes-detail", "put"): (self.own.id, None, recipe),
+            ("recipes-detail", "patch"): (
+                self.own.id, None, {"name": "Новое"}
+            ),
+            ("recipes-detail", "delete"): (self.own.id, None, None),
+            ("recipes-favorite-batch", "post"): (None, None, other),
+            ("recipes-favorite-batch", "delete"): (None, None, other),
+            ("recipes-shopping-cart-batch", "post"): (None, None, other),
+            ("recipes-shopping-cart-batch", "delete"): (None, None, other),
+            ("recipes-pantry", "get"): (
+                None, {"ingredients": [self.flour.id, self.milk.id]}, None
+            ),
+            ("users-list", "get"): (None, {"limit": 6}, None),
+            ("users-list", "post"): (
+                None, None, {**profile, "password": "test-password-456"}
+            ),
+            ("users-detail", "get"): (self.author.id, None, None),
+            ("users-me", "put"): (None, None, profile),
+            ("users-me", "patch"): (None, None, {"first_name": "Б"}),
+            ("users-set-password", "post"): (None, None, {
+                "current_password": "test-password-123",
+                "new_password": "test-password-456",
+            }),
+            ("users-get-subscriptions", "get"): (
+                None, {"limit": 6, "recipes_limit": 3}, None
+            ),
+            ("users-subscribe", "post"): (self.author.id, None, None),
+            ("users-subscribe", "delete"): (self.author.id, None, None),
+            ("users-subscribe-batch", "post"): (None, None, author),
+            ("users-subscribe-batch", "delete"): (None, None, author),
+            ("login", "post"): (None, None, {
+                "email": self.user.email, "password": "test-password-123"
+            }),
+        }
+
+    def prepare(self, key):
+        """
+        Данные, при которых запрос успешен.
+
+        Для добавления связи нет, для остальных запросов — есть.
+        """
+        name, method = key
+        if name in ("recipes-favorite", "recipes-favorite-batch",
+                    "recipes-recommended"):
+            model, pk = Favourites, self.other.id
+        elif name in ("recipes-shopping-cart", "recipes-shopping-cart-batch",
+                      "recipes-download-carts",
+                      "recipes-shopping-cart-summary"):
+            model, pk = Carts, self.other.id
+        elif name in ("users-subscribe", "users-subscribe-batch",
+                      "users-get-subscriptions", "recipes-feed"):
+            model, pk = Subscribe, self.author.id
+        else:
+            return
+        if method == "post":
+            remove_relations(model, self.user, [pk])
+        else:
+            add_relations(model, self.user, [pk])
+
+    def call(self, key, url, query, data):
+        """Статус, тело и запросы вызова; изменения откатываются."""
+        name, method = key
+        client = APIClient() if name == "login" else self.client
+        with transaction.atomic():
+            self.prepare(key)
+            with CaptureQueriesContext(connection) as queries:
+                if method == "get":
+                    response = client.get(url, query)
+                else:
+                    response = getattr(client, method)(
+                        url, data, format="json"
+                    )
+                if response.streaming:
+                    content = b"".join(response.streaming_content)
+                else:
+                    content = response.content
+            transaction.set_rollback(True)
+        return response.status_code, content, queries
+
+    def assert_budget(self, key, url, query=None, data=None):
+        reset_caches()
+        self.call(key, url, query, data)
+        status, content, queries = self.call(key, url, query, data)
+        self.assertLess(status, 400, content)
+        sql = [fingerprint(query["sql"]) for query in queries]
+        self.assertLessEqual(len(sql), BUDGETS[key], "\n".join(sql))
+
+    def test_every_route_has_budget(self):
+        routes = {
+            (name, method)
+            for name, (_, methods) in get_routes().items()
+            for method in methods
+        }
+        self.assertEqual(routes, set(BUDGETS) | EXCLUDED)
+
+    def test_budgets(self):
+        routes = get_routes()
+        cases = self.get_cases()
+        for key in sorted(BUDGETS):
+            name, method = key
+            lookup, _ = routes[name]
+            target, query, data = cases.get(key, (None, None, None))
+            if lookup and target is None:
+                target = self.other.id
+            url = reverse(
+                f"api:{name}", kwargs={lookup: target} if lookup else None
+            )
+            with self.subTest(route=name, method=method):
+                self.assert_budget(key, url, query, data)
+
+    def test_recipe_list_does_not_grow(self):
+        """Страница рецептов — одно и то же число запросов при любом limit."""
+        for number in range(10):
+            recipe = create_recipe(
+                self.author, f"Рецепт {number}",
+                [(self.flour, 100), (self.beet, 50)], tags=[self.tag],
+            )
+            add_relations(Favourites, self.user, [recipe.id])
+            add_relations(Carts, self.user, [recipe.id])
+        add_relations(Subscribe, self.user, [self.author.id])
+        # Первый вызов заполняет кэш членства.
+        self.client.get("/api/recipes/", {"limit": 12})
+        for lean in (True, False):
+            for limit in (1, 12):
+                with self.subTest(lean=lean, limit=limit), override_settings(
+                    LEAN_READ_SERIALIZERS=lean
+                ), self.assertNumQueries(4):
+                    response = self.client.get(
+                        "/api/recipes/", {"limit": limit}
+                    )
+                self.assertEqual(len(get_results(response)), limit)
+            for recipe in get_results(response):
+                added = recipe["name"].startswith("Рецепт")
+                self.assertEqual(recipe["is_favorited"], added)
+                self.assertEqual(recipe["is_in_shopping_cart"], added)
+                self.assertEqual(
+                    recipe["author"]["is_subscribed"],
+                    recipe["author"]["id"] == self.author.id,
+                )
+
+    def test_download_queries_are_counted(self):
+        add_relations(Carts, self.user, [self.other.id])
+        response = self.client.get("/api/recipes/download_shopping_cart/")
+        with self.assertNumQueries(1):
+            content = b"".join(response.streaming_content)
+        self.assertIn("мука".encode(), content)
+
+
+class CursorPaginationTests(APITestCase):
+    """?paginate=cursor: ссылки next/previous и ?skip_count."""
+
+    def setUp(self):
+        super().setUp()
+        self.ids = [
+            create_recipe(self.author, f"Рецепт {number}", []).id
+            for number in range(5)
+        ]
+        self.client = client_for(self.user)
+
+    def get_page(self, url):
+        data = self.client.get(url).json()
+        return [item["id"] for item in data["results"]], data
+
+    def test_next_and_previous(self):
+        url = "/api/recipes/?paginate=cursor&limit=2"
+        pages, links = [], []
+        while url:
+            ids, data = self.get_page(url)
+            self.assertEqual(data["count"], 5)
+            pages.append(ids)
+            links.append(data["previous"])
+            url = data["next"]
+        self.assertEqual(
+            pages, [self.ids[:2], self.ids[2:4], self.ids[4:]]
+        )
+        self.assertIsNone(links[0])
+        self.assertEqual(self.get_page(links[2])[0], self.ids[2:4])
+        self.assertEqual(self.get_page(links[1])[0], self.ids[:2])
+
+    def test_skip_count(self):
+        url = "/api/recipes/?paginate=cursor&limit=2"
+        # Первый запрос заполняет кэши токена и членства.
+        self.client.get(url)
+        with CaptureQueriesContext(connection) as counted:
+            self.client.get(url)
+        with CaptureQueriesContext(connection) as skipped:
+            ids, data = self.get_page(f"{url}&skip_count=true")
+        self.assertIsNone(data["count"])
+        self.assertEqual(ids, self.ids[:2])
+        self.assertEqual(len(skipped), len(counted) - 1)
+        self.assertFalse(
+            any("COUNT(" in query["sql"] for query in skipped)
+        )
+
+    def test_subscriptions(self):
+        authors = [create_user(f"author{number}") for number in range(3)]
+        for author in authors:
+            add_relations(Subscribe, self.user, [author.id])
+        url = "/api/users/subscriptions/?paginate=cursor&limit=2"
+        pages = []
+        while url:
+            ids, data = self.get_page(url)
+            pages.append(ids)
+            url = data["next"]
+        newest_first = [author.id for author in reversed(authors)]
+        self.assertEqual(pages, [newest_first[:2], newest_first[2:]])
+
+
+class SubscriptionRecipesTests(APITestCase):
+    """?recipes_limit в подписках: последние рецепты каждого автора."""
+
+    def setUp(self):
+        super().setUp()
+        self.authors = {}
+        for number in range(3):
+            author = create_user(f"author{number}")
+            self.authors[author.id] = [
+                create_recipe(author, f"Рецепт {number}.{index}", []).id
+                for index in range(number + 1)
+            ]
+            add_relations(Subscribe, self.user, [author.id])
+        self.client = client_for(self.user)
+
+    def get_recipes(self, query=""):
+        response = self.client.get(
+            f"/api/users/subscriptions/?limit=6&{query}"
+        )
+        return {
+            author["id"]: (
+                [recipe["id"] for recipe in author["recipes"]],
+                author["recipes_count"],
+            )
+            for author in get_results(response)
+        }
+
+    def test_recipes_limit(self):
+        for query, limit in (
+            ("recipes_limit=2", 2),
+            ("recipes_limit=0", 0),
+            ("", None),
+            ("recipes_limit=all", None),
+        ):
+            with self.subTest(query=query):
+                self.assertEqual(self.get_recipes(query), {
+                    author_id: (ids[::-1][:limit], len(ids))
+                    for author_id, ids in self.authors.items()
+                })
+
+    def test_one_query_for_page(self):
+        authors = list(User.objects.filter(id__in=self.authors))
+        with self.assertNumQueries(1):
+            CustomUserViewSet.prefetch_latest_recipes(authors, 2)
+        for author in authors:
+            self.assertEqual(
+                [recipe.id for recipe in author.latest_recipes],
+                self.authors[author.id][::-1][:2],
+            )
+
+    def test_queries_do_not_grow(self):
+        query = "/api/users/subscriptions/?limit=6&recipes_limit=2"
+        self.client.get(query)
+        with CaptureQueriesContext(connection) as three:
+            self.client.get(query)
+        remove_relations(Subscribe, self.user, list(self.authors)[1:])
+        self.client.get(query)
+        with CaptureQueriesContext(connection) as one:
+            self.client.get(query)
+        self.assertEqual(len(one), len(three))
+
+
+class LeanSerializerTests(APITestCase):
+    """Облегченный сериализатор отдает те же байты, что и обычный."""
+
+    def setUp(self):
+        super().setUp()
+        dinner = Tag.objects.create(
+            name="Ужин", color="#8775D2", slug="dinner"
+        )
+        other = create_user("other")
+        for number, (author, tags) in enumerate((
+            (self.author, [self.tag]),
+            (other, [self.tag, dinner]),
+            (self.author, []),
+        ) * 2):
+            recipe = create_recipe(
+                author, f"Блины {number}",
+                [(self.milk, 500), (self.flour, 200 + number)], tags=tags,
+                text=f"Блины на молоке, вариант {number}",
+            )
+            if number % 2:
+                add_relations(Favourites, self.user, [recipe.id])
+            if number % 3:
+                add_relations(Carts, self.user, [recipe.id])
+        add_relations(Subscribe, self.user, [other.id])
+        self.recipe = recipe
+        self.clients = {
+            "user": client_for(self.user), "anonymous": APIClient()
+        }
+
+    def get_content(self, client, path, lean):
+        with override_settings(LEAN_READ_SERIALIZERS=lean):
+            response = client.get(path)
+        self.assertEqual(response.status_code, 200)
+        return response.content
+
+    def assert_same(self, path):
+        contents = {}
+        for name, client in self.clients.items():
+            with self.subTest(path=path, client=name):
+                contents[name] = self.get_content(client, path, True)
+                self.assertEqual(
+                    contents[name], self.get_content(client, path, False)
+                )
+        return contents
+
+    def test_pages(self):
+        for path in (
+            "/api/recipes/?limit=4",
+            "/api/recipes/?limit=4&page=2",
+            f"/api/recipes/{self.recipe.id}/",
+            "/api/recipes/?limit=4&" + urlencode({"search": "блины молоко"}),
+            "/api/recipes/?tags=lunch&tags=dinner",
+            "/api/recipes/?is_favorited=1&is_in_shopping_cart=1",
+        ):
+            self.assert_same(path)
+
+    def test_cursor_pages(self):
+        for path in (
+            "/api/recipes/?paginate=cursor&limit=2",
+            "/api/recipes/?paginate=cursor&limit=2&"
+            + urlencode({"search": "блины"}),
+        ):
+            pages = 0
+            while path:
+                content = self.assert_same(path)["user"]
+                path = json.loads(content)["next"]
+                pages += 1
+            self.assertEqual(pages, 3)
+
+
+class CatalogueCacheTests(APITestCase):
+    """Ответы справочников под версией данных, ETag и 304."""
+
+    def get(self, path, etag=None):
+        if etag is None:
+            return self.client.get(path)
+        return self.client.get(path, HTTP_IF_NONE_MATCH=etag)
+
+    def test_not_modified(self):
+        response = self.get("/api/tags/")
+        self.assertEqual(response.status_code, 200)
+        etag = response["ETag"]
+        with self.assertNumQueries(0):
+            response = self.get("/api/tags/", etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response["ETag"], etag)
+
+    def test_tag_save_bumps_version(self):
+        etag = self.get("/api/tags/")["ETag"]
+        version = get_version(Tag)
+        self.tag.name = "Ужин"
+        self.tag.save()
+        self.assertNotEqual(get_version(Tag), version)
+        response = self.get("/api/tags/", etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["ETag"], etag)
+        self.assertEqual(
+            [tag["name"] for tag in response.json()], ["Ужин"]
+        )
+
+    def test_ingredient_save_bumps_version(self):
+        path = f"/api/ingredients/{self.flour.id}/"
+        etag = self.get(path)["ETag"]
+        self.get("/api/ingredients/?name=мук")
+        version = get_version(Ingredient)
+        self.flour.name = "мука ржаная"
+        self.flour.save()
+        self.assertNotEqual(get_version(Ingredient), version)
+        response = self.get(path, etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["name"], "мука ржаная")
+        # Индекс автодополнения перестраивается по той же версии.
+        response = self.get("/api/ingredients/?name=мук")
+        self.assertEqual(
+            [item["name"] for item in response.json()], ["мука ржаная"]
+        )
+
+
+class LoadDataTests(APITestCase):
+    """Загрузка ингредиентов командой load_data."""
+
+    def load(self, content, suffix=".json", **options):
+        path = f"{self.media_root}/ingredients{suffix}"
+        with open(path, "w", encoding="UTF-8") as file:
+            file.write(content)
+        call_command("load_data", path, stdout=io.StringIO(), **options)
+
+    def get_ingredients(self):
+        return set(Ingredient.objects.values_list("name", "measurement_unit"))
+
+    def test_json(self):
+        version = get_version(Ingredient)
+        self.load(json.dumps([
+            {"name": "мука", "measurement_unit": "г"},
+            {"name": " соль ", "measurement_unit": "г"},
+            {"name": "соль", "measurement_unit": "г"},
+            {"name": " ", "measurement_unit": "г"},
+        ]))
+        self.assertEqual(self.get_ingredients(), {
+            ("мука", "г"), ("свекла", "г"), ("молоко", "мл"), ("соль", "г"),
+        })
+        self.assertNotEqual(get_version(Ingredient), version)
+
+    def test_json_across_chunks(self):
+        items = [
+            {"name": f"специя {number}", "measurement_unit": "щепотка"}
+            for number in range(20)
+        ]
+        with mock.patch.object(load_data, "READ_SIZE", 7):
+            self.load(json.dumps(items, ensure_ascii=False), batch_size=3)
+        self.assertEqual(
+            Ingredient.objects.filter(measurement_unit="щепотка").count(), 20
+        )
+
+    def test_csv(self):
+        self.load("соль, г\nперец,г,лишнее\nбез единицы\n", ".csv")
+        self.assertEqual(
+            self.get_ingredients() - {
+                ("мука", "г"), ("свекла", "г"), ("молоко", "мл")
+            },
+            {("соль", "г"), ("перец", "г")},
+        )
+
+    def test_format_option(self):
+        self.load("соль,г\n", ".txt", format="csv")
+        self.assertIn(("соль", "г"), self.get_ingredients())
+
+    def test_duplicates_keep_version(self):
+        version = get_version(Ingredient)
+        self.load("мука,г\nмолоко,мл\n", ".csv")
+        self.assertEqual(Ingredient.objects.count(), 3)
+        self.assertEqual(get_version(Ingredient), version)
+
+    def test_invalid(self):
+        for content, suffix in (
+            ("", ".json"),
+            ('{"name": "соль"}', ".json"),
+            ('[{"name": "соль", "measurement_unit": "г"}', ".json"),
+            ("соль,г", ".txt"),
+        ):
+            with self.subTest(content=content, suffix=suffix):
+                with self.assertRaises(CommandError):
+                    self.load(content, suffix)
+        self.assertEqual(Ingredient.objects.count(), 3)
+
+    def test_default_file(self):
+        path = load_data.DEFAULT_PATH
+        with open(path, encoding="UTF-8") as file:
+            expected = {
+                (item["name"], item["measurement_unit"])
+                for item in json.load(file)
+            }
+        call_command("load_data", stdout=io.StringIO())
+        self.assertEqual(
+            self.get_ingredients(),
+            expected | {("мука", "г"), ("свекла", "г"), ("молоко", "мл")},
+        )
+
+
+class RecipeImageTests(APITestCase):
+    """Ссылки на превью WebP: "list" в списках, "detail" в рецепте."""
+
+    def setUp(self):
+        super().setUp()
+        self.client = client_for(self.user)
+        with mock.patch("recipes.signals.schedule_variants") as schedule:
+            with self.captureOnCommitCallbacks(execute=True):
+                response = self.client.post("/api/recipes/", {
+                    "ingredients": [{"id": self.flour.id, "amount": 200}],
+                    "tags": [self.tag.id],
+                    "image": PNG,
+                    "name": "Блины",
+                    "text": "Блины",
+                    "cooking_time": 10,
+                }, format="json")
+        self.assertEqual(response.status_code, 201)
+        self.recipe = Recipe.objects.get(pk=response.json()["id"])
+        # Превью создаются в фоне после фиксации транзакции.
+        schedule.assert_called_once_with(
+            self.recipe.image.storage, self.recipe.image.name
+        )
+
+    def get_images(self):
+        detail = self.client.get(f"/api/recipes/{self.recipe.id}/").json()
+        listed = get_results(self.client.get("/api/recipes/?limit=1"))[0]
+        short = self.client.post(
+            f"/api/recipes/{self.recipe.id}/favorite/"
+        ).json()
+        Favourites.objects.all().delete()
+        return listed["image"], detail["image"], short["image"]
+
+    def test_original_until_variants_exist(self):
+        name = self.recipe.image.name
+        self.assertTrue(name.endswith(".png"))
+        for image in self.get_images():
+            self.assertTrue(image.endswith(f"/media/{name}"))
+
+    def test_variants(self):
+        image = self.recipe.image
+        make_variants(image.storage, image.name)
+        stem = image.name[:-len(".png")]
+        for variant in ("list", "detail"):
+            for extension in ("png", "webp"):
+                self.assertTrue(image.storage.exists(
+                    f"{stem}_{variant}.{extension}"
+                ))
+        for lean in (True, False):
+            with override_settings(LEAN_READ_SERIALIZERS=lean):
+                listed, detail, short = self.get_images()
+            with self.subTest(lean=lean):
+                self.assertTrue(listed.endswith(f"/media/{stem}_list.webp"))
+                self.assertTrue(
+                    detail.endswith(f"/media/{stem}_detail.webp")
+                )
+                # Ответ на добавление в избранное — без request в
+                # контексте, ссылка относительная.
+                self.assertEqual(short, f"/media/{stem}_list.webp")
+
+
+class TokenRevocationTests(APITestCase):
+    """Отозванный токен не проходит аутентификацию, несмотря на кэш."""
+
+    def setUp(self):
+        super().setUp()
+        self.client = client_for(self.user)
+        self.assertEqual(self.get_me(), 200)
+
+    def get_me(self):
+        return self.client.get("/api/users/me/").status_code
+
+    def test_cached(self):
+        with self.assertNumQueries(0):
+            self.assertEqual(self.get_me(), 200)
+
+    def test_logout(self):
+        response = self.client.post("/api/auth/token/logout/")
+        self.assertEqual(response.status_code, 204)
+        self.assertEqual(self.get_me(), 401)
+
+    def test_token_deleted(self):
+        Token.objects.filter(user=self.user).delete()
+        self.assertEqual(self.get_me(), 401)
+
+    def test_deactivated(self):
+        self.user.is_active = False
+        self.user.save()
+        self.assertEqual(self.get_me(), 401)
+
+    def test_profile_change(self):
+        self.user.first_name = "Новое"
+        self.user.save()
+        response = self.client.get("/api/users/me/")
+        self.assertEqual(response.json()["first_name"], "Новое")
+
+    def test_deactivated_by_update(self):
+        User.objects.filter(pk=self.user.pk).update(is_active=False)
+        self.assertEqual(self.get_me(), 401)
+
+    def test_other_updates_keep_cache(self):
+        User.objects.filter(pk=self.user.pk).update(first_name="Новое")
+        with self.assertNumQueries(0):
+            response = self.client.get("/api/users/me/")
+        # Ограничение кэша: прочие поля обновятся по сроку жизни записи.
+        self.assertEqual(response.json()["first_name"], "user")
+
+
+class QueryInstrumentationTests(APITestCase):
+    """Учет запросов к БД: отпечатки и Server-Timing."""
+
+    def test_fingerprint(self):
+        self.assertEqual(
+            fingerprint(
+                "SELECT * FROM t WHERE id IN (%s, %s, %s)\n"
+                "  AND name = 'o''k' LIMIT 21"
+            ),
+            "SELECT * FROM t WHERE id IN (?) AND name = ? LIMIT ?",
+        )
+
+    def test_collect(self):
+        with collect() as outer:
+            list(Ingredient.objects.filter(pk=self.flour.id))
+            with collect() as inner:
+                list(Ingredient.objects.filter(pk=self.beet.id))
+        self.assertEqual((outer.count, inner.count), (2, 1))
+        self.assertEqual(len(outer.duplicates()), 1)
+        self.assertEqual(outer.duplicates()[0][1], 2)
+
+    def get_timing(self, user=None, **headers):
+        client = APIClient() if user is None else client_for(user)
+        response = client.get("/api/recipes/", {"limit": 6}, **headers)
+        self.assertEqual(response.status_code, 200)
+        return response.get("Server-Timing")
+
+    def test_server_timing(self):
+        self.assertIsNone(self.get_timing(self.user))
+        self.assertIsNone(
+            self.get_timing(self.user, HTTP_X_DEBUG_QUERIES="1")
+        )
+        self.user.is_staff = True
+        self.user.save()
+        self.assertIsNone(self.get_timing(self.user))
+        timing = self.get_timing(self.user, HTTP_X_DEBUG_QUERIES="1")
+        self.assertRegex(timing, r'^db;dur=[\d.]+;desc="\d+ queries"')
+        with override_settings(QUERY_INSTRUMENTATION=True):
+            self.assertIn("queries", self.get_timing())
+
+
+LOCMEM = {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}
+MEMCACHED = {
+    "BACKEND": "django.core.cache.backends.memcached.PyMemcacheCache",
+    "LOCATION": "memcached:11211",
+}
+SHARED_MEMBERSHIP = {
+    "BACKEND": "api.membership.CacheMembershipBackend",
+    "OPTIONS": {"alias": "default"},
+}
+
+
+class LocalCacheTests(SimpleTestCase):
+    """Кэши, из-за которых нельзя запускать несколько воркеров."""
+
+    @override_settings(
+        CACHES={"default": LOCMEM},
+        MEMBERSHIP_CACHE=SHARED_MEMBERSHIP,
+        TOKEN_AUTH_CACHE={"BACKEND": "api.membership.LocalMembershipBackend"},
+    )
+    def test_local(self):
+        self.assertEqual(
+            local_caches(),
+            ["CATALOGUE_CACHE", "MEMBERSHIP_CACHE", "TOKEN_AUTH_CACHE"],
+        )
+
+    @override_settings(
+        CACHES={"default": MEMCACHED},
+        MEMBERSHIP_CACHE=SHARED_MEMBERSHIP,
+        TOKEN_AUTH_CACHE=SHARED_MEMBERSHIP,
+    )
+    def test_shared(self):
+        self.assertEqual(local_caches(), [])
+
+
+@skipUnless(connection.vendor == "sqlite", "реплика — копия БД SQLite")
+@skipIf(REPLICA in connections.databases, "реплика задана в настройках")
+class ReplicaRoutingTests(TransactionTestCase):
+    """
+    Чтение с реплики и закрепление за основной БД после записи.
+
+    Реплика — отдельная БД SQLite, копия основной на момент
+    sync_replica(): строки, добавленные после, видны только в основной,
+    как при отставании реплики.
+    """
+
+    # Реплика добавляется в setUpClass: "__all__" раскрывается позже
+    # сбора тестов, и тестовая БД для нее не создается.
+    databases = "__all__"
+
+    @classmethod
+    def setUpClass(cls):
+        cls.replica_dir = tempfile.mkdtemp()
+        connections.databases[REPLICA] = {
+            "ENGINE": "django.db.backends.sqlite3",
+            "NAME": f"{cls.replica_dir}/replica.sqlite3",
+        }
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        connections[REPLICA].close()
+        del connections[REPLICA]
+        del connections.databases[REPLICA]
+        shutil.rmtree(cls.replica_dir, ignore_errors=True)
+
+    def setUp(self):
+        reset_caches()
+        flour = Ingredient.objects.create(name="мука", measurement_unit="г")
+        self.author, self.user = create_user("author"), create_user("user")
+        self.recipe = create_recipe(self.author, "Блины", [(flour, 200)])
+        self.sync_replica()
+        self.lagging = create_recipe(self.author, "Пирог", [(flour, 300)])
+
+    def sync_replica(self):
+        for alias in (DEFAULT_DB_ALIAS, REPLICA):
+            connections[alias].ensure_connection()
+        connections[DEFAULT_DB_ALIAS].connection.backup(
+            connections[REPLICA].connection
+        )
+
+    def get_recipe(self, client, recipe):
+        return client.get(f"/api/recipes/{recipe.id}/").status_code
+
+    def test_reads_go_to_replica(self):
+        self.assertEqual(self.get_recipe(APIClient(), self.recipe), 200)
+        self.assertEqual(self.get_recipe(APIClient(), self.lagging), 404)
+        response = APIClient().get("/api/recipes/")
+        self.assertEqual(
+            [recipe["name"] for recipe in get_results(response)], ["Блины"]
+        )
+
+    def test_writes_go_to_primary(self):
+        client = client_for(self.user)
+        response = client.post(f"/api/recipes/{self.lagging.id}/favorite/")
+        self.assertEqual(response.status_code, 201)
+        favourites = Favourites.objects.filter(user=self.user)
+        self.assertTrue(favourites.using(DEFAULT_DB_ALIAS).exists())
+        self.assertFalse(favourites.using(REPLICA).exists())
+
+    def test_read_after_write(self):
+        client = client_for(self.user)
+        client.post(f"/api/recipes/{self.recipe.id}/favorite/")
+        self.assertEqual(self.get_recipe(client, self.lagging), 200)
+        other = client_for(self.author)
+        self.assertEqual(self.get_recipe(other, self.lagging), 404)
+        caches["default"].delete(pin_key(self.user.id))
+        client.cookies.pop(PIN_COOKIE)
+        self.assertEqual(self.get_recipe(client, self.lagging), 404)
+
+    def test_pin_cookie(self):
+        client = client_for(self.user)
+        client.post(f"/api/recipes/{self.recipe.id}/favorite/")
+        cookie = client.cookies[PIN_COOKIE]
+        # Воркер без общего кэша видит закрепление по cookie.
+        caches["default"].delete(pin_key(self.user.id))
+        self.assertEqual(self.get_recipe(client, self.lagging), 200)
+        # Чужая cookie не закрепляет другого пользователя.
+        other = client_for(self.author)
+        other.cookies[PIN_COOKIE] = cookie.value
+        self.assertEqual(self.get_recipe(other, self.lagging), 404)
+
+    def test_routing_resets_between_requests(self):
+        client = client_for(self.user)
+        self.assertEqual(self.get_recipe(client, self.lagging), 404)
+        self.assertTrue(Recipe.objects.filter(pk=self.lagging.id).exists())
+        response = client.post(f"/api/recipes/{self.lagging.id}/favorite/")
+        self.assertEqual(response.status_code, 201)
+
+    def test_membership_from_primary(self):
+        Favourites.objects.create(user=self.user, recipe=self.recipe)
+        response = client_for(self.user).get(f"/api/recipes/{self.recipe.id}/")
+        self.assertTrue(response.json()["is_favorited"])
+
+
+def async_urlconf():
+    """Маршруты проекта с асинхронными вьюхами чтения api."""
+    spec = importlib.util.find_spec("api.urls")
+    urls = importlib.util.module_from_spec(spec)
+    with override_settings(ASYNC_READ_VIEWS=True):
+        spec.loader.exec_module(urls)
+    urlconf = types.ModuleType("async_urls")
+    urlconf.urlpatterns = [re_path(r"^api/", include(urls))]
+    return urlconf
+
+
+class AsyncParityTests(TransactionTestCase):
+    """
+    Асинхронные вьюхи чтения отдают те же ответы, что и вьюсеты.
+
+    TransactionTestCase: асинхронные вьюхи читают в пуле потоков через
+    свои соединения и не видят данных из транзакции теста.
+    """
+
+    def setUp(self):
+        flour = Ingredient.objects.create(name="мука", measurement_unit="г")
+        milk = Ingredient.objects.create(
+            name="молоко", measurement_unit="мл"
+        )
+        tag = Tag.objects.create(name="Обед", color="#E26C2D", slug="lunch")
+        self.author, self.user = create_user("author"), create_user("user")
+        recipes = [
+            create_recipe(
+                self.author, f"Блины {number}",
+                [(flour, 100 + number), (milk, 500)],
+                tags=[tag] if number % 2 else [],
+            )
+            for number in range(4)
+        ]
+        self.recipe = recipes[0]
+        add_relations(Favourites, self.user, [recipes[1].id])
+        add_relations(Carts, self.user, [recipes[2].id])
+        add_relations(Subscribe, self.user, [self.author.id])
+        self.tag, self.flour = tag, flour
+        self.async_urls = async_urlconf()
+
+    def get(self, client, path, urlconf=None):
+        reset_caches()
+        with override_settings(ROOT_URLCONF=urlconf or "foodgram.urls"):
+            response = client.get(path)
+        return response.status_code, response.content
+
+    def test_async_views_are_used(self):
+        view = resolve("/api/recipes/", urlconf=self.async_urls).func
+        self.assertTrue(asyncio.iscoroutinefunction(view))
+
+    def test_same_responses(self):
+        paths = (
+            "/api/tags/",
+            f"/api/tags/{self.tag.id}/",
+            "/api/ingredients/",
+            "/api/ingredients/?name=мо",
+            f"/api/ingredients/{self.flour.id}/",
+            "/api/recipes/?limit=2",
+            "/api/recipes/?limit=2&page=2",
+            "/api/recipes/?limit=2&page=9",
+            "/api/recipes/?tags=lunch",
+            "/api/recipes/?is_favorited=1",
+            "/api/recipes/?is_in_shopping_cart=1",
+            f"/api/recipes/?author={self.author.id}&limit=3",
+            f"/api/recipes/{self.recipe.id}/",
+            "/api/recipes/0/",
+            "/api/users/subscriptions/?limit=1&recipes_limit=2",
+        )
+        clients = {"user": client_for(self.user), "anonymous": APIClient()}
+        for path in paths:
+            for name, client in clients.items():
+                with self.subTest(path=path, client=name):
+                    self.assertEqual(
+                        self.get(client, path, self.async_urls),
+                        self.get(client, path),
+                    )
+
+
+@skipUnless(connection.vendor == "postgresql", "нужны блокировки строк")
+class ConcurrentRelationTests(TransactionTestCase):
+    """Одновременное добавление одного рецепта в корзину."""
+
+    def test_concurrent_add(self):
+        flour = Ingredient.objects.create(name="мука", measurement_unit="г")
+        author, user = create_user("author"), create_user("user")
+        recipe = create_recipe(author, "Блины", [(flour, 200)])
+        inserted = threading.Event()
+        results = {}
+
+        def first():
+            try:
+                with transaction.atomic():
+                    results["first"] = add_relations(Carts, user, [recipe.id])
+                    inserted.set()
+                    # Второе добавление ждет фиксации этой транзакции.
+                    time.sleep(0.3)
+            finally:
+                connection.close()
+
+        def second():
+            try:
+                inserted.wait()
+                results["second"] = add_relations(Carts, user, [recipe.id])
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=first),
+                   threading.Thread(target=second)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(results["first"], {recipe.id: CREATED})
+        self.assertEqual(results["second"], {recipe.id: EXISTS})
+        recipe.refresh_from_db()
+        self.assertEqual(recipe.in_carts_count, 1)
+        self.assertEqual(
+            list(ShoppingListItem.objects.values_list("amount", flat=True)),
+            [200],
+        )
+
+    def test_concurrent_add_by_two_users(self):
+        flour = Ingredient.objects.create(name="мука", measurement_unit="г")
+        author = create_user("author")
+        first_user, second_user = create_user("first"), create_user("second")
+        recipe = create_recipe(author, "Блины", [(flour, 200)])
+        inserted = threading.Event()
+
+        def first():
+            try:
+                with transaction.atomic():
+                    add_relations(Favourites, first_user, [recipe.id])
+                    add_relations(Subscribe, first_user, [author.id])
+                    inserted.set()
+                    time.sleep(0.3)
+            finally:
+                connection.close()
+
+        def second():
+            try:
+                inserted.wait()
+                add_relations(Favourites, second_user, [recipe.id])
+                add_relations(Subscribe, second_user, [author.id])
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=first),
+                   threading.Thread(target=second)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        recipe.refresh_from_db()
+        author.refresh_from_db()
+        self.assertEqual(recipe.favorites_count, 2)
+        self.assertEqual(author.followers_count, 2)
+
+    def test_concurrent_remove(self):
+        flour = Ingredient.objects.create(name="мука", measurement_unit="г")
+        author, user = create_user("author"), create_user("user")
+        recipe = create_recipe(author, "Блины", [(flour, 200)])
+        other = create_recipe(author, "Пирог", [(flour, 300)])
+        add_relations(Carts, user, [recipe.id, other.id])
+        removed = threading.Event()
+        results = {}
+
+        def first():
+            try:
+                with transaction.atomic():
+                    results["first"] = remove_relations(
+                        Carts, user, [recipe.id]
+                    )
+                    removed.set()
+                    time.sleep(0.3)
+            finally:
+                connection.close()
+
+        def second():
+            try:
+                removed.wait()
+                results["second"] = remove_relations(
+                    Carts, user, [recipe.id]
+                )
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=first),
+                   threading.Thread(target=second)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(results["first"], {recipe.id: DELETED})
+        self.assertEqual(results["second"], {recipe.id: NOT_FOUND})
+        self.assertEqual(
+            list(ShoppingListItem.objects.values_list("amount", flat=True)),
+            [300],
+        )
@@ -0,0 +1,67 @@
+import json
+import logging
+import os
+import threading
+import time
+from logging.handlers import RotatingFileHandler
+
+from django.conf import settings
+from django.utils.crypto import salted_hmac
+
+_logger = None
+_lock = threading.Lock()
+
+
+def get_logger():
+    """
+    Логгер журнала запросов: NDJSON с ротацией по размеру файла.
+
+    В пути можно указать {pid}: у каждого процесса gunicorn свой файл,
+    ротация из нескольких процессов одного файла небезопасна.
+    """
+    global _logger
+    with _lock:
+        if _logger is None:
+            handler = RotatingFileHandler(
+                settings.TRAFFIC_CAPTURE_PATH.format(pid=os.getpid()),
+                maxBytes=settings.TRAFFIC_CAPTURE_MAX_BYTES,
+                backupCount=settings.TRAFFIC_CAPTURE_BACKUPS,
+                encoding="UTF-8",
+            )
+            handler.setFormatter(logging.Formatter("%(message)s"))
+            logger = logging.getLogger("api.traffic")
+            logger.addHandler(handler)
+            logger.setLevel(logging.INFO)
+            logger.propagate = False
+            _logger = logger
+    return _logger
+
+
+def anonymize(user):
+    """Постоянный для пользователя псевдоним, по которому id не узнать."""
+    if user is None or not user.is_authenticated:
+        return None
+    return salted_hmac("api.traffic", str(user.pk)).hexdigest()[:16]
+
+
+def record(request, response, duration):
+    """Строка журнала: запрос, псевдоним пользователя, статус и время."""
+    get_logger().info(json.dumps({
+        "time": round(time.time(), 3),
+        "method": request.method,
+        "path": request.path,
+        "query": request.META.get("QUERY_STRING", ""),
+        "user": anonymize(getattr(request, "user", None)),
+        "status": response.status_code,
+        "duration_ms": round(duration * 1000, 2),
+    }, ensure_ascii=False))
+
+
+def read(paths):
+    """Записи журналов по порядку времени (файлы ротации — в любом)."""
+    entries = []
+    for path in paths:
+        with open(path, encoding="UTF-8") as file:
+            entries.extend(json.loads(line) for line in file if line.strip())
+    entries.sort(key=lambda entry: entry["time"])
+    return entries
@@ -1,3 +1,4 @@
+from django.conf import settings
 from django.urls import include, path
 from rest_framework.routers import DefaultRouter
 
@@ -13,7 +14,55 @@ router.register("tags", TagViewSet, basename="tags")
 router.register("recipes", RecipeViewSet, basename="recipes")
 router.register("users", CustomUserViewSet, basename="users")
 
-urlpatterns = (
+urlpatterns = [
     path("", include(router.urls)),
     path("auth/", include("djoser.urls.authtoken")),
-)
+]
+
+if settings.ASYNC_READ_VIEWS:
+    # Под ASGI чтение обслуживают асинхронные вьюхи, запись и остальные
+    # действия — те же вьюсеты. Маршруты стоят перед роутером.
+    from . import async_views
+
+    def sync_view(viewset, actions, basename, detail):
+        return viewset.as_view(actions, basename=basename, detail=detail)
+
+    urlpatterns = [
+        path("tags/", async_views.read_view(
+            async_views.tag_list,
+            sync_view(TagViewSet, {"get": "list"}, "tags", False),
+        )),
+        path("tags/<int:pk>/", async_views.read_view(
+            async_views.tag_detail,
+            sync_view(TagViewSet, {"get": "retrieve"}, "tags", True),
+        )),
+        path("ingredients/", async_views.read_view(
+            async_views.ingredient_list,
+            sync_view(IngredientViewSet, {"get": "list"}, "ingredients",
+                      False),
+        )),
+        path("ingredients/<int:pk>/", async_views.read_view(
+            async_views.ingredient_detail,
+            sync_view(IngredientViewSet, {"get": "retrieve"},
+                      "ingredients", True),
+        )),
+        path("recipes/", async_views.read_view(
+            async_views.recipe_list,
+            sync_view(RecipeViewSet, {"get": "list", "post": "create"},
+                      "recipes", False),
+        )),
+        path("recipes/<int:pk>/", async_views.read_view(
+            async_views.recipe_detail,
+            sync_view(RecipeViewSet, {
+                "get": "retrieve",
+                "put": "update",
+                "patch": "partial_update",
+                "delete": "destroy",
+            }, "recipes", True),
+        )),
+        path("users/subscriptions/", async_views.read_view(
+            async_views.subscription_list,
+            sync_view(CustomUserViewSet, {"get": "get_subscriptions"},
+                      "users", False),
+        )),
+    ] + urlpatterns
@@ -1,9 +1,12 @@
-import io
+from collections import defaultdict
 
-from django.http import FileResponse
+from django.conf import settings
+from django.db.models import F, Prefetch, Sum, Value
+from django.http import Http404, StreamingHttpResponse
 from django.shortcuts import get_object_or_404
 from django_filters.rest_framework import DjangoFilterBackend
 from djoser.views import UserViewSet
+from recipes import feed, minhash, shopping
 from recipes.models import (Carts, Favourites, Ingredient, Recipe,
                             RecipeIngredient, Tag)
 from rest_framework import exceptions, permissions, status
@@ -13,16 +16,29 @@ from rest_framework.response import Response
 from rest_framework.viewsets import ModelViewSet, ReadOnlyModelViewSet
 from users.models import Subscribe, User
 
-from .filters import RecipeFilter
-from .paginations import PageLimitPagination
+from .cache import CatalogueCacheMixin
+from .filters import RecipeFilter, RecipeSearchFilter
+from .membership import get_member_ids
+from .paginations import (CursorPaginationMixin, FeedPagination,
+                          PageLimitPagination, PantryPagination,
+                          SubscriptionCursorPagination)
+from .pantry import get_index as get_pantry_index
 from .permissions import IsAuthorOrReadOnly
-from .serializers import (CustomUserSerializer, IngredientSerializer,
+from .replica import ReplicaReadMixin
+from .relations import EXISTS, NOT_FOUND, add_relations, remove_relations
+from .renderers import (ShoppingListCSVRenderer, ShoppingListPDFRenderer,
+                        ShoppingListTXTRenderer)
+from .search import get_index
+from .serializers import (CustomUserSerializer, IdListSerializer,
+                          IngredientSerializer, PantryQuerySerializer,
+                          PantryRecipeSerializer, RecipeLeanSerializer,
                           RecipeReadSerializer, RecipeShortSerializer,
-                          RecipeWriteSerializer, SubscribeSerializer,
-                          TagSerializer)
+                          RecipeSimilarSerializer, RecipeWriteSerializer,
+                          SubscribeSerializer, TagSerializer)
 
 
-class IngredientViewSet(ReadOnlyModelViewSet):
+class IngredientViewSet(ReplicaReadMixin, CatalogueCacheMixin,
+                        ReadOnlyModelViewSet):
     """Вьюсет ингредиента."""
 
     queryset = Ingredient.objects.all()
@@ -31,8 +47,25 @@ class IngredientViewSet(ReadOnlyModelViewSet):
     filter_backends = [DjangoFilterBackend]
     pagination_class = None
 
+    def list(self, request, *args, **kwargs):
+        """
+        Список ингредиентов; с параметром name — автодополнение.
 
-class TagViewSet(ReadOnlyModelViewSet):
+        Поиск идет по индексу в памяти процесса и не обращается к БД.
+        Количество результатов ограничивается параметром limit.
+        """
+        name = request.query_params.get("name")
+        if name is None:
+            return super().list(request, *args, **kwargs)
+        limit = request.query_params.get("limit", "")
+        if limit.isdigit():
+            limit = min(int(limit), settings.INGREDIENT_SEARCH_MAX_LIMIT)
+        else:
+            limit = settings.INGREDIENT_SEARCH_LIMIT
+        return Response(get_index().search(name, limit))
+
+
+class TagViewSet(ReplicaReadMixin, CatalogueCacheMixin, ReadOnlyModelViewSet):
     """Вьюсет тегов."""
 
     queryset = Tag.objects.all()
@@ -40,26 +73,133 @@ class TagViewSet(ReadOnlyModelViewSet):
     permission_classes = (permissions.AllowAny,)
 
 
-class RecipeViewSet(ModelViewSet):
+class RecipeViewSet(ReplicaReadMixin, CursorPaginationMixin, ModelViewSet):
     """Вьюсет для работы с рецептами."""
 
     queryset = Recipe.objects.all()
     permission_classes = (IsAuthorOrReadOnly,)
     pagination_class = PageLimitPagination
-    filter_backends = [DjangoFilterBackend]
+    filter_backends = [DjangoFilterBackend, RecipeSearchFilter]
     filterset_class = RecipeFilter
 
+    def get_queryset(self):
+        """
+        Рецепты со всеми данными для чтения за фиксированное число запросов.
+
+        Автор подтягивается через JOIN, теги и ингредиенты — prefetch.
+        Флаги избранного, корзины и подписки берутся из кэша членства.
+        """
+        return Recipe.objects.select_related("author").prefetch_related(
+            Prefetch("tags", queryset=Tag.objects.order_by("id")),
+            Prefetch(
+                "RecipeIngredient",
+                queryset=RecipeIngredient.objects.select_related(
+                    "ingredient"
+                ).order_by("id"),
+            ),
+        )
+
+    def get_read_queryset(self):
+        """
+        Отфильтрованные рецепты для списка.
+
+        С LEAN_READ_SERIALIZERS — строки values() для
+        RecipeLeanSerializer (тот же JSON без экземпляров моделей).
+        """
+        if settings.LEAN_READ_SERIALIZERS:
+            return RecipeLeanSerializer.get_rows(
+                self.filter_queryset(self.queryset.all())
+            )
+        return self.filter_queryset(self.get_queryset())
+
+    @staticmethod
+    def load_page(page):
+        """Теги и ингредиенты строк страницы (для экземпляров — prefetch)."""
+        if settings.LEAN_READ_SERIALIZERS:
+            return RecipeLeanSerializer.load(page)
+        return page
+
+    def get_read_object(self):
+        """Рецепт по pk: строка с тегами и ингредиентами или экземпляр."""
+        if not settings.LEAN_READ_SERIALIZERS:
+            return self.get_object()
+        try:
+            queryset = self.queryset.filter(pk=self.kwargs["pk"])
+        except (TypeError, ValueError):
+            raise Http404
+        rows = RecipeLeanSerializer.load(
+            RecipeLeanSerializer.get_rows(queryset)
+        )
+        if not rows:
+            raise Http404
+        return rows[0]
+
+    def get_read_serializer(self, data, many=False, context=None):
+        if settings.LEAN_READ_SERIALIZERS:
+            serializer_class = RecipeLeanSerializer
+        else:
+            serializer_class = RecipeReadSerializer
+        return serializer_class(
+            data, many=many, context=context or self.get_serializer_context()
+        )
+
+    def list(self, request, *args, **kwargs):
+        queryset = self.get_read_queryset()
+        page = self.paginate_queryset(queryset)
+        serializer = self.get_read_serializer(
+            self.load_page(queryset if page is None else page), many=True
+        )
+        if page is None:
+            return Response(serializer.data)
+        return self.get_paginated_response(serializer.data)
+
+    def retrieve(self, request, *args, **kwargs):
+        serializer = self.get_read_serializer(self.get_read_object())
+        return Response(serializer.data)
+
+    def get_cursor_ordering(self):
+        """При поиске курсор строится по релевантности, а не по id."""
+        query = self.request.query_params.get(RecipeSearchFilter.search_param)
+        if RecipeSearchFilter.get_words(query or ""):
+            return ("-search_rank", "id")
+        return None
+
     def perform_create(self, serializer):
         serializer.save(author=self.request.user)
 
+    def get_similar_limit(self):
+        """Количество похожих рецептов из ?limit=, не больше top-K."""
+        limit = self.request.query_params.get("limit", "")
+        if limit.isdigit():
+            return min(int(limit), settings.SIMILAR_RECIPES_TOP_K)
+        return settings.SIMILAR_RECIPES_LIMIT
+
     @staticmethod
     def add_to(model, user, pk):
         """Добавление рецепта в избранное или в список покупок."""
         recipe = get_object_or_404(Recipe, id=pk)
-        model.objects.create(user=user, recipe=recipe)
+        results = add_relations(model, user, [recipe.id])
+        if results[recipe.id] == EXISTS:
+            raise exceptions.ValidationError("Рецепт уже добавлен.")
         serializer = RecipeShortSerializer(recipe)
         return Response(serializer.data, status=status.HTTP_201_CREATED)
 
+    @staticmethod
+    def change_batch(model, request):
+        """Пакетное добавление (POST) или удаление (DELETE) рецептов."""
+        serializer = IdListSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        ids = serializer.validated_data["ids"]
+        if request.method == "POST":
+            results = add_relations(model, request.user, ids)
+        else:
+            results = remove_relations(model, request.user, ids)
+        return Response({
+            "results": [
+                {"id": pk, "status": result} for pk, result in results.items()
+            ]
+        })
+
     def get_serializer_class(self):
         """Получение сериализатора в зависимости от метода."""
         if self.request.method in SAFE_METHODS:
@@ -82,9 +222,25 @@ class RecipeViewSet(ModelViewSet):
         if request.method == "POST":
             return self.add_to(model=Favourites, user=request.user, pk=pk)
         else:
-            Favourites.objects.filter(user=request.user, recipe_id=pk).delete()
+            remove_relations(Favourites, request.user, [pk])
             return Response(status=status.HTTP_204_NO_CONTENT)
 
+    @action(
+        detail=False,
+        methods=[
+            "post",
+            "delete",
+        ],
+        url_path="favorite",
+        url_name="favorite-batch",
+        permission_classes=[
+            IsAuthenticated,
+        ],
+    )
+    def favorite_batch(self, request):
+        """Добавление и удаление списка рецептов из избранного."""
+        return self.change_batch(model=Favourites, request=request)
+
     @action(
         detail=True,
         url_path="shopping_cart",
@@ -101,50 +257,211 @@ class RecipeViewSet(ModelViewSet):
         if request.method == "POST":
             return self.add_to(model=Carts, user=request.user, pk=pk)
         else:
-            Carts.objects.filter(recipe_id=pk, user=request.user).delete()
+            remove_relations(Carts, request.user, [pk])
             return Response(status=status.HTTP_204_NO_CONTENT)
 
+    @action(
+        detail=False,
+        url_path="shopping_cart",
+        url_name="shopping-cart-batch",
+        methods=[
+            "post",
+            "delete",
+        ],
+        permission_classes=[
+            IsAuthenticated,
+        ],
+    )
+    def shopping_cart_batch(self, request):
+        """Добавление и удаление списка рецептов из списка покупок."""
+        return self.change_batch(model=Carts, request=request)
+
     @action(
         detail=False,
         url_path="download_shopping_cart",
         permission_classes=[
             IsAuthenticated,
         ],
+        renderer_classes=[
+            ShoppingListTXTRenderer,
+            ShoppingListCSVRenderer,
+            ShoppingListPDFRenderer,
+        ],
     )
     def download_carts(self, request):
-        """Формирование и загрузка текстового файла с ингредиентами."""
-        carts = (
-            Carts.objects.select_related("recipe")
-            .filter(user=request.user)
-            .values_list("recipe_id", flat=True)
-        )
-        output = io.StringIO()
-        data = {}
-        for recipe in carts:
-            ingredients = RecipeIngredient.objects.values_list(
-                "ingredient__name", "ingredient__measurement_unit", "amount"
-            ).filter(recipe_id=recipe)
-            for item in ingredients:
-                ingredient_name = item[0]
-                ingredient_unit = item[1]
-                amount = item[2]
-                if ingredient_name in data:
-                    data[
-                        ingredient_name
-                    ]["amount"] += int(amount)
-                else:
-                    data[ingredient_name] = {
-                        "amount": int(amount), "unit": ingredient_unit
-                    }
-        for key in data.keys():
-            output.write(f'{key}-{data[key]["amount"]} {data[key]["unit"]}\n')
-        filename = "carts.txt"
-        response = FileResponse(output.getvalue(), content_type="text.txt")
+        """
+        Загрузка списка покупок в формате txt, csv или pdf (?format=).
+
+        Суммы ингредиентов читаются одним запросом из списка покупок,
+        который поддерживается при изменении корзины; файл отдается
+        потоком по мере чтения строк.
+        """
+        ingredients = shopping.get_items(request.user)
+        renderer = request.accepted_renderer
+        content_type = renderer.media_type
+        if renderer.charset:
+            content_type = f"{content_type}; charset={renderer.charset}"
+        response = StreamingHttpResponse(
+            renderer.stream(ingredients.iterator()),
+            content_type=content_type,
+        )
+        filename = f"carts.{renderer.format}"
         response["Content-Disposition"] = f"attachment; filename={filename}"
         return response
 
+    @action(
+        detail=False,
+        url_path="shopping_cart/summary",
+        url_name="shopping-cart-summary",
+        permission_classes=[
+            IsAuthenticated,
+        ],
+    )
+    def shopping_cart_summary(self, request):
+        """Список покупок в JSON: суммы ингредиентов рецептов корзины."""
+        return Response([
+            {"name": name, "measurement_unit": unit, "amount": amount}
+            for name, unit, amount in shopping.get_items(request.user)
+        ])
+
+    @action(detail=True)
+    def similar(self, request, pk):
+        """
+        Рецепты, которые добавляют вместе с этим (избранное и корзины).
+
+        Читаются одним запросом из таблицы, рассчитанной командой
+        build_similarities.
+        """
+        recipes = list(
+            Recipe.objects.filter(similar_to__recipe_id=pk)
+            .annotate(score=F("similar_to__score"))
+            .order_by("-score", "id")[:self.get_similar_limit()]
+        )
+        if not recipes:
+            get_object_or_404(Recipe, id=pk)
+        serializer = RecipeSimilarSerializer(
+            recipes, many=True, context=self.get_serializer_context()
+        )
+        return Response(serializer.data)
+
+    @action(detail=True, url_path="similar-by-ingredients")
+    def similar_by_ingredients(self, request, pk):
+        """
+        Рецепты с похожим составом по оценке коэффициента Жаккара.
+
+        Кандидаты выбираются по LSH-корзинам MinHash-подписи, поэтому
+        со всеми рецептами рецепт не сравнивается.
+        """
+        recipe = get_object_or_404(
+            Recipe.objects.only("id", "ingredients_minhash"), id=pk
+        )
+        found = minhash.similar_recipes(recipe)[:self.get_similar_limit()]
+        recipes = Recipe.objects.in_bulk([pk for _, pk in found])
+        results = []
+        for score, pk in found:
+            if pk in recipes:
+                recipes[pk].score = score
+                results.append(recipes[pk])
+        serializer = RecipeSimilarSerializer(
+            results, many=True, context=self.get_serializer_context()
+        )
+        return Response(serializer.data)
+
+    @action(detail=False, permission_classes=[IsAuthenticated])
+    def recommended(self, request):
+        """
+        Рекомендации по избранному и корзине пользователя.
+
+        Сходства со всеми его рецептами суммируются одним запросом;
+        уже добавленные и собственные рецепты не показываются.
+        """
+        seeds = (
+            get_member_ids(request.user, "favorites")
+            | get_member_ids(request.user, "carts")
+        )
+        recipes = []
+        if seeds:
+            recipes = (
+                Recipe.objects.filter(similar_to__recipe_id__in=seeds)
+                .exclude(id__in=seeds)
+                .exclude(author=request.user)
+                .annotate(score=Sum("similar_to__score"))
+                .order_by("-score", "id")[:self.get_similar_limit()]
+            )
+        serializer = RecipeSimilarSerializer(
+            recipes, many=True, context=self.get_serializer_context()
+        )
+        return Response(serializer.data)
+
+    @action(detail=False, permission_classes=[IsAuthenticated])
+    def feed(self, request):
+        """
+        Новые рецепты авторов из подписок пользователя.
+
+        Читается из материализованной ленты; рецепты авторов с очень
+        большим числом подписчиков подмешиваются при чтении.
+        """
+        author_ids = get_member_ids(request.user, "subscriptions")
+        paginator = FeedPagination()
+        ids = paginator.paginate_queryset(
+            lambda before, limit: feed.timeline(
+                request.user, author_ids, before, limit
+            ),
+            request,
+            view=self,
+        )
+        recipes = self.get_queryset().in_bulk(ids)
+        serializer = RecipeReadSerializer(
+            [recipes[pk] for pk in ids if pk in recipes],
+            many=True,
+            context=self.get_serializer_context(),
+        )
+        return paginator.get_paginated_response(serializer.data)
+
+    @action(detail=False)
+    def pantry(self, request):
+        """
+        Рецепты из имеющихся продуктов (?ingredients=1&ingredients=2).
+
+        Сначала рецепты с наибольшей долей имеющихся ингредиентов.
+        ?missing=K оставляет рецепты, где не хватает не больше K
+        ингредиентов, ?tags= — рецепты с любым из тегов. Покрытие
+        считается по индексу в памяти, из БД читается только страница.
+        """
+        serializer = PantryQuerySerializer(data=request.query_params)
+        serializer.is_valid(raise_exception=True)
+        params = serializer.validated_data
+        tag_ids = None
+        if params.get("tags"):
+            tag_ids = list(
+                Tag.objects.filter(slug__in=params["tags"])
+                .values_list("id", flat=True)
+            )
+        found = get_pantry_index().search(
+            params["ingredients"], params.get("missing"), tag_ids
+        )
+        paginator = PantryPagination()
+        page = paginator.paginate_queryset(found, request, view=self)
+        recipes = self.get_queryset().in_bulk(
+            [recipe_id for recipe_id, _, _ in page]
+        )
+        results = []
+        for recipe_id, matched, missing in page:
+            recipe = recipes.get(recipe_id)
+            if recipe is None:
+                continue
+            recipe.matched = matched
+            recipe.missing = missing
+            recipe.coverage = round(matched / (matched + missing), 4)
+            results.append(recipe)
+        serializer = PantryRecipeSerializer(
+            results, many=True, context=self.get_serializer_context()
+        )
+        return paginator.get_paginated_response(serializer.data)
 
-class CustomUserViewSet(UserViewSet):
+
+class CustomUserViewSet(ReplicaReadMixin, CursorPaginationMixin,
+                        UserViewSet):
     """Вьюсет для работы с пользователем."""
 
     queryset = User.objects.all()
@@ -157,19 +474,67 @@ class CustomUserViewSet(UserViewSet):
         """Получение объекта пользователя."""
         return get_object_or_404(User, id=id_user)
 
+    @staticmethod
+    def get_recipes_limit(request):
+        """Ограничение количества рецептов автора из ?recipes_limit=."""
+        recipes_limit = request.query_params.get("recipes_limit", "")
+        return int(recipes_limit) if recipes_limit.isdigit() else None
+
+    @staticmethod
+    def prefetch_latest_recipes(authors, recipes_limit):
+        """
+        Последние recipes_limit рецептов каждого автора страницы.
+
+        Выбираются одним запросом с ROW_NUMBER() OVER (PARTITION BY
+        author) и раскладываются по авторам в latest_recipes.
+        """
+        if not authors:
+            return
+        recipes = Recipe.objects.filter(
+            author__in=authors
+        ).order_by("-id")
+        if recipes_limit is not None:
+            table = Recipe._meta.db_table
+            placeholders = ", ".join(["%s"] * len(authors))
+            recipes = Recipe.objects.raw(
+                f"SELECT * FROM (SELECT *, ROW_NUMBER() OVER ("
+                f"PARTITION BY author_id ORDER BY id DESC) AS row_number "
+                f"FROM {table} WHERE author_id IN ({placeholders})) AS r "
+                f"WHERE row_number <= %s ORDER BY id DESC",
+                [author.id for author in authors] + [recipes_limit],
+            )
+        by_author = defaultdict(list)
+        for recipe in recipes:
+            by_author[recipe.author_id].append(recipe)
+        for author in authors:
+            author.latest_recipes = by_author[author.id]
+
+    @staticmethod
+    def get_subscriptions_queryset(user):
+        """Авторы, на которых подписан пользователь."""
+        return User.objects.filter(subscribing__user=user.pk).annotate(
+            subscription_id=F("subscribing__id"),
+            is_subscribed=Value(True),
+        )
+
     @action(
         detail=False,
         methods=["get"],
         url_path="subscriptions",
         permission_classes=(IsAuthorOrReadOnly,),
+        cursor_pagination_class=SubscriptionCursorPagination,
     )
     def get_subscriptions(self, request):
         """Получение подписок."""
-        queryset = User.objects.filter(subscribing__user=request.user.pk)
+        queryset = self.get_subscriptions_queryset(request.user)
         pages = self.paginate_queryset(queryset=queryset)
-        serializer = SubscribeSerializer(pages,
-                                         many=True,
-                                         context={"request": request})
+        recipes_limit = self.get_recipes_limit(request)
+        self.prefetch_latest_recipes(pages, recipes_limit)
+        serializer = SubscribeSerializer(
+            pages,
+            many=True,
+            context={"request": request, "recipes_limit": recipes_limit},
+        )
         return self.get_paginated_response(serializer.data)
 
     @action(
@@ -184,17 +549,51 @@ class CustomUserViewSet(UserViewSet):
             raise exceptions.ValidationError(
                 "Невозможно подписаться на себя ."
             )
-        _, created = Subscribe.objects.get_or_create(
-            user=request.user,
-            author=author)
-        if not created:
+        results = add_relations(Subscribe, request.user, [author.id])
+        if results[author.id] == EXISTS:
             raise exceptions.ValidationError(f"Вы уже подписаны на {author}")
-        serializer = self.get_serializer(author)
+        author.is_subscribed = True
+        serializer = self.get_serializer(
+            author,
+            context={
+                **self.get_serializer_context(),
+                "recipes_limit": self.get_recipes_limit(request),
+            },
+        )
         return Response(serializer.data, status=status.HTTP_201_CREATED)
 
     @subscribe.mapping.delete
     def unsubscribe(self, request, **kwargs):
         """Отписка от пользователя."""
         author = self.get_user(id_user=kwargs["id"])
-        get_object_or_404(Subscribe, user=request.user, author=author).delete()
+        results = remove_relations(Subscribe, request.user, [author.id])
+        if results[author.id] == NOT_FOUND:
+            raise Http404
         return Response(status=status.HTTP_204_NO_CONTENT)
+
+    @action(
+        detail=False,
+        methods=["post", "delete"],
+        url_path="subscribe",
+        url_name="subscribe-batch",
+        permission_classes=(IsAuthenticated,),
+        serializer_class=IdListSerializer,
+    )
+    def subscribe_batch(self, request):
+        """Подписка на список авторов и отписка от них."""
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        ids = serializer.validated_data["ids"]
+        results = {}
+        if request.user.id in ids:
+            results[request.user.id] = "self"
+            ids = [pk for pk in ids if pk != request.user.id]
+        if request.method == "POST":
+            results.update(add_relations(Subscribe, request.user, ids))
+        else:
+            results.update(remove_relations(Subscribe, request.user, ids))
+        return Response({
+            "results": [
+                {"id": pk, "status": result} for pk, result in results.items()
+            ]
+        })
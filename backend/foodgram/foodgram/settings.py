@@ -35,6 +35,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'api.middleware.QueryInstrumentationMiddleware',
+    'api.middleware.TrafficCaptureMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -46,6 +48,23 @@ MIDDLEWARE = [
 
 ROOT_URLCONF = 'foodgram.urls'
 
+# Server-Timing с числом и временем запросов к БД для всех ответов;
+# без нее — только администраторам по заголовку X-Debug-Queries.
+QUERY_INSTRUMENTATION = os.getenv(
+    'QUERY_INSTRUMENTATION', ''
+) in ('1', 'true', 'True')
+
+# Журнал выборки запросов к api (NDJSON) для команды replay_traffic;
+# без пути запись выключена. {pid} в пути — отдельный файл процесса.
+TRAFFIC_CAPTURE_PATH = os.getenv('TRAFFIC_CAPTURE_PATH', '')
+TRAFFIC_CAPTURE_SAMPLE_RATE = float(
+    os.getenv('TRAFFIC_CAPTURE_SAMPLE_RATE', 0.1)
+)
+TRAFFIC_CAPTURE_MAX_BYTES = int(
+    os.getenv('TRAFFIC_CAPTURE_MAX_BYTES', 50 * 1024 * 1024)
+)
+TRAFFIC_CAPTURE_BACKUPS = int(os.getenv('TRAFFIC_CAPTURE_BACKUPS', 5))
+
 TEMPLATES = [
     {
         'BACKEND': 'django.template.backends.django.DjangoTemplates',
@@ -63,6 +82,11 @@ TEMPLATES = [
 ]
 
 WSGI_APPLICATION = 'foodgram.wsgi.application'
+ASGI_APPLICATION = 'foodgram.asgi.application'
+
+# Асинхронные вьюхи чтения (api.async_views) для запуска под ASGI,
+# включается конфигурацией gunicorn с воркером uvicorn.
+ASYNC_READ_VIEWS = os.getenv('ASYNC_READ_VIEWS', '') in ('1', 'true', 'True')
 
 
 # Database
@@ -83,10 +107,32 @@ DATABASES = {
         'USER': os.getenv('POSTGRES_USER', 'django'),
         'PASSWORD': os.getenv('POSTGRES_PASSWORD', 'mysecretpassword'),
         'HOST': os.getenv('DB_HOST', 'db'),
-        'PORT': os.getenv('DB_PORT', 5432)
+        'PORT': os.getenv('DB_PORT', 5432),
+        # Постоянные соединения: секунды жизни, 0 — новое на каждый запрос.
+        'CONN_MAX_AGE': int(os.getenv('DB_CONN_MAX_AGE', 60)),
+        # Для пула PgBouncer в режиме transaction: DB_HOST=pgbouncer и
+        # DB_DISABLE_SERVER_SIDE_CURSORS=True (iterator() без курсоров).
+        'DISABLE_SERVER_SIDE_CURSORS': os.getenv(
+            'DB_DISABLE_SERVER_SIDE_CURSORS', ''
+        ) in ('1', 'true', 'True'),
     }
 }
 
+# Реплика только для чтения (потоковая репликация PostgreSQL):
+# запросы чтения вьюсетов api идут на нее через api.replica.
+if os.getenv('DB_REPLICA_HOST'):
+    DATABASES['replica'] = {
+        **DATABASES['default'],
+        'HOST': os.getenv('DB_REPLICA_HOST'),
+        'PORT': os.getenv('DB_REPLICA_PORT', DATABASES['default']['PORT']),
+        'TEST': {'MIRROR': 'default'},
+    }
+
+DATABASE_ROUTERS = ['api.replica.ReplicaRouter']
+
+# Сколько секунд после записи пользователь читает из основной БД.
+REPLICA_PIN_SECONDS = int(os.getenv('REPLICA_PIN_SECONDS', 5))
+
 AUTH_PASSWORD_VALIDATORS = [
     {
         'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator',
@@ -119,19 +165,64 @@ STATIC_ROOT = BASE_DIR / 'collected_static'
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
+IMAGE_VARIANT_WORKERS = int(os.getenv('IMAGE_VARIANT_WORKERS', 2))
+
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
+# Для нескольких воркеров нужен общий кэш, например
+# CACHE_BACKEND=django.core.cache.backends.memcached.PyMemcacheCache
+# и CACHE_LOCATION=memcached:11211. С локальными кэшами gunicorn.conf.py
+# не запускает больше одного воркера (api.cache.local_caches).
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv(
+            'CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'
+        ),
+        'LOCATION': os.getenv('CACHE_LOCATION', ''),
+    }
+}
+
+CATALOGUE_CACHE = 'default'
+CATALOGUE_CACHE_TIMEOUT = 60 * 60 * 24
+
+# Кэш избранного, корзин и подписок пользователей. Сквозная запись
+# видна всем процессам только в общем кэше, поэтому записи хранятся в
+# CACHES; LocalMembershipBackend (в памяти процесса) — для одного
+# воркера: 'OPTIONS': {'max_entries': 10000, 'timeout': 300}.
+MEMBERSHIP_CACHE = {
+    'BACKEND': 'api.membership.CacheMembershipBackend',
+    'OPTIONS': {'alias': 'default', 'timeout': 300},
+}
+
+# Кэш токенов аутентификации (api.authentication), классы те же, что у
+# MEMBERSHIP_CACHE. В общем кэше отзыв токена сразу виден всем
+# процессам.
+TOKEN_AUTH_CACHE = {
+    'BACKEND': 'api.membership.CacheMembershipBackend',
+    'OPTIONS': {'alias': 'default', 'timeout': 60},
+}
+
 REST_FRAMEWORK = {
     'DEFAULT_PERMISSION_CLASSES': (
         'rest_framework.permissions.AllowAny',
     ),
 
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework.authentication.TokenAuthentication',
-    )
+        'api.authentication.CachedTokenAuthentication',
+    ),
+
+    'DEFAULT_RENDERER_CLASSES': (
+        'api.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ),
 }
 
+# Чтение рецептов из values() без экземпляров моделей (тот же JSON).
+LEAN_READ_SERIALIZERS = os.getenv(
+    'LEAN_READ_SERIALIZERS', 'True'
+) in ('1', 'true', 'True')
+
 
 DJOSER = {
     'LOGIN_FIELD': 'email',
@@ -148,3 +239,34 @@ DJOSER = {
 }
 
 AUTH_USER_MODEL = 'users.User'
+
+BATCH_MAX_SIZE = 100
+
+INGREDIENT_SEARCH_LIMIT = 20
+INGREDIENT_SEARCH_MAX_LIMIT = 100
+# Как часто (с) пересчитывать частоту ингредиентов в рецептах для
+# порядка автодополнения, если рецепты менялись.
+INGREDIENT_USAGE_REFRESH_INTERVAL = 300
+
+PANTRY_PAGE_SIZE = 20
+PANTRY_MAX_PAGE_SIZE = 100
+PANTRY_MAX_INGREDIENTS = 200
+PANTRY_INDEX_REBUILD_INTERVAL = 60
+
+SIMILAR_RECIPES_TOP_K = 20
+SIMILAR_RECIPES_LIMIT = 10
+
+MINHASH_NUM_PERM = 64
+MINHASH_BANDS = 16
+RECIPE_DUPLICATE_THRESHOLD = 0.8
+
+FEED_PAGE_SIZE = 20
+FEED_MAX_PAGE_SIZE = 100
+FEED_BACKFILL = 50
+FEED_FANOUT_MAX_FOLLOWERS = int(os.getenv('FEED_FANOUT_MAX_FOLLOWERS', 10000))
+FEED_FANOUT_WORKERS = int(os.getenv('FEED_FANOUT_WORKERS', 2))
+
+SHOPPING_LIST_PDF_FONT = os.getenv(
+    'SHOPPING_LIST_PDF_FONT',
+    '/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf'
+)
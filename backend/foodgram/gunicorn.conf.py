@@ -0,0 +1,39 @@
+import os
+
+# По умолчанию приложение работает на синхронном стеке WSGI. ASGI с
+# воркерами uvicorn и асинхронными вьюхами чтения включается
+# окружением: GUNICORN_APP=foodgram.asgi:application.
+app = os.getenv('GUNICORN_APP', 'foodgram.wsgi:application')
+bind = os.getenv('GUNICORN_BIND', '0:8000')
+# Кэши справочников, членства и токенов по умолчанию локальны для
+# процесса (LocMemCache), поэтому по умолчанию один воркер. Больше
+# воркеров — только с общим кэшем, см. CACHES в settings.py.
+workers = int(os.getenv('GUNICORN_WORKERS', 1))
+worker_class = os.getenv(
+    'GUNICORN_WORKER_CLASS',
+    'uvicorn.workers.UvicornWorker' if app.startswith('foodgram.asgi:')
+    else 'sync',
+)
+timeout = int(os.getenv('GUNICORN_TIMEOUT', 30))
+keepalive = int(os.getenv('GUNICORN_KEEPALIVE', 5))
+max_requests = int(os.getenv('GUNICORN_MAX_REQUESTS', 0))
+max_requests_jitter = max_requests // 10
+
+if worker_class.startswith('uvicorn.'):
+    os.environ.setdefault('ASYNC_READ_VIEWS', 'True')
+
+
+def on_starting(server):
+    """Не запускать несколько воркеров с кэшами в памяти процесса."""
+    if server.cfg.workers < 2 or os.getenv('GUNICORN_ALLOW_LOCAL_CACHES'):
+        return
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'foodgram.settings')
+    from api.cache import local_caches
+
+    names = local_caches()
+    if names:
+        raise RuntimeError(
+            f'Воркеров: {server.cfg.workers}, а кэши локальны для '
+            f'процесса: {", ".join(names)}. Настройте общий кэш или '
+            f'задайте GUNICORN_ALLOW_LOCAL_CACHES=1'
+        )
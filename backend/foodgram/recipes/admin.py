@@ -1,6 +1,8 @@
-from django.contrib import admin
-from django.contrib.admin import display
+from django.conf import settings
+from django.contrib import admin, messages
+from django.contrib.admin import action, display
 
+from . import minhash
 from .models import (Carts, Favourites, Ingredient, Recipe, RecipeIngredient,
                      Tag)
 
@@ -33,10 +35,50 @@ class RecipeAdmin(admin.ModelAdmin):
         "name",
         "tags"
     )
+    actions = ("find_duplicates",)
 
-    @display(description="Количество в избранных")
+    @display(description="Количество в избранных",
+             ordering="favorites_count")
     def added_in_favorites(self, obj):
-        return obj.favorites.count()
+        return obj.favorites_count
+
+    def save_related(self, request, form, formsets, change):
+        """Пересчет MinHash-подписи после сохранения ингредиентов."""
+        super().save_related(request, form, formsets, change)
+        recipe = form.instance
+        minhash.store({recipe: list(
+            recipe.RecipeIngredient.values_list("ingredient_id", flat=True)
+        )})
+
+    @action(description="Найти похожие по составу (дубликаты)")
+    def find_duplicates(self, request, queryset):
+        """
+        Рецепты, похожие на выбранные по ингредиентам.
+
+        Кандидаты ищутся по LSH-корзинам, показываются рецепты с оценкой
+        коэффициента Жаккара не ниже RECIPE_DUPLICATE_THRESHOLD.
+        """
+        threshold = settings.RECIPE_DUPLICATE_THRESHOLD
+        found = 0
+        for recipe in queryset.only("id", "name", "ingredients_minhash"):
+            similar = minhash.similar_recipes(recipe, threshold)
+            if not similar:
+                continue
+            found += 1
+            names = dict(Recipe.objects.filter(
+                id__in=[pk for _, pk in similar]
+            ).values_list("id", "name"))
+            neighbours = ", ".join(
+                f"{names[pk]} (id {pk}, {score:.0%})"
+                for score, pk in similar
+            )
+            self.message_user(
+                request,
+                f"{recipe.name} (id {recipe.id}): {neighbours}",
+                messages.WARNING,
+            )
+        if not found:
+            self.message_user(request, "Похожих рецептов не найдено.")
 
 
 @admin.register(Ingredient)
@@ -0,0 +1,58 @@
+from django.contrib.auth import get_user_model
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+from users.models import Subscribe
+
+from .models import Carts, Favourites, Recipe
+
+User = get_user_model()
+
+# Счетчик: модель, поле, связанная модель и поле связи с моделью.
+COUNTERS = (
+    (Recipe, "favorites_count", Favourites, "recipe"),
+    (Recipe, "in_carts_count", Carts, "recipe"),
+    (User, "recipes_count", Recipe, "author"),
+    (User, "followers_count", Subscribe, "author"),
+)
+
+
+def count_of(model, field):
+    """Подзапрос с количеством связанных строк для каждой записи."""
+    return Coalesce(Subquery(
+        model.objects.filter(**{field: OuterRef("pk")})
+        .order_by().values(field).annotate(total=Count("pk"))
+        .values("total")
+    ), 0)
+
+
+def recount(related, pks=None):
+    """
+    Пересчет счетчиков, которые зависят от модели related.
+
+    Обновляются только разошедшиеся строки; pks ограничивает пересчет
+    заданными записями. Возвращает список (модель, поле, исправлено).
+    """
+    result = []
+    for model, field, counted, counted_field in COUNTERS:
+        if related is not None and counted is not related:
+            continue
+        actual = count_of(counted, counted_field)
+        queryset = model.objects.all()
+        if pks is not None:
+            queryset = queryset.filter(pk__in=pks)
+        fixed = queryset.exclude(**{field: actual}).update(**{field: actual})
+        result.append((model, field, fixed))
+    return result
+
+
+def increment(related, pks):
+    """
+    Счетчики, которые зависят от модели related, +1 для записей pks.
+
+    Для пакетной вставки связей одного пользователя: каждая запись
+    получает одну новую строку. F() не теряет одновременные изменения,
+    как и сигналы удаления.
+    """
+    for model, field, counted, _ in COUNTERS:
+        if counted is related:
+            model.objects.filter(pk__in=pks).update(**{field: F(field) + 1})
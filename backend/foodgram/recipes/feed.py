@@ -0,0 +1,128 @@
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import close_old_connections, connection
+from users.models import Subscribe
+
+from .models import FeedItem, Recipe
+
+logger = logging.getLogger(__name__)
+
+User = get_user_model()
+
+BATCH_SIZE = 1000
+
+_executor = None
+_lock = threading.Lock()
+
+
+def is_big(followers_count):
+    """Рецепты такого автора не раскладываются по лентам подписчиков."""
+    return followers_count > settings.FEED_FANOUT_MAX_FOLLOWERS
+
+
+def big_author_ids(author_ids):
+    """Авторы из списка, рецепты которых читаются в обход ленты."""
+    return list(
+        User.objects.filter(
+            id__in=author_ids,
+            followers_count__gt=settings.FEED_FANOUT_MAX_FOLLOWERS,
+        ).values_list("id", flat=True)
+    )
+
+
+def fan_out(recipe_id, author_id):
+    """Добавление рецепта в ленты всех подписчиков автора пачками."""
+    followers = (
+        Subscribe.objects.filter(author_id=author_id)
+        .values_list("user_id", flat=True).order_by()
+        .iterator(chunk_size=BATCH_SIZE)
+    )
+    batch = []
+    for user_id in followers:
+        batch.append(FeedItem(
+            user_id=user_id, recipe_id=recipe_id, author_id=author_id
+        ))
+        if len(batch) == BATCH_SIZE:
+            FeedItem.objects.bulk_create(batch, ignore_conflicts=True)
+            batch = []
+    FeedItem.objects.bulk_create(batch, ignore_conflicts=True)
+
+
+def backfill(user, author_ids):
+    """
+    Заполнение ленты последними рецептами новых авторов подписки.
+
+    Берется не больше FEED_BACKFILL рецептов каждого автора; авторы
+    с очень большим числом подписчиков пропускаются.
+    """
+    big = set(big_author_ids(author_ids))
+    items = []
+    for author_id in author_ids:
+        if author_id in big:
+            continue
+        items.extend(
+            FeedItem(user=user, recipe_id=recipe_id, author_id=author_id)
+            for recipe_id in Recipe.objects.filter(author_id=author_id)
+            .order_by("-id").values_list("id", flat=True)
+            [:settings.FEED_BACKFILL]
+        )
+    FeedItem.objects.bulk_create(items, ignore_conflicts=True)
+
+
+def prune(user, author_ids):
+    """Удаление из ленты рецептов авторов, от которых user отписался."""
+    FeedItem.objects.filter(user=user, author_id__in=author_ids).delete()
+
+
+def timeline(user, author_ids, before, limit):
+    """
+    Id рецептов ленты по убыванию, меньшие before (если задан).
+
+    Материализованная лента дополняется рецептами авторов с очень
+    большим числом подписчиков, которые не раскладываются при записи.
+    """
+    items = FeedItem.objects.filter(user=user)
+    recipes = Recipe.objects.filter(author_id__in=big_author_ids(author_ids))
+    if before is not None:
+        items = items.filter(recipe_id__lt=before)
+        recipes = recipes.filter(id__lt=before)
+    ids = set(
+        items.order_by("-recipe_id").values_list("recipe_id", flat=True)
+        [:limit]
+    )
+    ids.update(recipes.order_by("-id").values_list("id", flat=True)[:limit])
+    return sorted(ids, reverse=True)[:limit]
+
+
+def get_executor():
+    global _executor
+    with _lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=settings.FEED_FANOUT_WORKERS,
+                thread_name_prefix="recipe-feed",
+            )
+    return _executor
+
+
+def schedule_fan_out(recipe_id, author_id, followers_count):
+    """Раскладка нового рецепта по лентам в фоновом пуле потоков."""
+    if not followers_count or is_big(followers_count):
+        return
+
+    def task():
+        close_old_connections()
+        try:
+            fan_out(recipe_id, author_id)
+        except Exception:
+            logger.exception(
+                "Не удалось добавить рецепт %s в ленты", recipe_id
+            )
+        finally:
+            connection.close()
+
+    get_executor().submit(task)
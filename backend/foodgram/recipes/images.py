@@ -0,0 +1,116 @@
+import hashlib
+import io
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import FileSystemStorage
+from django.utils.deconstruct import deconstructible
+from PIL import Image
+
+logger = logging.getLogger(__name__)
+
+# Размеры превью: вариант -> максимальные ширина и высота.
+VARIANTS = {
+    "list": (480, 480),
+    "detail": (1200, 1200),
+}
+
+_executor = None
+_pending = set()
+_lock = threading.Lock()
+
+
+@deconstructible
+class ContentHashStorage(FileSystemStorage):
+    """
+    Хранилище, в котором имя файла — SHA-256 его содержимого.
+
+    Одинаковые изображения сохраняются один раз и используются
+    несколькими рецептами.
+    """
+
+    def save(self, name, content, max_length=None):
+        digest = hashlib.sha256()
+        for chunk in content.chunks():
+            digest.update(chunk)
+        content.seek(0)
+        hexdigest = digest.hexdigest()
+        stem, extension = os.path.splitext(name)
+        if os.path.basename(stem) != hexdigest:
+            name = os.path.join(os.path.dirname(name), hexdigest[:2],
+                                hexdigest + extension.lower())
+        if self.exists(name):
+            return name
+        return super().save(name, content, max_length)
+
+    def save_variant(self, name, content):
+        """Сохранение превью под заданным именем, без хэширования."""
+        return super().save(name, content)
+
+
+def variant_name(name, variant, extension="webp"):
+    """Имя файла превью: <хэш>_<вариант>.<расширение>."""
+    return f"{os.path.splitext(name)[0]}_{variant}.{extension}"
+
+
+def make_variants(storage, name):
+    """Создание превью в исходном формате и в WebP для всех размеров."""
+    if not storage.exists(name) or all(
+        storage.exists(variant_name(name, variant)) for variant in VARIANTS
+    ):
+        return
+    with storage.open(name) as file, Image.open(file) as source:
+        original_format = source.format or "PNG"
+        image = source.copy()
+    for variant, size in VARIANTS.items():
+        thumbnail = image.copy()
+        thumbnail.thumbnail(size)
+        if original_format == "JPEG" and thumbnail.mode != "RGB":
+            thumbnail = thumbnail.convert("RGB")
+        extension = os.path.splitext(name)[1][1:] or "png"
+        for image_format, suffix in ((original_format, extension),
+                                     ("WEBP", "webp")):
+            path = variant_name(name, variant, suffix)
+            if storage.exists(path):
+                continue
+            output = io.BytesIO()
+            thumbnail.save(output, format=image_format)
+            storage.save_variant(path, ContentFile(output.getvalue()))
+
+
+def get_executor():
+    global _executor
+    with _lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=settings.IMAGE_VARIANT_WORKERS,
+                thread_name_prefix="recipe-images",
+            )
+    return _executor
+
+
+def schedule_variants(storage, name):
+    """
+    Создание превью в фоновом пуле потоков.
+
+    Одно и то же изображение не обрабатывается двумя задачами сразу.
+    """
+    with _lock:
+        if name in _pending:
+            return
+        _pending.add(name)
+
+    def task():
+        try:
+            make_variants(storage, name)
+        except Exception:
+            logger.exception("Не удалось создать превью для %s", name)
+        finally:
+            with _lock:
+                _pending.discard(name)
+
+    get_executor().submit(task)
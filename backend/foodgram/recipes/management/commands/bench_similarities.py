@@ -0,0 +1,63 @@
+import time
+
+import numpy as np
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from recipes.similarity import fingerprints, normalized_matrix, similar_rows
+
+
+class Command(BaseCommand):
+    help = ('Замер расчета похожих рецептов на синтетических данных '
+            '(без записи в БД)')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=200000)
+        parser.add_argument('--recipes', type=int, default=100000)
+        parser.add_argument('--interactions', type=int, default=1000000)
+        parser.add_argument('--changed', type=float, default=0.01)
+        parser.add_argument(
+            '--top-k', type=int, default=settings.SIMILAR_RECIPES_TOP_K
+        )
+        parser.add_argument('--seed', type=int, default=0)
+
+    def timed(self, title, function, *args):
+        started = time.perf_counter()
+        result = function(*args)
+        self.stdout.write(f'{title}: {time.perf_counter() - started:.2f} с')
+        return result
+
+    def handle(self, *args, **options):
+        rng = np.random.default_rng(options['seed'])
+        size = options['recipes'] + 1
+        popularity = 1 / np.arange(1, options['recipes'] + 1)
+        popularity /= popularity.sum()
+        pairs = np.unique(np.column_stack((
+            rng.integers(1, options['users'] + 1, options['interactions']),
+            rng.choice(np.arange(1, size), options['interactions'],
+                       p=popularity),
+        )), axis=0)
+        self.stdout.write(
+            f'Пользователей: {options["users"]}, рецептов: '
+            f'{options["recipes"]}, взаимодействий: {len(pairs)}'
+        )
+        self.timed('Отпечатки', fingerprints, pairs, size)
+        matrix = self.timed('Матрица', normalized_matrix, pairs, size)
+        top_k = options['top_k']
+
+        def compute(recipe_ids):
+            rows = 0
+            for _, neighbours, _ in similar_rows(matrix, recipe_ids):
+                rows += len(neighbours[:top_k])
+            return rows
+
+        recipe_ids = np.unique(pairs[:, 1])
+        rows = self.timed('Полный расчет', compute, recipe_ids)
+        self.stdout.write(f'Строк top-{top_k}: {rows}')
+        changed = rng.choice(
+            recipe_ids, max(1, int(len(recipe_ids) * options['changed'])),
+            replace=False,
+        )
+        self.timed(
+            f'Инкрементальный расчет ({len(changed)} рецептов)',
+            compute, np.sort(changed),
+        )
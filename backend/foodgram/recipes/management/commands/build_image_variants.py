@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand
+from recipes.images import make_variants
+from recipes.models import Recipe
+
+
+class Command(BaseCommand):
+    help = ('Перенос изображений рецептов в хранилище по хэшу '
+            'и создание превью')
+
+    def handle(self, *args, **options):
+        storage = Recipe._meta.get_field('image').storage
+        renamed = 0
+        names = set()
+        for pk, name in Recipe.objects.exclude(image='').values_list(
+            'id', 'image'
+        ).iterator():
+            if not storage.exists(name):
+                self.stdout.write(self.style.WARNING(f'Нет файла: {name}'))
+                continue
+            with storage.open(name) as file:
+                hashed = storage.save(name, file)
+            if hashed != name:
+                Recipe.objects.filter(pk=pk).update(image=hashed)
+                renamed += 1
+            names.add(hashed)
+        for name in names:
+            make_variants(storage, name)
+        self.stdout.write(self.style.SUCCESS(
+            f'Переименовано: {renamed}, изображений с превью: {len(names)}'
+        ))
@@ -0,0 +1,46 @@
+from collections import defaultdict
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from recipes.minhash import store
+from recipes.models import Recipe, RecipeIngredient
+
+
+class Command(BaseCommand):
+    help = ('Расчет MinHash-подписей и LSH-корзин для поиска рецептов '
+            'с похожим составом')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument(
+            '--all', action='store_true',
+            help='Пересчитать все рецепты, а не только без подписи',
+        )
+
+    def handle(self, *args, **options):
+        queryset = Recipe.objects.order_by('id').only('id')
+        if not options['all']:
+            queryset = queryset.filter(ingredients_minhash=b'')
+        total = 0
+        last_id = 0
+        while True:
+            recipes = list(
+                queryset.filter(id__gt=last_id)[:options['batch_size']]
+            )
+            if not recipes:
+                break
+            ingredients = defaultdict(list)
+            for recipe_id, ingredient_id in RecipeIngredient.objects.filter(
+                recipe__in=recipes
+            ).values_list('recipe_id', 'ingredient_id'):
+                ingredients[recipe_id].append(ingredient_id)
+            with transaction.atomic():
+                store({
+                    recipe: ingredients[recipe.id] for recipe in recipes
+                })
+            total += len(recipes)
+            last_id = recipes[-1].id
+            self.stdout.write(f'Обработано рецептов: {total}')
+        self.stdout.write(self.style.SUCCESS(
+            f'Подписи рассчитаны: {total}'
+        ))
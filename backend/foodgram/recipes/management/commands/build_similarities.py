@@ -0,0 +1,142 @@
+import time
+from collections import defaultdict
+
+import numpy as np
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from recipes.models import Recipe, RecipeSimilarity
+from recipes.similarity import (fingerprints, load_interactions,
+                                normalized_matrix, similar_rows)
+
+BATCH_SIZE = 500
+
+
+def batches(values, size=BATCH_SIZE):
+    values = list(values)
+    for start in range(0, len(values), size):
+        yield values[start:start + size]
+
+
+class Command(BaseCommand):
+    help = ('Расчет похожих рецептов по избранному и корзинам '
+            '(top-K по косинусной мере)')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--top-k', type=int, default=settings.SIMILAR_RECIPES_TOP_K
+        )
+        parser.add_argument(
+            '--full', action='store_true',
+            help='Пересчитать все рецепты, а не только измененные',
+        )
+        parser.add_argument('--chunk-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        top_k = options['top_k']
+        recipes = list(Recipe.objects.values_list(
+            'id', 'interactions_hash'
+        ).order_by('id'))
+        if not recipes:
+            self.stdout.write(self.style.WARNING('Рецептов нет'))
+            return
+        ids, hashes = zip(*recipes)
+        size = ids[-1] + 1
+        pairs = load_interactions()
+        pairs = pairs[pairs[:, 1] < size]
+        current = fingerprints(pairs, size)
+        stored = np.zeros(size, dtype=np.int64)
+        stored[list(ids)] = hashes
+        if options['full']:
+            dirty = np.array(ids, dtype=np.int64)
+        else:
+            dirty = np.flatnonzero(current != stored)
+        matrix = normalized_matrix(pairs, size)
+        dirty_set = set(dirty.tolist())
+        rows = {}
+        reverse = defaultdict(dict)
+        for recipe_id, neighbours, scores in similar_rows(
+            matrix, dirty, options['chunk_size']
+        ):
+            scores = scores.tolist()
+            rows[recipe_id] = dict(zip(neighbours[:top_k].tolist(),
+                                       scores[:top_k]))
+            for neighbour, score in zip(neighbours.tolist(), scores):
+                if neighbour not in dirty_set:
+                    reverse[neighbour][recipe_id] = score
+        affected = self.update_neighbours(
+            rows, reverse, dirty_set, top_k, options['full']
+        )
+        with transaction.atomic():
+            if options['full']:
+                RecipeSimilarity.objects.all().delete()
+            else:
+                for batch in batches(rows):
+                    RecipeSimilarity.objects.filter(
+                        recipe_id__in=batch
+                    ).delete()
+            RecipeSimilarity.objects.bulk_create(
+                (
+                    RecipeSimilarity(
+                        recipe_id=recipe_id, similar_id=similar, score=score
+                    )
+                    for recipe_id, row in rows.items()
+                    for similar, score in row.items()
+                ),
+                batch_size=5000,
+            )
+            Recipe.objects.bulk_update(
+                [
+                    Recipe(
+                        id=recipe_id,
+                        interactions_hash=int(current[recipe_id]),
+                    )
+                    for recipe_id in dirty_set
+                ],
+                ['interactions_hash'],
+                batch_size=1000,
+            )
+        self.stdout.write(self.style.SUCCESS(
+            f'Взаимодействий: {len(pairs)}, '
+            f'пересчитано рецептов: {len(dirty_set)}, '
+            f'обновлено соседей: {affected}, '
+            f'время: {time.perf_counter() - started:.2f} с'
+        ))
+
+    @staticmethod
+    def update_neighbours(rows, reverse, dirty, top_k, full):
+        """
+        Изменение строк соседей пересчитанных рецептов.
+
+        Сходство симметрично, поэтому новые значения для пары
+        (соседний, пересчитанный) уже известны: они обновляют, добавляют
+        или удаляют пару в строке соседа, после чего строка обрезается
+        до top-K. Строки соседей добавляются в rows для записи.
+        """
+        if full:
+            return 0
+        neighbours = set(reverse)
+        for batch in batches(dirty):
+            neighbours.update(
+                RecipeSimilarity.objects.filter(similar_id__in=batch)
+                .values_list('recipe_id', flat=True)
+            )
+        neighbours -= dirty
+        for batch in batches(neighbours):
+            for recipe_id, similar, score in (
+                RecipeSimilarity.objects.filter(recipe_id__in=batch)
+                .values_list('recipe_id', 'similar_id', 'score')
+            ):
+                rows.setdefault(recipe_id, {})[similar] = score
+        for recipe_id in neighbours:
+            row = {
+                similar: score
+                for similar, score in rows.get(recipe_id, {}).items()
+                if similar not in dirty
+            }
+            row.update(reverse.get(recipe_id, {}))
+            rows[recipe_id] = dict(sorted(
+                row.items(), key=lambda item: -item[1]
+            )[:top_k])
+        return len(neighbours)
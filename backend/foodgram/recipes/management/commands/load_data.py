@@ -1,18 +1,118 @@
+import csv
 import json
+import time
+from itertools import islice
+from pathlib import Path
 
-from django.core.management.base import BaseCommand
+from api.cache import bump_version
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
 from recipes.models import Ingredient
 
+DEFAULT_PATH = settings.BASE_DIR / 'recipes' / 'data' / 'ingredients.json'
+READ_SIZE = 64 * 1024
+
+
+def read_json(file):
+    """Потоковое чтение массива объектов JSON без загрузки файла целиком."""
+    decoder = json.JSONDecoder()
+    buffer = ''
+    position = 0
+    started = False
+    while True:
+        chunk = file.read(READ_SIZE)
+        buffer = buffer[position:] + chunk
+        position = 0
+        while True:
+            while position < len(buffer) and buffer[position] in ' \t\r\n,':
+                position += 1
+            if position == len(buffer):
+                break
+            if not started:
+                if buffer[position] != '[':
+                    raise CommandError('Ожидался массив JSON')
+                started = True
+                position += 1
+                continue
+            if buffer[position] == ']':
+                return
+            try:
+                item, position = decoder.raw_decode(buffer, position)
+            except json.JSONDecodeError:
+                if not chunk:
+                    raise CommandError('Некорректный JSON')
+                break
+            yield item['name'], item['measurement_unit']
+        if not chunk:
+            # Файл закончился раньше закрывающей скобки массива.
+            raise CommandError('Некорректный JSON')
+
+
+def read_csv(file):
+    """Потоковое чтение CSV со строками вида «название,единица»."""
+    for row in csv.reader(file):
+        if len(row) >= 2:
+            yield row[0], row[1]
+
+
+READERS = {
+    '.json': read_json,
+    '.csv': read_csv,
+}
+
 
 # После миграций сделать python manage.py load_data - локально
 # sudo docker-compose exec backend python manage.py load_data - на сервере
 class Command(BaseCommand):
     help = 'Напоняем таблицу Ingredients'
 
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'path', nargs='?', default=str(DEFAULT_PATH),
+            help='Файл ингредиентов в формате JSON или CSV'
+        )
+        parser.add_argument(
+            '--format', choices=[ext[1:] for ext in READERS],
+            help='Формат файла, по умолчанию определяется по расширению'
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help='Количество строк в одном INSERT'
+        )
+
     def handle(self, *args, **options):
-        with open('recipes/data/ingredients.json', 'r',
-                  encoding='UTF-8') as ingredients:
-            data = json.loads(ingredients.read())
-            for ingredients in data:
-                Ingredient.objects.get_or_create(**ingredients)
-        self.stdout.write(self.style.SUCCESS('Данные загружены'))
+        path = Path(options['path'])
+        extension = '.' + (options['format'] or path.suffix[1:]).lower()
+        if extension not in READERS:
+            raise CommandError(f'Неизвестный формат файла: {path}')
+        batch_size = options['batch_size']
+        started = time.perf_counter()
+        processed = 0
+        with open(path, 'r', encoding='UTF-8') as file, transaction.atomic():
+            existing = Ingredient.objects.count()
+            rows = (
+                Ingredient(name=name.strip(),
+                           measurement_unit=measurement_unit.strip())
+                for name, measurement_unit in READERS[extension](file)
+                if name.strip()
+            )
+            while True:
+                batch = list(islice(rows, batch_size))
+                if not batch:
+                    break
+                Ingredient.objects.bulk_create(batch, ignore_conflicts=True)
+                processed += len(batch)
+                elapsed = time.perf_counter() - started
+                self.stdout.write(
+                    f'Обработано {processed} строк '
+                    f'({processed / elapsed:.0f} строк/с)'
+                )
+            created = Ingredient.objects.count() - existing
+        if created:
+            bump_version(Ingredient)
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'Данные загружены: {processed} строк, добавлено {created}, '
+            f'пропущено дублей {processed - created}, за {elapsed:.2f} с'
+        ))
@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from recipes.shopping import reconcile
+
+
+class Command(BaseCommand):
+    help = 'Пересчет списков покупок по корзинам и составу рецептов'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--users', nargs='+', type=int, metavar='ID',
+            help='id пользователей, по умолчанию — все',
+        )
+
+    @transaction.atomic
+    def handle(self, *args, **options):
+        created, changed, deleted = reconcile(options['users'])
+        self.stdout.write(
+            f'Добавлено строк: {created}, исправлено: {changed}, '
+            f'удалено: {deleted}'
+        )
+        self.stdout.write(self.style.SUCCESS('Списки покупок пересчитаны'))
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from recipes.counters import recount
+
+
+class Command(BaseCommand):
+    help = 'Пересчет счетчиков избранного, корзин, рецептов и подписчиков'
+
+    @transaction.atomic
+    def handle(self, *args, **options):
+        for model, field, fixed in recount(None):
+            self.stdout.write(
+                f'{model._meta.label}.{field}: исправлено {fixed}'
+            )
+        self.stdout.write(self.style.SUCCESS('Счетчики пересчитаны'))
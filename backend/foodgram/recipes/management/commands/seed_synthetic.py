@@ -0,0 +1,295 @@
+import time
+from itertools import islice
+
+import numpy as np
+from api.cache import bump_version
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from recipes import shopping
+from recipes.counters import recount
+from recipes.feed import is_big
+from recipes.models import (Carts, Favourites, FeedItem, Ingredient, Recipe,
+                            RecipeIngredient, Tag)
+from recipes.synthetic import TAGS, WORDS
+from users.models import Subscribe, User
+
+FIRST_NAMES = ('Анна', 'Иван', 'Мария', 'Петр', 'Ольга', 'Сергей', 'Елена',
+               'Дмитрий', 'Наталья', 'Алексей')
+LAST_NAMES = ('Иванова', 'Смирнов', 'Кузнецова', 'Попов', 'Соколова',
+              'Лебедев', 'Козлова', 'Новиков', 'Морозова', 'Петров')
+
+
+def popularity(size, skew, rng):
+    """
+    Распределение Ципфа по элементам в случайном порядке (CDF).
+
+    Немногие элементы получают большую часть выборок: популярные
+    авторы, рецепты и ингредиенты.
+    """
+    weights = 1 / np.arange(1, size + 1) ** skew
+    rng.shuffle(weights)
+    cdf = np.cumsum(weights)
+    return cdf / cdf[-1]
+
+
+def sample(cdf, size, rng):
+    """Индексы элементов по распределению cdf."""
+    return np.minimum(
+        np.searchsorted(cdf, rng.random(size), side='right'), len(cdf) - 1
+    )
+
+
+def activity(mean, size, rng):
+    """Число действий пользователя: логнормальное, с длинным хвостом."""
+    if mean <= 0:
+        return np.zeros(size, dtype=np.int64)
+    return np.rint(
+        rng.lognormal(np.log(mean) - 0.5, 1.0, size)
+    ).astype(np.int64)
+
+
+def pairs(counts, cdf, rng):
+    """
+    Уникальные пары (номер строки counts, индекс цели).
+
+    Каждой строке достается counts[i] целей по распределению cdf,
+    повторы отбрасываются.
+    """
+    rows = np.repeat(np.arange(len(counts)), counts)
+    keys = np.unique(rows * len(cdf) + sample(cdf, len(rows), rng))
+    return keys // len(cdf), keys % len(cdf)
+
+
+class Command(BaseCommand):
+    help = ('Заполнение БД синтетическими пользователями, рецептами, '
+            'избранным, корзинами и подписками для нагрузочных замеров')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--recipes', type=int, default=10000)
+        parser.add_argument(
+            '--ingredients', type=float, default=8,
+            help='Среднее число ингредиентов в рецепте',
+        )
+        parser.add_argument(
+            '--favorites', type=float, default=20,
+            help='Среднее число рецептов в избранном пользователя',
+        )
+        parser.add_argument(
+            '--carts', type=float, default=3,
+            help='Среднее число рецептов в корзине пользователя',
+        )
+        parser.add_argument(
+            '--subscriptions', type=float, default=10,
+            help='Среднее число подписок пользователя',
+        )
+        parser.add_argument(
+            '--skew', type=float, default=1.1,
+            help='Показатель распределения Ципфа популярности',
+        )
+        parser.add_argument(
+            '--no-feed', action='store_true',
+            help='Не заполнять ленты подписок',
+        )
+        parser.add_argument('--password', default='synthetic-password')
+        parser.add_argument('--batch-size', type=int, default=10000)
+        parser.add_argument('--seed', type=int, default=0)
+
+    def insert(self, model, rows, batch_size, **kwargs):
+        """
+        Вставка строк пачками, каждая в своей транзакции.
+
+        rows — генератор, в памяти только одна пачка объектов.
+        """
+        started = time.perf_counter()
+        total = 0
+        while True:
+            batch = list(islice(rows, batch_size))
+            if not batch:
+                break
+            with transaction.atomic():
+                model.objects.bulk_create(batch, **kwargs)
+            total += len(batch)
+        elapsed = time.perf_counter() - started
+        self.stdout.write(
+            f'{model._meta.label}: {total} строк '
+            f'({total / max(elapsed, 1e-9):.0f} строк/с)'
+        )
+
+    def last_id(self, model):
+        return model.objects.order_by('-id').values_list(
+            'id', flat=True
+        ).first() or 0
+
+    def create_users(self, count, password, rng):
+        """Пользователи synthetic<номер> с общим хэшем пароля."""
+        start = self.last_id(User)
+        password = make_password(password)
+        names = rng.integers(0, len(FIRST_NAMES), (count, 2))
+        self.insert(User, (
+            User(
+                username=f'synthetic{start + number}',
+                email=f'synthetic{start + number}@example.com',
+                first_name=FIRST_NAMES[first],
+                last_name=LAST_NAMES[last],
+                password=password,
+            )
+            for number, (first, last) in enumerate(names, 1)
+        ), self.batch_size)
+        return np.array(
+            User.objects.filter(id__gt=start).order_by('id')
+            .values_list('id', flat=True)
+        )
+
+    def create_tags(self):
+        """Теги TAGS, если справочник тегов пуст."""
+        if not Tag.objects.exists():
+            self.insert(Tag, (
+                Tag(name=name, color=color, slug=slug)
+                for name, color, slug in TAGS
+            ), self.batch_size)
+            bump_version(Tag)
+
+    def create_recipes(self, count, author_ids, authors, rng):
+        """Рецепты, их состав и теги; авторы по распределению authors."""
+        ingredient_ids = np.array(
+            Ingredient.objects.values_list('id', flat=True)
+        )
+        tag_ids = np.array(Tag.objects.values_list('id', flat=True))
+        ingredients = popularity(len(ingredient_ids), self.skew, rng)
+        words = np.array(WORDS)
+        start = self.last_id(Recipe)
+        self.insert(Recipe, (
+            Recipe(
+                author_id=author,
+                name=' '.join(rng.choice(words, 3)).capitalize(),
+                text=' '.join(rng.choice(words, 20)),
+                image='recipes/img/synthetic.png',
+                cooking_time=min(999, 1 + int(rng.lognormal(3.4, 0.6))),
+            )
+            for author in author_ids[sample(authors, count, rng)].tolist()
+        ), self.batch_size)
+        recipe_ids = np.array(
+            Recipe.objects.filter(id__gt=start).order_by('id')
+            .values_list('id', flat=True)
+        )
+        sizes = np.clip(
+            rng.poisson(max(self.ingredients - 1, 0), len(recipe_ids)) + 1,
+            1, len(ingredient_ids),
+        )
+        rows, columns = pairs(sizes, ingredients, rng)
+        self.insert(RecipeIngredient, (
+            RecipeIngredient(
+                recipe_id=recipe_id, ingredient_id=ingredient_id,
+                amount=amount,
+            )
+            for recipe_id, ingredient_id, amount in zip(
+                recipe_ids[rows].tolist(),
+                ingredient_ids[columns].tolist(),
+                rng.integers(1, 1000, len(rows)).tolist(),
+            )
+        ), self.batch_size)
+        if len(tag_ids):
+            rows, columns = pairs(
+                rng.integers(1, min(3, len(tag_ids)) + 1, len(recipe_ids)),
+                popularity(len(tag_ids), self.skew, rng), rng,
+            )
+            through = Recipe.tags.through
+            self.insert(through, (
+                through(recipe_id=recipe_id, tag_id=tag_id)
+                for recipe_id, tag_id in zip(
+                    recipe_ids[rows].tolist(), tag_ids[columns].tolist()
+                )
+            ), self.batch_size)
+        return recipe_ids
+
+    def create_relations(self, model, field, mean, user_ids, target_ids,
+                         targets, rng):
+        """Связи пользователей с целями (рецептами или авторами)."""
+        rows, columns = pairs(
+            activity(mean, len(user_ids), rng), targets, rng
+        )
+        users, related = user_ids[rows], target_ids[columns]
+        if model is Subscribe:
+            others = users != related
+            users, related = users[others], related[others]
+        self.insert(model, (
+            model(user_id=user_id, **{f'{field}_id': related_id})
+            for user_id, related_id in zip(users.tolist(), related.tolist())
+        ), self.batch_size, ignore_conflicts=True)
+        return users, related
+
+    def create_feed(self, users, authors, recipe_ids, user_ids):
+        """
+        Ленты подписок, как после backfill: последние FEED_BACKFILL
+        рецептов каждого автора, кроме авторов с очень большим числом
+        подписчиков.
+        """
+        latest = {}
+        for author, recipe_id in Recipe.objects.filter(
+            id__gte=recipe_ids[0]
+        ).order_by('author_id', '-id').values_list('author_id', 'id'):
+            ids = latest.setdefault(author, [])
+            if len(ids) < settings.FEED_BACKFILL:
+                ids.append(recipe_id)
+        followers = dict(User.objects.filter(
+            id__gte=user_ids[0]
+        ).values_list('id', 'followers_count'))
+        self.insert(FeedItem, (
+            FeedItem(user_id=user_id, recipe_id=recipe_id, author_id=author)
+            for user_id, author in zip(users.tolist(), authors.tolist())
+            if not is_big(followers.get(author, 0))
+            for recipe_id in latest.get(author, ())
+        ), self.batch_size, ignore_conflicts=True)
+
+    def handle(self, *args, **options):
+        if not Ingredient.objects.exists():
+            raise CommandError(
+                'Справочник ингредиентов пуст: запустите load_data'
+            )
+        if options['users'] < 1 or options['recipes'] < 1:
+            raise CommandError('Нужен хотя бы один пользователь и рецепт')
+        rng = np.random.default_rng(options['seed'])
+        self.batch_size = options['batch_size']
+        self.skew = options['skew']
+        self.ingredients = options['ingredients']
+        started = time.perf_counter()
+        user_ids = self.create_users(
+            options['users'], options['password'], rng
+        )
+        # Плодовитые авторы популярнее и в подписках.
+        authors = popularity(len(user_ids), self.skew, rng)
+        self.create_tags()
+        recipe_ids = self.create_recipes(
+            options['recipes'], user_ids, authors, rng
+        )
+        recipes = popularity(len(recipe_ids), self.skew, rng)
+        self.create_relations(
+            Favourites, 'recipe', options['favorites'], user_ids,
+            recipe_ids, recipes, rng,
+        )
+        self.create_relations(
+            Carts, 'recipe', options['carts'], user_ids, recipe_ids,
+            recipes, rng,
+        )
+        subscribers, subscribed = self.create_relations(
+            Subscribe, 'author', options['subscriptions'], user_ids,
+            user_ids, authors, rng,
+        )
+        with transaction.atomic():
+            for model, field, fixed in recount(None):
+                self.stdout.write(
+                    f'{model._meta.label}.{field}: исправлено {fixed}'
+                )
+            created, _, _ = shopping.reconcile()
+            self.stdout.write(f'Строк списков покупок: {created}')
+        if not options['no_feed']:
+            self.create_feed(subscribers, subscribed, recipe_ids, user_ids)
+        bump_version(Recipe)
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'Синтетические данные созданы за {elapsed:.1f} с. '
+            'Подписи и похожие рецепты: build_minhash, build_similarities'
+        ))
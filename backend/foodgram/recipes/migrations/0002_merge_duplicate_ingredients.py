@@ -0,0 +1,53 @@
+from django.db import migrations
+from django.db.models import Count, Min, Sum
+
+
+def merge_duplicate_ingredients(apps, schema_editor):
+    """
+    Склейка дублей ингредиентов перед добавлением ограничения.
+
+    Если в рецепте было несколько дублей одного ингредиента, их строки
+    состава объединяются в одну с суммой количества.
+    """
+    Ingredient = apps.get_model('recipes', 'Ingredient')
+    RecipeIngredient = apps.get_model('recipes', 'RecipeIngredient')
+    duplicates = (
+        Ingredient.objects.values('name', 'measurement_unit')
+        .annotate(first_id=Min('id'), total=Count('id'))
+        .filter(total__gt=1)
+    )
+    for item in duplicates:
+        ids = list(Ingredient.objects.filter(
+            name=item['name'], measurement_unit=item['measurement_unit']
+        ).values_list('id', flat=True))
+        rows = RecipeIngredient.objects.filter(ingredient__in=ids)
+        repeated = (
+            rows.values('recipe')
+            .annotate(keep_id=Min('id'), amount=Sum('amount'),
+                      total=Count('id'))
+            .filter(total__gt=1)
+        )
+        for row in repeated:
+            rows.filter(recipe=row['recipe']).exclude(
+                id=row['keep_id']
+            ).delete()
+            RecipeIngredient.objects.filter(id=row['keep_id']).update(
+                amount=row['amount']
+            )
+        rows.update(ingredient_id=item['first_id'])
+        Ingredient.objects.filter(id__in=ids).exclude(
+            id=item['first_id']
+        ).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            merge_duplicate_ingredients, migrations.RunPython.noop
+        ),
+    ]
@@ -0,0 +1,280 @@
+from django.db import migrations
+
+# PostgreSQL: хранимый tsvector с весами (название A, описание B,
+# ингредиенты C), GIN-индекс и триггеры, поддерживающие его актуальным.
+POSTGRESQL_FORWARD = [
+    'ALTER TABLE recipes_recipe ADD COLUMN search_vector tsvector',
+    'CREATE INDEX recipes_recipe_search_vector_idx '
+    'ON recipes_recipe USING GIN (search_vector)',
+    """
+    CREATE FUNCTION recipes_search_normalize(value text) RETURNS text AS $$
+        SELECT replace(lower(coalesce(value, '')), 'ё', 'е')
+    $$ LANGUAGE sql IMMUTABLE
+    """,
+    """
+    CREATE FUNCTION recipes_recipe_search_vector(
+        recipe bigint, title text, body text
+    ) RETURNS tsvector AS $$
+        SELECT
+            setweight(to_tsvector(
+                'russian', recipes_search_normalize(title)), 'A')
+            || setweight(to_tsvector(
+                'russian', recipes_search_normalize(body)), 'B')
+            || setweight(to_tsvector('russian', recipes_search_normalize((
+                SELECT string_agg(i.name, ' ')
+                FROM recipes_recipeingredient ri
+                JOIN recipes_ingredient i ON i.id = ri.ingredient_id
+                WHERE ri.recipe_id = recipe
+            ))), 'C')
+    $$ LANGUAGE sql STABLE
+    """,
+    """
+    CREATE FUNCTION recipes_recipe_search_trigger() RETURNS trigger AS $$
+    BEGIN
+        NEW.search_vector := recipes_recipe_search_vector(
+            NEW.id, NEW.name, NEW.text
+        );
+        RETURN NEW;
+    END
+    $$ LANGUAGE plpgsql
+    """,
+    """
+    CREATE TRIGGER recipes_recipe_search
+    BEFORE INSERT OR UPDATE OF name, text ON recipes_recipe
+    FOR EACH ROW EXECUTE FUNCTION recipes_recipe_search_trigger()
+    """,
+    """
+    CREATE FUNCTION recipes_recipeingredient_search_trigger()
+    RETURNS trigger AS $$
+    BEGIN
+        IF TG_OP = 'INSERT' THEN
+            UPDATE recipes_recipe r
+            SET search_vector = recipes_recipe_search_vector(
+                r.id, r.name, r.text)
+            WHERE r.id IN (SELECT recipe_id FROM new_rows);
+        ELSIF TG_OP = 'DELETE' THEN
+            UPDATE recipes_recipe r
+            SET search_vector = recipes_recipe_search_vector(
+                r.id, r.name, r.text)
+            WHERE r.id IN (SELECT recipe_id FROM old_rows);
+        ELSE
+            UPDATE recipes_recipe r
+            SET search_vector = recipes_recipe_search_vector(
+                r.id, r.name, r.text)
+            WHERE r.id IN (
+                SELECT recipe_id FROM new_rows
+                UNION SELECT recipe_id FROM old_rows
+            );
+        END IF;
+        RETURN NULL;
+    END
+    $$ LANGUAGE plpgsql
+    """,
+    """
+    CREATE TRIGGER recipes_recipeingredient_search_insert
+    AFTER INSERT ON recipes_recipeingredient
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT
+    EXECUTE FUNCTION recipes_recipeingredient_search_trigger()
+    """,
+    """
+    CREATE TRIGGER recipes_recipeingredient_search_update
+    AFTER UPDATE ON recipes_recipeingredient
+    REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+    FOR EACH STATEMENT
+    EXECUTE FUNCTION recipes_recipeingredient_search_trigger()
+    """,
+    """
+    CREATE TRIGGER recipes_recipeingredient_search_delete
+    AFTER DELETE ON recipes_recipeingredient
+    REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT
+    EXECUTE FUNCTION recipes_recipeingredient_search_trigger()
+    """,
+    """
+    CREATE FUNCTION recipes_ingredient_search_trigger() RETURNS trigger AS $$
+    BEGIN
+        UPDATE recipes_recipe r
+        SET search_vector = recipes_recipe_search_vector(
+            r.id, r.name, r.text)
+        WHERE r.id IN (
+            SELECT recipe_id FROM recipes_recipeingredient
+            WHERE ingredient_id = NEW.id
+        );
+        RETURN NULL;
+    END
+    $$ LANGUAGE plpgsql
+    """,
+    """
+    CREATE TRIGGER recipes_ingredient_search
+    AFTER UPDATE OF name ON recipes_ingredient
+    FOR EACH ROW WHEN (OLD.name IS DISTINCT FROM NEW.name)
+    EXECUTE FUNCTION recipes_ingredient_search_trigger()
+    """,
+    """
+    UPDATE recipes_recipe
+    SET search_vector = recipes_recipe_search_vector(id, name, text)
+    """,
+]
+
+POSTGRESQL_BACKWARD = [
+    'DROP TRIGGER recipes_ingredient_search ON recipes_ingredient',
+    'DROP FUNCTION recipes_ingredient_search_trigger()',
+    'DROP TRIGGER recipes_recipeingredient_search_insert '
+    'ON recipes_recipeingredient',
+    'DROP TRIGGER recipes_recipeingredient_search_update '
+    'ON recipes_recipeingredient',
+    'DROP TRIGGER recipes_recipeingredient_search_delete '
+    'ON recipes_recipeingredient',
+    'DROP FUNCTION recipes_recipeingredient_search_trigger()',
+    'DROP TRIGGER recipes_recipe_search ON recipes_recipe',
+    'DROP FUNCTION recipes_recipe_search_trigger()',
+    'DROP FUNCTION recipes_recipe_search_vector(bigint, text, text)',
+    'DROP FUNCTION recipes_search_normalize(text)',
+    'ALTER TABLE recipes_recipe DROP COLUMN search_vector',
+]
+
+# SQLite (локальный запуск и тесты): таблица FTS5 с rowid = id рецепта.
+# Токенизатор unicode61 сам приводит регистр, а ё -> е заменяется явно.
+SQLITE_NORMALIZE = "replace(replace(coalesce({}, ''), 'ё', 'е'), 'Ё', 'Е')"
+
+SQLITE_INGREDIENTS = SQLITE_NORMALIZE.format("""(
+    SELECT group_concat(i.name, ' ')
+    FROM recipes_recipeingredient ri
+    JOIN recipes_ingredient i ON i.id = ri.ingredient_id
+    WHERE ri.recipe_id = {}
+)""")
+
+SQLITE_REFRESH_INGREDIENTS = """
+    UPDATE recipes_recipe_fts
+    SET ingredients = {}
+    WHERE rowid = {{row}}.recipe_id;
+""".format(SQLITE_INGREDIENTS.format('{row}.recipe_id'))
+
+# Триггеры таблицы рецептов. На SQLite изменение схемы recipes_recipe
+# пересоздает таблицу и удаляет их: такие миграции должны создавать
+# триггеры заново (см. 0011_recipe_fts_triggers).
+SQLITE_RECIPE_TRIGGERS = [
+    f"""
+    CREATE TRIGGER recipes_recipe_fts_insert
+    AFTER INSERT ON recipes_recipe BEGIN
+        INSERT INTO recipes_recipe_fts (rowid, name, text, ingredients)
+        VALUES (
+            NEW.id,
+            {SQLITE_NORMALIZE.format('NEW.name')},
+            {SQLITE_NORMALIZE.format('NEW.text')},
+            {SQLITE_INGREDIENTS.format('NEW.id')}
+        );
+    END
+    """,
+    f"""
+    CREATE TRIGGER recipes_recipe_fts_update
+    AFTER UPDATE OF name, text ON recipes_recipe BEGIN
+        UPDATE recipes_recipe_fts
+        SET name = {SQLITE_NORMALIZE.format('NEW.name')},
+            text = {SQLITE_NORMALIZE.format('NEW.text')}
+        WHERE rowid = NEW.id;
+    END
+    """,
+    """
+    CREATE TRIGGER recipes_recipe_fts_delete
+    AFTER DELETE ON recipes_recipe BEGIN
+        DELETE FROM recipes_recipe_fts WHERE rowid = OLD.id;
+    END
+    """,
+]
+
+SQLITE_FILL = f"""
+INSERT INTO recipes_recipe_fts (rowid, name, text, ingredients)
+SELECT
+    r.id,
+    {SQLITE_NORMALIZE.format('r.name')},
+    {SQLITE_NORMALIZE.format('r.text')},
+    {SQLITE_INGREDIENTS.format('r.id')}
+FROM recipes_recipe r
+"""
+
+SQLITE_FORWARD = [
+    """
+    CREATE VIRTUAL TABLE recipes_recipe_fts USING fts5(
+        name, text, ingredients, tokenize='unicode61 remove_diacritics 2'
+    )
+    """,
+    *SQLITE_RECIPE_TRIGGERS,
+    f"""
+    CREATE TRIGGER recipes_recipeingredient_fts_insert
+    AFTER INSERT ON recipes_recipeingredient BEGIN
+        {SQLITE_REFRESH_INGREDIENTS.format(row='NEW')}
+    END
+    """,
+    f"""
+    CREATE TRIGGER recipes_recipeingredient_fts_update
+    AFTER UPDATE ON recipes_recipeingredient BEGIN
+        {SQLITE_REFRESH_INGREDIENTS.format(row='OLD')}
+        {SQLITE_REFRESH_INGREDIENTS.format(row='NEW')}
+    END
+    """,
+    f"""
+    CREATE TRIGGER recipes_recipeingredient_fts_delete
+    AFTER DELETE ON recipes_recipeingredient BEGIN
+        {SQLITE_REFRESH_INGREDIENTS.format(row='OLD')}
+    END
+    """,
+    f"""
+    CREATE TRIGGER recipes_ingredient_fts_update
+    AFTER UPDATE OF name ON recipes_ingredient BEGIN
+        UPDATE recipes_recipe_fts
+        SET ingredients = {SQLITE_INGREDIENTS.format(
+            'recipes_recipe_fts.rowid')}
+        WHERE rowid IN (
+            SELECT recipe_id FROM recipes_recipeingredient
+            WHERE ingredient_id = NEW.id
+        );
+    END
+    """,
+    SQLITE_FILL,
+]
+
+SQLITE_BACKWARD = [
+    'DROP TRIGGER recipes_ingredient_fts_update',
+    'DROP TRIGGER recipes_recipeingredient_fts_delete',
+    'DROP TRIGGER recipes_recipeingredient_fts_update',
+    'DROP TRIGGER recipes_recipeingredient_fts_insert',
+    'DROP TRIGGER IF EXISTS recipes_recipe_fts_delete',
+    'DROP TRIGGER IF EXISTS recipes_recipe_fts_update',
+    'DROP TRIGGER IF EXISTS recipes_recipe_fts_insert',
+    'DROP TABLE recipes_recipe_fts',
+]
+
+STATEMENTS = {
+    'postgresql': (POSTGRESQL_FORWARD, POSTGRESQL_BACKWARD),
+    'sqlite': (SQLITE_FORWARD, SQLITE_BACKWARD),
+}
+
+
+def run_statements(schema_editor, forward):
+    """Выполнение SQL для текущей СУБД; для прочих СУБД поиска нет."""
+    statements = STATEMENTS.get(schema_editor.connection.vendor)
+    if statements is None:
+        return
+    for statement in statements[0 if forward else 1]:
+        schema_editor.execute(statement)
+
+
+def create_search(apps, schema_editor):
+    run_statements(schema_editor, forward=True)
+
+
+def drop_search(apps, schema_editor):
+    run_statements(schema_editor, forward=False)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0005_recipe_image_storage'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search, drop_search),
+    ]
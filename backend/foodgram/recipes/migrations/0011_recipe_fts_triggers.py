@@ -0,0 +1,39 @@
+from importlib import import_module
+
+from django.db import migrations
+
+search = import_module('recipes.migrations.0006_recipe_search')
+
+TRIGGERS = (
+    'recipes_recipe_fts_insert',
+    'recipes_recipe_fts_update',
+    'recipes_recipe_fts_delete',
+)
+
+
+def recreate_triggers(apps, schema_editor):
+    """
+    Триггеры FTS таблицы рецептов заново и перезаполнение индекса.
+
+    На SQLite AddField в 0007 и 0008 пересоздает recipes_recipe без
+    триггеров из 0006, и новые рецепты не попадали в поиск.
+    """
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    for name in TRIGGERS:
+        schema_editor.execute(f'DROP TRIGGER IF EXISTS {name}')
+    for statement in search.SQLITE_RECIPE_TRIGGERS:
+        schema_editor.execute(statement)
+    schema_editor.execute('DELETE FROM recipes_recipe_fts')
+    schema_editor.execute(search.SQLITE_FILL)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0010_shopping_list'),
+    ]
+
+    operations = [
+        migrations.RunPython(recreate_triggers, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,56 @@
+from django.conf import settings
+from django.db import migrations
+
+BATCH_SIZE = 1000
+
+
+def backfill_feed(apps, schema_editor):
+    """
+    Ленты для подписок, оформленных до появления FeedItem.
+
+    Как recipes.feed.backfill: последние FEED_BACKFILL рецептов каждого
+    автора, кроме авторов с очень большим числом подписчиков. Уже
+    разложенные записи пропускаются.
+    """
+    FeedItem = apps.get_model('recipes', 'FeedItem')
+    Recipe = apps.get_model('recipes', 'Recipe')
+    Subscribe = apps.get_model('users', 'Subscribe')
+    User = apps.get_model('users', 'User')
+    author_ids = list(User.objects.filter(
+        id__in=Subscribe.objects.values('author'),
+        followers_count__lte=settings.FEED_FANOUT_MAX_FOLLOWERS,
+    ).values_list('id', flat=True))
+    for author_id in author_ids:
+        recipe_ids = list(
+            Recipe.objects.filter(author_id=author_id)
+            .order_by('-id').values_list('id', flat=True)
+            [:settings.FEED_BACKFILL]
+        )
+        if not recipe_ids:
+            continue
+        batch = []
+        followers = Subscribe.objects.filter(
+            author_id=author_id
+        ).values_list('user_id', flat=True)
+        for user_id in followers:
+            batch.extend(
+                FeedItem(user_id=user_id, recipe_id=recipe_id,
+                         author_id=author_id)
+                for recipe_id in recipe_ids
+            )
+            if len(batch) >= BATCH_SIZE:
+                FeedItem.objects.bulk_create(batch, ignore_conflicts=True)
+                batch = []
+        FeedItem.objects.bulk_create(batch, ignore_conflicts=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0011_recipe_fts_triggers'),
+        ('users', '0003_user_counters'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_feed, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,106 @@
+import hashlib
+
+import numpy as np
+from django.conf import settings
+from django.db.models import Q
+
+from .models import Recipe, RecipeBucket
+
+# Хэш-функции вида (a * x + b) mod p, p = 2^31 - 1: произведение
+# a * x помещается в uint64 без переполнения.
+PRIME = np.uint64((1 << 31) - 1)
+NUM_PERM = settings.MINHASH_NUM_PERM
+BANDS = settings.MINHASH_BANDS
+ROWS = NUM_PERM // BANDS
+
+_random = np.random.RandomState(20240101)
+A = _random.randint(1, int(PRIME), NUM_PERM).astype(np.uint64)
+B = _random.randint(0, int(PRIME), NUM_PERM).astype(np.uint64)
+
+
+def signature(ingredient_ids):
+    """
+    MinHash-подпись непустого множества ингредиентов: NUM_PERM uint32.
+
+    Доля совпадающих позиций двух подписей — оценка коэффициента
+    Жаккара множеств ингредиентов.
+    """
+    ids = np.fromiter(ingredient_ids, dtype=np.uint64)
+    hashes = (np.outer(ids, A) + B) % PRIME
+    return hashes.min(axis=0).astype(np.uint32)
+
+
+def to_bytes(values):
+    return values.astype("<u4").tobytes()
+
+
+def from_bytes(data):
+    return np.frombuffer(bytes(data), dtype="<u4")
+
+
+def band_keys(values):
+    """Ключи LSH: хэш каждой полосы из ROWS значений подписи."""
+    data = to_bytes(values)
+    step = ROWS * 4
+    return [
+        int.from_bytes(
+            hashlib.blake2b(data[band * step:(band + 1) * step],
+                            digest_size=8).digest(),
+            "little", signed=True,
+        )
+        for band in range(BANDS)
+    ]
+
+
+def similarity(first, second):
+    """Оценка коэффициента Жаккара по двум подписям."""
+    return float(np.mean(from_bytes(first) == from_bytes(second)))
+
+
+def store(recipes):
+    """
+    Сохранение подписей и LSH-корзин рецептов.
+
+    recipes — словарь рецепт -> id его ингредиентов. У рецепта без
+    ингредиентов подпись пустая и корзин нет.
+    """
+    buckets = []
+    for recipe, ingredient_ids in recipes.items():
+        recipe.ingredients_minhash = b""
+        if not ingredient_ids:
+            continue
+        values = signature(ingredient_ids)
+        recipe.ingredients_minhash = to_bytes(values)
+        buckets.extend(
+            RecipeBucket(recipe=recipe, band=band, key=key)
+            for band, key in enumerate(band_keys(values))
+        )
+    Recipe.objects.bulk_update(recipes, ["ingredients_minhash"])
+    RecipeBucket.objects.filter(recipe__in=recipes).delete()
+    RecipeBucket.objects.bulk_create(buckets)
+
+
+def similar_recipes(recipe, threshold=0.0):
+    """
+    Рецепты с похожим составом: (оценка Жаккара, id) по убыванию.
+
+    Кандидаты — рецепты, совпавшие с данным хотя бы в одной LSH-корзине;
+    попарно сравниваются только их подписи.
+    """
+    if not recipe.ingredients_minhash:
+        return []
+    keys = band_keys(from_bytes(recipe.ingredients_minhash))
+    condition = Q()
+    for band, key in enumerate(keys):
+        condition |= Q(buckets__band=band, buckets__key=key)
+    candidates = (
+        Recipe.objects.filter(condition).exclude(id=recipe.id)
+        .values_list("id", "ingredients_minhash").distinct()
+    )
+    found = []
+    for pk, data in candidates:
+        score = similarity(recipe.ingredients_minhash, data)
+        if score >= threshold:
+            found.append((score, pk))
+    found.sort(key=lambda item: (-item[0], item[1]))
+    return found
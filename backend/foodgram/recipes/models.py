@@ -4,6 +4,8 @@ from django.core.validators import (MaxValueValidator, MinValueValidator,
 from django.db import models
 from django.db.models import UniqueConstraint
 
+from .images import ContentHashStorage
+
 User = get_user_model()
 
 
@@ -17,6 +19,10 @@ class Ingredient(models.Model):
         verbose_name = "ингредиент"
         verbose_name_plural = "ингредиенты"
         ordering = ["name"]
+        constraints = [
+            UniqueConstraint(fields=["name", "measurement_unit"],
+                             name="unique_ingredient")
+        ]
 
     def __str__(self):
         return f"{self.name}, {self.measurement_unit}"
@@ -54,7 +60,8 @@ class Recipe(models.Model):
         verbose_name="автор",
     )
     text = models.TextField("Описание")
-    image = models.ImageField("Изображение", upload_to="recipes/img/")
+    image = models.ImageField("Изображение", upload_to="recipes/img/",
+                              storage=ContentHashStorage())
     cooking_time = models.PositiveIntegerField(
         "Время приготовления",
         validators=(
@@ -68,6 +75,18 @@ class Recipe(models.Model):
     tags = models.ManyToManyField(Tag,
                                   related_name="recipes",
                                   verbose_name="Теги")
+    favorites_count = models.PositiveIntegerField(
+        "Количество в избранном", default=0, editable=False
+    )
+    in_carts_count = models.PositiveIntegerField(
+        "Количество в корзинах", default=0, editable=False
+    )
+    interactions_hash = models.BigIntegerField(
+        "Отпечаток избранного и корзин", default=0, editable=False
+    )
+    ingredients_minhash = models.BinaryField(
+        "MinHash-подпись состава", default=b"", editable=False
+    )
 
     class Meta:
         ordering = [
@@ -162,3 +181,148 @@ class Carts(models.Model):
 
     def __str__(self):
         return f"{self.user} добавил в козину {self.recipe} "
+
+
+class RecipeSimilarity(models.Model):
+    """
+    Похожий рецепт по избранному и корзинам пользователей.
+
+    Для каждого рецепта хранятся top-K соседей с косинусной мерой,
+    таблицу заполняет команда build_similarities.
+    """
+
+    recipe = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name="similarities",
+        verbose_name="Рецепт",
+    )
+    similar = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name="similar_to",
+        verbose_name="Похожий рецепт",
+    )
+    score = models.FloatField("Сходство")
+
+    class Meta:
+        verbose_name = "похожий рецепт"
+        verbose_name_plural = "похожие рецепты"
+        constraints = [
+            UniqueConstraint(fields=["recipe", "similar"],
+                             name="unique_recipe_similarity")
+        ]
+
+    def __str__(self):
+        return f"{self.recipe} похож на {self.similar}"
+
+
+class RecipeBucket(models.Model):
+    """
+    LSH-корзина MinHash-подписи рецепта.
+
+    Подпись делится на полосы, у рецептов с похожим составом хотя бы
+    одна полоса с большой вероятностью совпадает.
+    """
+
+    recipe = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name="buckets",
+        verbose_name="Рецепт",
+    )
+    band = models.PositiveSmallIntegerField("Полоса")
+    key = models.BigIntegerField("Хэш полосы")
+
+    class Meta:
+        verbose_name = "LSH-корзина"
+        verbose_name_plural = "LSH-корзины"
+        indexes = [
+            models.Index(fields=["band", "key"], name="recipe_bucket_key")
+        ]
+        constraints = [
+            UniqueConstraint(fields=["recipe", "band"],
+                             name="unique_recipe_bucket")
+        ]
+
+    def __str__(self):
+        return f"{self.recipe}: {self.band}"
+
+
+class FeedItem(models.Model):
+    """
+    Запись ленты подписок: рецепт автора, на которого подписан user.
+
+    Заполняется при публикации рецепта (fan-out on write), при подписке
+    и отписке. Для авторов с очень большим числом подписчиков записи не
+    создаются — их рецепты подмешиваются в ленту при чтении.
+    """
+
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name="feed",
+        verbose_name="Пользователь",
+    )
+    recipe = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name="feed_items",
+        verbose_name="Рецепт",
+    )
+    author = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name="+",
+        verbose_name="Автор",
+    )
+
+    class Meta:
+        verbose_name = "запись ленты"
+        verbose_name_plural = "записи ленты"
+        indexes = [
+            models.Index(fields=["user", "-recipe"], name="feed_user_recipe"),
+            models.Index(fields=["user", "author"], name="feed_user_author"),
+        ]
+        constraints = [
+            UniqueConstraint(fields=["user", "recipe"],
+                             name="unique_feed_item")
+        ]
+
+    def __str__(self):
+        return f"{self.recipe} в ленте {self.user}"
+
+
+class ShoppingListItem(models.Model):
+    """
+    Строка списка покупок: сумма ингредиента по рецептам в корзине.
+
+    Поддерживается при изменении корзины и состава рецептов
+    (recipes.shopping), расхождения исправляет reconcile_shopping_lists.
+    Единица измерения — у ингредиента.
+    """
+
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name="shopping_list",
+        verbose_name="Пользователь",
+    )
+    ingredient = models.ForeignKey(
+        Ingredient,
+        on_delete=models.CASCADE,
+        related_name="+",
+        verbose_name="Ингредиент",
+    )
+    amount = models.IntegerField("Количество")
+
+    class Meta:
+        verbose_name = "строка списка покупок"
+        verbose_name_plural = "строки списков покупок"
+        constraints = [
+            UniqueConstraint(fields=["user", "ingredient"],
+                             name="unique_shopping_list_item")
+        ]
+
+    def __str__(self):
+        return f"{self.ingredient} в списке покупок {self.user}"
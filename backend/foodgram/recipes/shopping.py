@@ -0,0 +1,132 @@
+from django.db.models import Case, F, IntegerField, Sum, Value, When
+
+from .models import Carts, RecipeIngredient, ShoppingListItem
+
+# Сколько пользователей обновляется одним запросом.
+BATCH_SIZE = 500
+
+
+def recipe_amounts(recipe_ids):
+    """Количество каждого ингредиента, суммарно по рецептам."""
+    return dict(
+        RecipeIngredient.objects.filter(recipe_id__in=recipe_ids)
+        .values("ingredient_id").annotate(total=Sum("amount"))
+        .order_by().values_list("ingredient_id", "total")
+    )
+
+
+def apply(user_ids, deltas):
+    """
+    Изменение списков покупок пользователей на deltas.
+
+    deltas — {ingredient_id: изменение количества}. Недостающие строки
+    вставляются с нулем (ignore_conflicts), затем суммы меняются одним
+    UPDATE с F(): одновременные изменения не теряются. Если количество
+    уменьшалось, строки, сумма которых дошла до нуля, удаляются.
+    """
+    deltas = {pk: delta for pk, delta in deltas.items() if delta}
+    user_ids = list(user_ids)
+    if not deltas or not user_ids:
+        return
+    added = [pk for pk, delta in deltas.items() if delta > 0]
+    change = Case(
+        *(When(ingredient_id=pk, then=Value(delta))
+          for pk, delta in deltas.items()),
+        default=Value(0),
+        output_field=IntegerField(),
+    )
+    for start in range(0, len(user_ids), BATCH_SIZE):
+        batch = user_ids[start:start + BATCH_SIZE]
+        ShoppingListItem.objects.bulk_create(
+            [
+                ShoppingListItem(user_id=user_id, ingredient_id=pk, amount=0)
+                for user_id in batch for pk in added
+            ],
+            ignore_conflicts=True,
+        )
+        items = ShoppingListItem.objects.filter(
+            user_id__in=batch, ingredient_id__in=deltas
+        )
+        items.update(amount=F("amount") + change)
+        if len(added) < len(deltas):
+            items.filter(amount__lte=0).delete()
+
+
+def add_recipes(user, recipe_ids):
+    """Рецепты добавлены в корзину user."""
+    apply([user.id], recipe_amounts(recipe_ids))
+
+
+def remove_recipes(user, recipe_ids):
+    """Рецепты удалены из корзины user."""
+    apply([user.id], {
+        pk: -total for pk, total in recipe_amounts(recipe_ids).items()
+    })
+
+
+def change_recipe(recipe, deltas):
+    """Изменен состав рецепта: списки всех, у кого он в корзине."""
+    if recipe.in_carts_count:
+        apply(
+            Carts.objects.filter(recipe=recipe)
+            .values_list("user_id", flat=True),
+            deltas,
+        )
+
+
+def get_items(user):
+    """Строки списка покупок: название, единица и количество."""
+    return (
+        ShoppingListItem.objects.filter(user=user)
+        .order_by("ingredient__name", "ingredient__measurement_unit")
+        .values_list(
+            "ingredient__name", "ingredient__measurement_unit", "amount"
+        )
+    )
+
+
+def reconcile(user_ids=None):
+    """
+    Пересчет списков покупок по корзинам и составу рецептов.
+
+    Исправляются только разошедшиеся строки; user_ids ограничивает
+    пересчет заданными пользователями. Возвращает (добавлено,
+    исправлено, удалено).
+    """
+    carts = Carts.objects.all()
+    items = ShoppingListItem.objects.all()
+    if user_ids is not None:
+        carts = carts.filter(user_id__in=user_ids)
+        items = items.filter(user_id__in=user_ids)
+    actual = {
+        (user_id, pk): total
+        for user_id, pk, total in carts
+        .values("user_id", "recipe__RecipeIngredient__ingredient_id")
+        .annotate(total=Sum("recipe__RecipeIngredient__amount"))
+        .filter(total__gt=0).order_by()
+        .values_list(
+            "user_id", "recipe__RecipeIngredient__ingredient_id", "total"
+        ).iterator()
+    }
+    changed, deleted = [], []
+    items = items.only("id", "user_id", "ingredient_id", "amount")
+    for item in items.iterator():
+        total = actual.pop((item.user_id, item.ingredient_id), None)
+        if total is None:
+            deleted.append(item.id)
+        elif total != item.amount:
+            item.amount = total
+            changed.append(item)
+    ShoppingListItem.objects.bulk_create(
+        [
+            ShoppingListItem(user_id=user_id, ingredient_id=pk, amount=total)
+            for (user_id, pk), total in actual.items()
+        ],
+        batch_size=1000,
+    )
+    ShoppingListItem.objects.bulk_update(changed, ["amount"], batch_size=1000)
+    for start in range(0, len(deleted), 1000):
+        ShoppingListItem.objects.filter(
+            id__in=deleted[start:start + 1000]
+        ).delete()
+    return len(actual), len(changed), len(deleted)
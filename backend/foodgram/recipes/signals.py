@@ -0,0 +1,95 @@
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models import F
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.dispatch import receiver
+
+from .feed import schedule_fan_out
+from .images import schedule_variants
+from .models import Carts, Favourites, Recipe
+from .shopping import apply, recipe_amounts
+
+User = get_user_model()
+
+
+def change_counter(model, pk, field, delta):
+    """
+    Атомарное изменение счетчика в БД без чтения строки.
+
+    Счетчик не уходит ниже нуля, даже если разошелся с данными
+    (исправляется командой recount).
+    """
+    queryset = model.objects.filter(pk=pk)
+    if delta < 0:
+        queryset = queryset.filter(**{f"{field}__gte": -delta})
+    queryset.update(**{field: F(field) + delta})
+
+
+@receiver(post_save, sender=Favourites)
+def favourite_created(instance, created, **kwargs):
+    if created:
+        change_counter(Recipe, instance.recipe_id, "favorites_count", 1)
+
+
+@receiver(post_delete, sender=Favourites)
+def favourite_deleted(instance, **kwargs):
+    change_counter(Recipe, instance.recipe_id, "favorites_count", -1)
+
+
+@receiver(post_save, sender=Carts)
+def cart_created(instance, created, **kwargs):
+    if created:
+        change_counter(Recipe, instance.recipe_id, "in_carts_count", 1)
+
+
+@receiver(post_delete, sender=Carts)
+def cart_deleted(instance, **kwargs):
+    change_counter(Recipe, instance.recipe_id, "in_carts_count", -1)
+
+
+@receiver(post_save, sender=Recipe)
+def recipe_created(instance, created, **kwargs):
+    if created:
+        change_counter(User, instance.author_id, "recipes_count", 1)
+
+
+@receiver(post_save, sender=Recipe)
+def recipe_published(instance, created, **kwargs):
+    """Раскладка нового рецепта по лентам подписчиков после фиксации."""
+    if created:
+        recipe_id, author_id = instance.id, instance.author_id
+        transaction.on_commit(lambda: schedule_fan_out(
+            recipe_id, author_id,
+            User.objects.filter(id=author_id)
+            .values_list("followers_count", flat=True).first(),
+        ))
+
+
+@receiver(post_save, sender=Recipe)
+def recipe_image_saved(instance, **kwargs):
+    """Создание превью изображения после фиксации транзакции."""
+    if instance.image:
+        storage, name = instance.image.storage, instance.image.name
+        transaction.on_commit(lambda: schedule_variants(storage, name))
+
+
+@receiver(post_delete, sender=Recipe)
+def recipe_deleted(instance, **kwargs):
+    change_counter(User, instance.author_id, "recipes_count", -1)
+
+
+@receiver(pre_delete, sender=Recipe)
+def recipe_deleting(instance, **kwargs):
+    """
+    Вычитание рецепта из списков покупок, пока корзины и состав
+    рецепта еще не удалены каскадом. Корзины читаются из БД: счетчик
+    in_carts_count удаляемого экземпляра может быть устаревшим.
+    """
+    user_ids = list(
+        Carts.objects.filter(recipe=instance)
+        .values_list("user_id", flat=True)
+    )
+    if user_ids:
+        apply(user_ids, {
+            pk: -total for pk, total in recipe_amounts([instance.id]).items()
+        })
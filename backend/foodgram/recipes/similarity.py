@@ -0,0 +1,83 @@
+from itertools import chain
+
+import numpy as np
+from scipy import sparse
+
+from .models import Carts, Favourites
+
+# Константы перемешивания splitmix64 для отпечатков множеств.
+MIX_1 = np.uint64(0xBF58476D1CE4E5B9)
+MIX_2 = np.uint64(0x94D049BB133111EB)
+
+
+def load_interactions():
+    """
+    Пары (пользователь, рецепт) из избранного и корзин без повторов.
+
+    Возвращает массив numpy формы (N, 2).
+    """
+    rows = chain.from_iterable(
+        model.objects.values_list("user_id", "recipe_id").order_by()
+        .iterator(chunk_size=10000)
+        for model in (Favourites, Carts)
+    )
+    pairs = np.fromiter(
+        chain.from_iterable(rows), dtype=np.int64
+    ).reshape(-1, 2)
+    return np.unique(pairs, axis=0)
+
+
+def fingerprints(pairs, size):
+    """
+    Отпечаток множества пользователей каждого рецепта.
+
+    Сумма хэшей id пользователей не зависит от порядка, поэтому
+    считается векторно; меняется при любом добавлении или удалении.
+    """
+    mixed = pairs[:, 0].astype(np.uint64) + np.uint64(1)
+    mixed = (mixed ^ (mixed >> np.uint64(30))) * MIX_1
+    mixed = (mixed ^ (mixed >> np.uint64(27))) * MIX_2
+    mixed ^= mixed >> np.uint64(31)
+    result = np.zeros(size, dtype=np.uint64)
+    np.add.at(result, pairs[:, 1], mixed)
+    return result.view(np.int64)
+
+
+def normalized_matrix(pairs, size):
+    """
+    Матрица пользователь × рецепт с нормированными столбцами (CSC).
+
+    Произведение двух столбцов такой матрицы — косинусное сходство
+    рецептов.
+    """
+    users, rows = np.unique(pairs[:, 0], return_inverse=True)
+    matrix = sparse.csc_matrix(
+        (np.ones(len(pairs), dtype=np.float32), (rows, pairs[:, 1])),
+        shape=(len(users), size),
+    )
+    counts = np.asarray(matrix.sum(axis=0)).ravel()
+    weights = np.zeros(size, dtype=np.float32)
+    weights[counts > 0] = 1 / np.sqrt(counts[counts > 0])
+    return (matrix @ sparse.diags(weights)).tocsc()
+
+
+def similar_rows(matrix, recipe_ids, chunk_size=1000):
+    """
+    Сходство заданных рецептов со всеми остальными.
+
+    Считается блоками по chunk_size строк (X[:, блок]^T · X), чтобы
+    не держать в памяти всю матрицу рецепт × рецепт. Для каждого
+    рецепта возвращает (id, id соседей, сходство) по убыванию сходства.
+    """
+    rows = matrix.T.tocsr()
+    for start in range(0, len(recipe_ids), chunk_size):
+        chunk = recipe_ids[start:start + chunk_size]
+        block = (rows[chunk] @ matrix).tocsr()
+        for position, recipe_id in enumerate(chunk):
+            begin, end = block.indptr[position], block.indptr[position + 1]
+            neighbours = block.indices[begin:end]
+            scores = block.data[begin:end]
+            keep = neighbours != recipe_id
+            neighbours, scores = neighbours[keep], scores[keep]
+            order = np.argsort(-scores, kind="stable")
+            yield int(recipe_id), neighbours[order], scores[order]
@@ -0,0 +1,21 @@
+# Общий словарь синтетических данных: seed_synthetic и
+# bench_recipe_search составляют из этих слов названия и описания.
+WORDS = (
+    "суп", "борщ", "салат", "пирог", "каша", "рагу", "котлеты", "блины",
+    "запеканка", "паста", "омлет", "жаркое", "плов", "соус", "торт",
+    "домашний", "быстрый", "летний", "острый", "сырный", "грибной",
+    "овощной", "куриный", "рыбный", "постный", "праздничный", "бабушкин",
+    "томатный", "сливочный", "ёжики", "запечь", "обжарить", "варить",
+    "нарезать", "посолить", "перемешать", "подавать", "духовка",
+    "сковорода", "кастрюля", "минут", "горячим", "холодным", "зеленью",
+)
+
+# Теги для пустого справочника: название, цвет, слаг.
+TAGS = (
+    ("Завтрак", "#E26C2D", "breakfast"),
+    ("Обед", "#49B64E", "lunch"),
+    ("Ужин", "#8775D2", "dinner"),
+    ("Выпечка", "#C08A3E", "bakery"),
+    ("Десерт", "#D94E8F", "dessert"),
+    ("Постное", "#3E8EC0", "lenten"),
+)
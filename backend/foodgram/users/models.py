@@ -1,6 +1,34 @@
 from django.contrib.auth.models import AbstractUser
-from django.db import models
+from django.contrib.auth.models import UserManager as BaseUserManager
+from django.db import models, transaction
 from django.db.models import UniqueConstraint
+from django.dispatch import Signal
+
+# Поля, от которых зависит вход по токену.
+CREDENTIAL_FIELDS = frozenset({"is_active", "password"})
+
+# Поля входа изменены QuerySet.update(), аргумент user_ids: сигналы
+# моделей при нем не отправляются.
+credentials_updated = Signal()
+
+
+class UserQuerySet(models.QuerySet):
+    def update(self, **kwargs):
+        """
+        update() с сигналом credentials_updated, если меняются поля
+        входа (например, деактивация пользователей одним запросом).
+        """
+        if CREDENTIAL_FIELDS.isdisjoint(kwargs):
+            return super().update(**kwargs)
+        with transaction.atomic(using=self.db):
+            user_ids = list(self.values_list("pk", flat=True))
+            rows = super().update(**kwargs)
+            credentials_updated.send(sender=self.model, user_ids=user_ids)
+        return rows
+
+
+class UserManager(BaseUserManager.from_queryset(UserQuerySet)):
+    pass
 
 
 class User(AbstractUser):
@@ -14,6 +42,14 @@ class User(AbstractUser):
     first_name = models.CharField("имя", max_length=144)
     last_name = models.CharField("фамилия", max_length=144)
     email = models.EmailField("почта", unique=True, max_length=144)
+    recipes_count = models.PositiveIntegerField(
+        "количество рецептов", default=0, editable=False
+    )
+    followers_count = models.PositiveIntegerField(
+        "количество подписчиков", default=0, editable=False
+    )
+
+    objects = UserManager()
 
     class Meta:
         ordering = ["id"]